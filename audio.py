@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Audio output for the keyboard game: decoded clip cache and sink failover,
+on top of a pluggable backend (audio_backends.py: pygame, alsa, null, wav).
+
+Clips are decoded once and kept in the backend's own form. When the Bluetooth
+speaker drops (signal from bt_daemon, or the device refusing to play) the
+backend is reopened on the next device of AUDIO_DEVICES with the very same
+sample format, the decoded PCM of every cached clip is handed over to it (each
+clip is rebuilt when it is next played) and the interrupted clips start again
+from the beginning. Nothing is read from the SD card again, even when no
+device is left for a while.
+
+Each role has a channel of its own and a queue: speech (the game's clips,
+played one after the other), earcons (fired at key press, on top of the
+speech) and background (an ambience loop, ducked while speech plays). A
+channel is done when its own clip is, whatever the others are playing.
+"""
+
+from array import array
+from collections import deque
+import math
+import os
+import threading
+import time
+
+from audio_backends import BackendError, DecodeError, make_backend
+import event_log
+import metrics
+import stall_detector
+import tracing
+
+# Device names tried in order (SDL names for pygame, ALSA PCM names for alsa),
+# "" = system default output (the Bluetooth sink when the speaker is there). Example:
+#   CLAVIER_AUDIO_DEVICES=",bcm2835 Headphones,vc4-hdmi"
+AUDIO_DEVICES = [name or None for name in os.environ.get("CLAVIER_AUDIO_DEVICES", "").split(",")]
+
+POLL_INTERVAL = 0.05    # how often a playing clip checks for sink loss
+PROBE_PITCH = 880       # Hz, boot beep of the self-test
+PROBE_VOLUME = 0.2      # of full scale
+DUCK_VOLUME = 0.3       # background volume while speech plays
+
+EARCON, BACKGROUND, SPEECH = "earcon", "background", "speech"
+ROLE_CHANNELS = {EARCON: 0, BACKGROUND: 1, SPEECH: 2}   # reserved backend channels, in start order
+
+_cache_hits = metrics.counter("clavier_sound_cache_hits_total", "Clips found already decoded")
+_cache_misses = metrics.counter("clavier_sound_cache_misses_total", "Clips decoded from the SD card")
+_store_hits = metrics.counter("clavier_sound_store_hits_total", "Clips found decoded in the shared clip store")
+_decode_seconds = metrics.histogram("clavier_decode_seconds", "Time to decode a clip")
+
+
+class AudioOutput:
+
+    def __init__(self, devices=AUDIO_DEVICES, backend=None, store=None):
+        self.devices = devices
+        self.device_index = 0
+        self.backend = backend              # AudioBackend, from CLAVIER_AUDIO_BACKEND if None
+        self.store = store                  # ClipStore shared between processes, or None
+        self.available = False
+        self._format = None                     # (frequency, size, channels) of the first open
+        self._clips = {}                        # filepath -> decoded clip of the backend
+        self._raw = {}                          # filepath -> raw PCM kept over a reopen, until played
+        self._queues = {role: deque() for role in ROLE_CHANNELS}
+        self._playing = {}                      # role -> (key, playback handle)
+        self._sink_lost = threading.Event()     # set from any thread
+        self._sink_back = threading.Event()
+        self.on_start = None                    # called with "backend:device" when a clip starts
+        self.on_wait = None                     # called every POLL_INTERVAL while play() waits
+
+    @property
+    def device_name(self):
+        return self.devices[self.device_index] or "default"
+
+    @property
+    def output_name(self):
+        return f"{self.backend.name}:{self.device_name}" if self.backend else self.device_name
+
+    @property
+    def sample_format(self):
+        """(frequency, size, channels) of the output, None before init()."""
+        return self._format
+
+    @property
+    def on_fallback(self):
+        return self.available and self.device_index != 0
+
+    def init(self):
+        try:
+            if self.backend is None:
+                self.backend = make_backend()
+            self._format = self.backend.open(self.devices[0])
+            self.available = True
+            event_log.info("audio_ready", output=self.output_name, format=self._format)
+        except BackendError as e:
+            event_log.error("audio_unavailable", reason=e)
+        return self.available
+
+    def quit(self):
+        if self.available:
+            for queue in self._queues.values():
+                queue.clear()
+            self._playing.clear()
+            self.backend.close()
+            self.available = False
+            event_log.info("audio_quit")
+
+    # --- Thread-safe notifications (bt_status reader thread...) ---
+
+    def sink_lost(self):
+        """The current output went away: the game thread fails over at once."""
+        self._sink_lost.set()
+
+    def sink_back(self):
+        """The main output is back: switch to it between two clips."""
+        self._sink_back.set()
+
+    # --- Game thread ---
+
+    def load(self, filepath):
+        """Decoded clip for `filepath`, decoding it only the first time."""
+        clip = self._clips.get(filepath)
+        if clip is None and filepath in self._raw:
+            _cache_hits.inc()
+            clip = self._clips[filepath] = self.backend.from_raw(self._raw.pop(filepath))
+        elif clip is None:
+            store = self.store if self.backend.decoder is not None else None
+            data = store.get(filepath, self._format, self.backend.decoder) if store is not None else None
+            if data:
+                _store_hits.inc()
+                clip = self._clips[filepath] = self.backend.from_raw(data)
+                return clip
+            _cache_misses.inc()
+            start = time.perf_counter()
+            clip = self._clips[filepath] = self.backend.decode(filepath)
+            _decode_seconds.observe(time.perf_counter() - start)
+            if store is not None:
+                store.put(filepath, self._format, self.backend.decoder, self.backend.to_raw(clip))
+        else:
+            _cache_hits.inc()
+        return clip
+
+    def duration(self, key):
+        """Length of a clip in seconds (decoding it now if needed), None if it cannot be decoded."""
+        try:
+            return self.backend.duration(self.load(key))
+        except DecodeError:
+            return None
+
+    def add_clip(self, key, pcm):
+        """Caches a clip made in memory (raw PCM in sample_format) under `key`, for fire()."""
+        self._clips[key] = self.backend.from_raw(pcm)
+
+    def queue(self, key, role=SPEECH):
+        """Queues a clip (file path or add_clip() key) on a role's channel and returns at once."""
+        if self.available:
+            self._queues[role].append(key)
+            self.pump()
+
+    def fire(self, key):
+        """Starts an in-memory earcon now, over whatever else is playing."""
+        if (key in self._clips or key in self._raw) and self.available:
+            self._queues[EARCON].clear()    # an earcon is only worth hearing now
+            self.queue(key, EARCON)
+
+    def stop(self, role):
+        """Stops the role's clip and drops its queue."""
+        self._queues[role].clear()
+        playing = self._playing.pop(role, None)
+        if playing is not None:
+            playing[1].stop()
+
+    def background(self, filepath):
+        """Loops `filepath` on the background channel, ducked under speech. None stops it."""
+        self.stop(BACKGROUND)
+        if filepath and self.available and not self.backend.single_stream:
+            self.queue(filepath, BACKGROUND)
+
+    def busy(self, role=SPEECH):
+        self.pump()
+        return role in self._playing or bool(self._queues[role])
+
+    def pending(self, role):
+        """Clips of `role` not finished yet (playing or queued), as of the last pump()."""
+        return len(self._queues[role]) + (role in self._playing)
+
+    def service(self):
+        """wait() without the waiting, for an event loop: fails over if the sink died,
+        switches back to the main output between two clips, starts queued clips."""
+        if self._sink_lost.is_set() or (self._sink_back.is_set() and not self.busy(SPEECH)):
+            self._apply_switch()
+        self.pump()
+
+    def play(self, filepath, role=SPEECH):
+        """Queues a clip and waits until the role's channel is done. On sink loss, fails over
+        and replays what was interrupted from the start."""
+        if not self.busy(role):
+            self._apply_switch()        # the main output came back: switch between two clips
+        self.queue(filepath, role)
+        self.wait(role)
+
+    def wait(self, role=SPEECH):
+        """Waits for every clip queued on `role`, waking up early if the sink dies."""
+        for _ in range(len(self.devices) + 1):
+            with tracing.span("wait"):
+                while self.busy(role):
+                    stall_detector.beat()   # a long clip is progress, not a stall
+                    if self.on_wait is not None:
+                        self.on_wait()
+                    if self._sink_lost.wait(POLL_INTERVAL):
+                        break
+                else:
+                    return
+            self._apply_switch()
+            if not self.available:
+                break
+        self._queues[role].clear()
+
+    def pump(self):
+        """Starts the next queued clip of every idle channel and ducks the background
+        while speech plays. Cheap: a get_busy() per channel."""
+        for role, queue in self._queues.items():
+            playing = self._playing.get(role)
+            if playing is not None:
+                if playing[1].get_busy():
+                    continue
+                del self._playing[role]
+            while queue and not self._sink_lost.is_set():
+                if self._start(role, queue[0]):
+                    queue.popleft()
+                    break
+        background = self._playing.get(BACKGROUND)
+        if background is not None:
+            background[1].set_volume(DUCK_VOLUME if SPEECH in self._playing else 1.0)
+
+    def _start(self, role, key):
+        """Starts `key` on the role's channel. False if the sink refused it (key stays queued)."""
+        try:
+            with tracing.span("decode", key):
+                clip = self.load(key)
+        except DecodeError as e:
+            event_log.warning("clip_decode_failed", clip=key, error=e)
+            return True     # corrupt clip, not the sink's fault: drop it
+        try:
+            with tracing.span("start", self.output_name):
+                handle = self.backend.start(clip, key, channel=ROLE_CHANNELS[role],
+                                            loops=-1 if role == BACKGROUND else 0)
+        except BackendError as e:
+            event_log.warning("clip_play_failed", clip=key, error=e)
+            handle = None
+        if handle is None:
+            self._sink_lost.set()   # the device refuses to play: treat as a dead sink
+            return False
+        self._playing[role] = (key, handle)
+        if role != BACKGROUND and self.on_start is not None:
+            self.on_start(self.output_name)
+        return True
+
+    def probe(self, duration):
+        """Plays a short synthesised tone. True if the device took it and played it to the end."""
+        if not self.available:
+            return False
+        try:
+            channel = self.backend.start(self.backend.from_raw(self._tone(duration)), "probe")
+        except BackendError as e:
+            event_log.warning("mixer_probe_failed", error=e)
+            return False
+        if channel is None:
+            return False
+        deadline = time.monotonic() + duration * 4 + 0.1
+        while channel.get_busy():
+            if time.monotonic() > deadline:
+                channel.stop()
+                return False  # the device does not consume samples
+            time.sleep(0.005)
+        return True
+
+    def _tone(self, duration):
+        """Raw PCM of a quiet sine at PROBE_PITCH in the output's own sample format."""
+        frequency, size, channels = self._format
+        n = int(frequency * duration)
+        if size == 32:
+            typecode, amplitude, offset = "f", PROBE_VOLUME, 0.0
+        else:
+            bits = abs(size)
+            typecode = {8: "b", 16: "h"}[bits]
+            amplitude, offset = PROBE_VOLUME * (2 ** (bits - 1) - 1), 0
+            if size > 0:  # unsigned
+                typecode, offset = typecode.upper(), 2 ** (bits - 1)
+        step = 2 * math.pi * PROBE_PITCH / frequency
+        samples = array(typecode)
+        for i in range(n):
+            value = offset + amplitude * math.sin(step * i)
+            samples.extend([value if typecode == "f" else int(value)] * channels)
+        return samples.tobytes()
+
+    def _apply_switch(self):
+        if self._sink_lost.is_set():
+            self._sink_lost.clear()
+            self._sink_back.clear()
+            self._reopen((self.device_index + 1) % len(self.devices))
+        elif self._sink_back.is_set():
+            self._sink_back.clear()
+            if self.device_index != 0 or not self.available:
+                self._reopen(0)
+
+    def _reopen(self, first):
+        """Reopens the backend on device `first` (or the next one that works), keeping the decoded clips."""
+        if self._format is None:
+            return  # the output never started
+        start = time.monotonic()
+        clips = self._clips
+        if self.available:
+            for role, (key, handle) in self._playing.items():
+                handle.stop()
+                if role != EARCON:
+                    self._queues[role].appendleft(key)  # replayed on the new device
+            self._playing.clear()
+            # One clip at a time: each decoded clip is released as soon as its raw copy
+            # exists, so the switch never holds two copies of the whole cache
+            while clips:
+                path, clip = clips.popitem()
+                self._raw[path] = self.backend.to_raw(clip)
+            self.backend.close()
+            self.available = False
+
+        for step in range(len(self.devices)):
+            index = (first + step) % len(self.devices)
+            try:
+                # same sample format, so the raw PCM stays valid
+                self.backend.open(self.devices[index], self._format)
+            except BackendError as e:
+                event_log.warning("audio_device_unavailable", device=self.devices[index] or "default", error=e)
+                continue
+            self.device_index = index
+            self.available = True
+            break
+        else:
+            event_log.error("audio_unavailable", reason="no audio device left")
+            for queue in self._queues.values():
+                queue.clear()
+            return  # the raw PCM waits in self._raw for the next reopen
+
+        # load() rebuilds each clip from self._raw when it is next played
+        tracing.instant("failover", self.output_name)
+        event_log.info("audio_switched", output=self.output_name, ms=(time.monotonic() - start) * 1000)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Audio output backends behind AudioOutput (audio.py).
+
+A backend opens an output device, decodes clips into its own clip objects
+and starts them, returning a playback handle with get_busy() and stop()
+(plus set_volume(), like a pygame Channel). Clips can be exported to raw
+PCM and imported back, which is how AudioOutput moves the decoded cache
+from one device to the next without reading the SD card again.
+
+    pygame  pygame.mixer, SDL picks the device (default)
+    alsa    writes PCM frames straight to an ALSA device (pyalsaaudio)
+    null    plays nothing, clips take no time; keeps a timeline of what was played
+    wav     renders what the child would hear, at the wall-clock time it would
+            hear it, into a WAV file plus a JSON timeline (clip, start, end)
+
+The backend is chosen with CLAVIER_AUDIO_BACKEND. null and wav need no
+sound card: they are meant for timing tests on a CI box.
+"""
+
+from array import array
+import json
+import math
+import os
+import threading
+import time
+import wave
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+DEFAULT_FORMAT = (44100, -16, 2)        # frequency, size (pygame convention), channels
+WAV_PATH = os.environ.get("CLAVIER_AUDIO_WAV", "logs/audio.wav")
+TIMELINE_PATH = os.environ.get("CLAVIER_AUDIO_TIMELINE", "logs/audio-timeline.json")
+ALSA_PERIOD = 1024                      # frames written per ALSA call
+RESERVED_CHANNELS = 3                   # pygame channels 0..2 only play when start() names them
+
+
+class BackendError(Exception):
+    """The device cannot be opened, or refuses to play."""
+
+
+class DecodeError(Exception):
+    """The clip itself is unreadable (not the device's fault)."""
+
+
+def _frame_bytes(fmt):
+    frequency, size, channels = fmt
+    return abs(size) // 8 * channels
+
+
+def _loop(pcm, length):
+    """`pcm` repeated over `length` bytes."""
+    if not pcm:
+        return b""
+    return (pcm * (length // len(pcm) + 1))[:length]
+
+
+class AudioBackend:
+    name = "?"
+    single_stream = False       # True: starting a clip stops the one playing
+    decoder = None              # who made the PCM of decode(), None = not real PCM (never shared)
+
+    def open(self, device, fmt=None):
+        """Opens `device` (None = default), returns the (frequency, size, channels) in use."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def decode(self, filepath):
+        raise NotImplementedError
+
+    def to_raw(self, clip):
+        raise NotImplementedError
+
+    def from_raw(self, data):
+        raise NotImplementedError
+
+    def duration(self, clip):
+        """Length of a decoded clip, in seconds."""
+        raise NotImplementedError
+
+    def start(self, clip, name="", channel=None, loops=0):
+        """Starts a clip, returns a handle with get_busy(), stop() and set_volume(), None if the
+        device refuses. `channel` is one of the reserved channels (None = any free one),
+        loops=-1 repeats the clip until it is stopped."""
+        raise NotImplementedError
+
+
+# --- pygame ---
+
+class PygameBackend(AudioBackend):
+    name = "pygame"
+    decoder = "pygame"
+
+    def open(self, device, fmt=None):
+        if pygame is None:
+            raise BackendError("pygame not installed")
+        try:
+            if fmt is None:
+                pygame.mixer.init(devicename=device)
+            else:
+                # allowedchanges=0: same sample format, so the raw PCM stays valid
+                frequency, size, channels = fmt
+                pygame.mixer.init(frequency=frequency, size=size, channels=channels,
+                                  devicename=device, allowedchanges=0)
+        except pygame.error as e:
+            raise BackendError(e) from e
+        pygame.mixer.set_reserved(RESERVED_CHANNELS)   # Sound.play() never picks them
+        return pygame.mixer.get_init()
+
+    def close(self):
+        pygame.mixer.quit()
+
+    def decode(self, filepath):
+        try:
+            return pygame.mixer.Sound(filepath)
+        except (pygame.error, OSError) as e:
+            raise DecodeError(e) from e
+
+    def to_raw(self, clip):
+        return clip.get_raw()
+
+    def from_raw(self, data):
+        return pygame.mixer.Sound(buffer=data)
+
+    def duration(self, clip):
+        return clip.get_length()
+
+    def start(self, clip, name="", channel=None, loops=0):
+        try:
+            if channel is None:
+                return clip.play(loops=loops)
+            channel = pygame.mixer.Channel(channel)
+            channel.play(clip, loops=loops)
+            return channel
+        except pygame.error as e:
+            raise BackendError(e) from e
+
+
+# --- Decoding without an output (alsa, null, wav) ---
+
+_decoder_format = None
+
+def decode_pcm(filepath, fmt):
+    """Raw PCM of `filepath` in `fmt`. WAV files in that format are read directly,
+    anything else goes through pygame's decoder on SDL's dummy driver."""
+    global _decoder_format
+    if filepath.endswith(".wav"):
+        try:
+            with wave.open(filepath) as w:
+                if (w.getframerate(), w.getsampwidth() * 8 * (-1 if w.getsampwidth() > 1 else 1),
+                        w.getnchannels()) == tuple(fmt):
+                    return w.readframes(w.getnframes())
+        except (OSError, wave.Error, EOFError) as e:
+            raise DecodeError(e) from e
+    if pygame is None:
+        raise DecodeError(f"no decoder for {filepath} (pygame not installed)")
+    if _decoder_format != fmt:
+        if pygame.mixer.get_init():
+            pygame.mixer.quit()
+        os.environ["SDL_AUDIODRIVER"] = "dummy"     # decode only, never opens the sound card
+        frequency, size, channels = fmt
+        pygame.mixer.init(frequency=frequency, size=size, channels=channels, allowedchanges=0)
+        _decoder_format = fmt
+    try:
+        return pygame.mixer.Sound(filepath).get_raw()
+    except (pygame.error, OSError) as e:
+        raise DecodeError(e) from e
+
+
+class _TimedPlayback:
+    """Playback handle of a clip that lasts `duration` seconds of wall-clock time."""
+
+    def __init__(self, duration, on_stop=None):
+        self.end = time.monotonic() + duration
+        self.on_stop = on_stop
+        self.volume = 1.0
+
+    def set_volume(self, volume):
+        self.volume = volume    # not rendered
+
+    def get_busy(self):
+        return time.monotonic() < self.end
+
+    def stop(self):
+        if self.get_busy():
+            self.end = time.monotonic()
+            if self.on_stop is not None:
+                self.on_stop(self)
+
+
+class _PcmBackend(AudioBackend):
+    """Clips are raw PCM bytes in self.format."""
+    decoder = "decode_pcm"
+
+    def __init__(self):
+        self.format = None
+
+    def open(self, device, fmt=None):
+        self.format = tuple(fmt or DEFAULT_FORMAT)
+        return self.format
+
+    def decode(self, filepath):
+        return decode_pcm(filepath, self.format)
+
+    def to_raw(self, clip):
+        return clip
+
+    def from_raw(self, data):
+        return bytes(data)
+
+    def duration(self, clip):
+        frequency = self.format[0]
+        return len(clip) / _frame_bytes(self.format) / frequency
+
+
+# --- ALSA ---
+
+class _AlsaPlayback:
+
+    def __init__(self, pcm, data, frame_bytes, loops):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._write, args=(pcm, data, frame_bytes, loops),
+                                        name="alsa-writer", daemon=True)
+        self._thread.start()
+
+    def _write(self, pcm, data, frame_bytes, loops):
+        step = ALSA_PERIOD * frame_bytes
+        view = memoryview(data)
+        while True:
+            for offset in range(0, len(view), step):
+                if self._stop.is_set():
+                    return
+                try:
+                    pcm.write(view[offset:offset + step])   # blocks for about one period
+                except alsaaudio.ALSAAudioError:
+                    return
+            if loops == 0 or not view:
+                return
+            loops -= 1
+
+    def set_volume(self, volume):
+        pass    # no software mixing on a raw PCM
+
+    def get_busy(self):
+        return self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class AlsaBackend(_PcmBackend):
+    name = "alsa"
+    single_stream = True
+
+    def __init__(self):
+        super().__init__()
+        self._pcm = None
+        self._playing = None
+
+    def open(self, device, fmt=None):
+        if alsaaudio is None:
+            raise BackendError("pyalsaaudio not installed")
+        fmt = super().open(device, fmt)
+        frequency, size, channels = fmt
+        if size != -16:
+            raise BackendError(f"unsupported sample size {size}")
+        try:
+            self._pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=device or "default",
+                                      rate=frequency, channels=channels,
+                                      format=alsaaudio.PCM_FORMAT_S16_LE, periodsize=ALSA_PERIOD)
+        except alsaaudio.ALSAAudioError as e:
+            raise BackendError(e) from e
+        return fmt
+
+    def close(self):
+        if self._playing is not None:
+            self._playing.stop()
+            self._playing = None
+        if self._pcm is not None:
+            self._pcm.close()
+            self._pcm = None
+
+    def start(self, clip, name="", channel=None, loops=0):
+        if self._pcm is None:
+            return None
+        if self._playing is not None:
+            self._playing.stop()    # one clip at a time on a raw PCM: speech cuts the earcon
+        self._playing = _AlsaPlayback(self._pcm, clip, _frame_bytes(self.format), loops)
+        return self._playing
+
+
+# --- null and wav (no sound card) ---
+
+class NullBackend(_PcmBackend):
+    """Plays nothing, instantly. Keeps the timeline of clips started."""
+    name = "null"
+    decoder = None              # decode() returns b"": nothing for the ClipStore
+
+    def __init__(self, timeline_path=TIMELINE_PATH):
+        super().__init__()
+        self.timeline_path = timeline_path
+        self.timeline = []      # [clip, start s, end s] relative to open()
+        self._opened_at = None
+
+    def open(self, device, fmt=None):
+        if self._opened_at is None:     # a failover reopens: keep one timeline
+            self._opened_at = time.monotonic()
+        return super().open(device, fmt)
+
+    def decode(self, filepath):
+        if not os.path.exists(filepath):
+            raise DecodeError(f"{filepath} not found")
+        return b""              # nothing to decode, nothing to play
+
+    def start(self, clip, name="", channel=None, loops=0):
+        now = time.monotonic() - self._opened_at
+        self.timeline.append([name, now, now])
+        return _TimedPlayback(0)
+
+    def close(self):
+        if self.timeline_path:
+            directory = os.path.dirname(self.timeline_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.timeline_path, "w") as f:
+                json.dump({"backend": self.name, "clips": self.timeline}, f)
+
+
+class WavBackend(NullBackend):
+    """Mixes every clip into a WAV at the time it was started, in real time.
+    Volume changes (ducking) are not rendered."""
+    name = "wav"
+    decoder = "decode_pcm"
+
+    def __init__(self, wav_path=WAV_PATH, timeline_path=TIMELINE_PATH):
+        super().__init__(timeline_path)
+        self.wav_path = wav_path
+        self._placed = []       # [start frame, pcm, looping until stopped]
+
+    def decode(self, filepath):
+        return decode_pcm(filepath, self.format)
+
+    def start(self, clip, name="", channel=None, loops=0):
+        start = time.monotonic() - self._opened_at
+        duration = self.duration(clip) * (loops + 1) if loops >= 0 else math.inf
+        entry = [name, start, start + duration]
+        placed = [int(start * self.format[0]), _loop(clip, len(clip) * (loops + 1)) if loops > 0 else clip, loops < 0]
+        self.timeline.append(entry)
+        self._placed.append(placed)
+
+        def on_stop(playback):
+            # Cut the clip where it was stopped, like the speaker would
+            entry[2] = time.monotonic() - self._opened_at
+            self._cut(placed, entry)
+        return _TimedPlayback(duration, on_stop)
+
+    def _cut(self, placed, entry):
+        kept = int((entry[2] - entry[1]) * self.format[0]) * _frame_bytes(self.format)
+        placed[1] = _loop(placed[1], kept) if placed[2] else placed[1][:kept]
+        placed[2] = False
+
+    def close(self):
+        """Writes the timeline and the WAV so far (again after a failover, in full at the end)."""
+        now = time.monotonic() - self._opened_at
+        for entry in self.timeline:
+            if entry[2] == math.inf:        # still looping
+                entry[2] = now
+        for placed in self._placed:
+            if placed[2]:
+                self._cut(placed, [None, placed[0] / self.format[0], now])
+        super().close()
+        if not self.wav_path or self.format is None:
+            return
+        frequency, size, channels = self.format
+        if size != -16:
+            raise BackendError(f"wav sink only renders 16-bit audio, not {size}")
+        end = max((start * channels + len(pcm) // 2 for start, pcm, _ in self._placed), default=0)
+        out = array("h", bytes(2 * end))
+        for start, pcm, _ in self._placed:
+            samples = array("h", pcm)
+            offset = start * channels
+            if not any(out[offset:offset + len(samples)]):
+                out[offset:offset + len(samples)] = samples     # common case: nothing else playing
+                continue
+            for i, value in enumerate(samples):                 # overlap: mix sample by sample
+                out[offset + i] = max(-32768, min(32767, out[offset + i] + value))
+        directory = os.path.dirname(self.wav_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with wave.open(self.wav_path, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(frequency)
+            w.writeframes(out.tobytes())
+
+
+BACKENDS = {"pygame": PygameBackend, "alsa": AlsaBackend, "null": NullBackend, "wav": WavBackend}
+
+
+def make_backend(name=None):
+    name = name or os.environ.get("CLAVIER_AUDIO_BACKEND", "pygame")
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise BackendError(f"unknown audio backend {name!r}, expected one of {', '.join(BACKENDS)}")
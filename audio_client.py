@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Game side of audio_server: the same interface as audio.AudioOutput
+(play, fire, background, probe, sink_lost...), forwarded over the server's
+Unix socket.
+
+Replies are read on the game thread, while it waits for a clip to end or
+between two commands, so on_start runs where AudioOutput would call it.
+The server timestamps each start with its own perf_counter_ns (the same
+clock in every process), so a late read does not inflate the latency.
+A clip is waited for as long as the server says it lasts, plus END_MARGIN.
+If the server goes away or stops answering, the game goes on with the local
+output made by `fallback` (silently without one) and tries the server again
+on a later clip.
+"""
+
+import itertools
+import os
+import select
+import socket
+import threading
+import time
+
+from audio import POLL_INTERVAL, SPEECH
+import event_log
+import stall_detector
+import tracing
+
+SOCKET_PATH = os.environ.get("CLAVIER_AUDIO_SOCKET", "/run/clavier-audio.sock")
+CONNECT_TIMEOUT = 1.0   # s, for the connection and the server's "ready"
+START_TIMEOUT = 2.0     # s, for the length of a clip (the server may have to decode it)
+END_MARGIN = 0.5        # s, after the clip's length, before giving up on its "done"
+RETRY_DELAY = 5.0
+LOCAL_RETRY_DELAY = 60.0    # on the local output: a hung server costs CONNECT_TIMEOUT per try
+
+
+class AudioClient:
+
+    def __init__(self, path=SOCKET_PATH, fallback=None):
+        self.path = path
+        self.fallback = fallback        # makes the local AudioOutput, None = stay silent
+        self.connected = False
+        self.sample_format = None
+        self.on_start = None            # called with ("backend:device", perf_counter_ns)
+        self.on_wait = None             # called every POLL_INTERVAL while play() waits
+        self._output_name = "server"
+        self._on_fallback = False
+        self._local = None              # AudioOutput while the server is away
+        self._sock = None
+        self._buffer = b""
+        self._ids = itertools.count(1)
+        self._done = set()
+        self._lengths = {}              # command id -> clip length in s
+        self._failovers = 0
+        self._probes = {}
+        self._send_lock = threading.Lock()  # sink_lost() comes from the bt_status thread
+        self._tried_at = None
+
+    def init(self):
+        """Connects to the server. False if there is none, or it has no output."""
+        self._tried_at = time.monotonic()
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(self.path)
+            self._sock = sock
+            words = self._read_line()
+        except OSError:
+            self._close()
+            return False
+        if not words or words[0] != "ready":
+            event_log.warning("audio_server_unavailable", socket=self.path)
+            self._close()
+            return False
+        self._output_name, self._on_fallback = words[1], words[2] == "1"
+        self.sample_format = (int(words[3]), int(words[4]), int(words[5]))
+        self.connected = True
+        event_log.info("audio_ready", output=self._output_name, server=self.path)
+        if self._local is not None:
+            self._local.quit()
+            self._local = None
+        return True
+
+    def quit(self):
+        if self._local is not None:
+            self._local.quit()
+            self._local = None
+        if self.connected:
+            self._close()
+            event_log.info("audio_quit")
+
+    @property
+    def available(self):
+        return self.connected or (self._local is not None and self._local.available)
+
+    @property
+    def output_name(self):
+        return self._local.output_name if self._local is not None else self._output_name
+
+    @property
+    def on_fallback(self):
+        return self._local.on_fallback if self._local is not None else self._on_fallback
+
+    # --- Any thread ---
+
+    def sink_lost(self):
+        local = self._local
+        if local is not None:
+            local.sink_lost()
+        self._send("sink lost")
+
+    def sink_back(self):
+        local = self._local
+        if local is not None:
+            local.sink_back()
+        self._send("sink back")
+
+    # --- Game thread ---
+
+    def add_clip(self, key, pcm):
+        """Nothing to do: the server synthesises the same earcons itself."""
+
+    def load(self, filepath):
+        """Has the server decode a clip now (it keeps it, nothing comes back)."""
+        if self._local is not None:
+            self._local.load(filepath)
+        self._send(f"load {filepath}")
+
+    def fire(self, key):
+        if self._local is not None:
+            self._local.fire(key)
+            return
+        self._send(f"fire {key}")
+        self._poll(0)
+
+    def background(self, filepath):
+        if self._local is not None:
+            self._local.background(filepath)
+        self._send(f"background {filepath or '-'}")
+
+    def queue(self, key, role=SPEECH):
+        """Queues a clip on the server, returns its command id."""
+        command_id = next(self._ids)
+        self._send(f"queue {command_id} {role} {key}")
+        return command_id
+
+    def play(self, filepath, role=SPEECH):
+        """Plays a clip to the end (as far as the server says). If the server does not
+        finish it in time, plays it again on the local output."""
+        retry_delay = LOCAL_RETRY_DELAY if self._local is not None else RETRY_DELAY
+        if not self.connected and time.monotonic() - self._tried_at > retry_delay:
+            self.init()
+        if self.connected and self._wait(self.queue(filepath, role)):
+            return
+        if self._local is not None:
+            self._local.play(filepath, role)
+
+    def probe(self, duration):
+        if self._local is not None:
+            return self._local.probe(duration)
+        command_id = next(self._ids)
+        self._send(f"probe {command_id} {int(duration * 1000)}")
+        deadline = time.monotonic() + duration * 4 + CONNECT_TIMEOUT
+        while self.connected and command_id not in self._probes and time.monotonic() < deadline:
+            self._poll(POLL_INTERVAL)
+        return self._probes.pop(command_id, False)
+
+    def _wait(self, command_id):
+        """Waits for the clip's "done": START_TIMEOUT for its length, then that length
+        plus END_MARGIN (again after a failover, which restarts it). False if the
+        server went away or stopped answering."""
+        deadline = time.monotonic() + START_TIMEOUT
+        length = START_TIMEOUT
+        failovers = self._failovers
+        with tracing.span("wait"):
+            while self.connected and command_id not in self._done:
+                stall_detector.beat()   # the server is playing, we are not stuck
+                if command_id in self._lengths or failovers != self._failovers:
+                    length = self._lengths.pop(command_id, length)
+                    failovers = self._failovers
+                    deadline = time.monotonic() + length + END_MARGIN
+                if time.monotonic() > deadline:
+                    event_log.warning("audio_server_timeout", id=command_id, length_s=length)
+                    self._lost(TimeoutError("no done from the audio server"))
+                    break
+                if self.on_wait is not None:
+                    self.on_wait()
+                self._poll(POLL_INTERVAL)
+        self._lengths.pop(command_id, None)
+        if command_id in self._done:
+            self._done.discard(command_id)
+            return True
+        return False
+
+    def _poll(self, timeout):
+        """Handles the server's replies, waiting up to `timeout` s for the first one."""
+        while self._sock is not None and select.select([self._sock], [], [], timeout)[0]:
+            try:
+                data = self._sock.recv(4096)
+                if not data:
+                    raise ConnectionResetError("audio server closed the connection")
+            except OSError as e:
+                self._lost(e)
+                return
+            self._buffer += data
+            *lines, self._buffer = self._buffer.split(b"\n")
+            for line in lines:
+                self._dispatch(line.decode().split())
+            timeout = 0     # then whatever else is already there
+
+    def _dispatch(self, words):
+        if not words:
+            return
+        event = words[0]
+        if event == "done":
+            self._done.add(int(words[1]))
+        elif event == "length":
+            self._lengths[int(words[1])] = int(words[2]) / 1000
+        elif event == "started":
+            self._output_name = words[1]
+            if self.on_start is not None:
+                self.on_start(words[1], int(words[2]))
+        elif event == "output":
+            self._output_name, self._on_fallback = words[1], words[2] == "1"
+            self._failovers += 1
+            tracing.instant("failover", self._output_name)
+        elif event == "probe":
+            self._probes[int(words[1])] = words[2] == "ok"
+
+    def _read_line(self):
+        while b"\n" not in self._buffer:
+            data = self._sock.recv(4096)
+            if not data:
+                return None
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode().split()
+
+    def _send(self, line):
+        sock = self._sock
+        if sock is None:
+            return
+        try:
+            with self._send_lock:
+                sock.sendall(line.encode() + b"\n")
+        except OSError:
+            pass    # the game thread's next _poll() sees the server gone
+
+    def _lost(self, error):
+        if self.connected:
+            event_log.error("audio_server_lost", error=error)
+        self._close()
+        if self.fallback is not None and self._local is None:
+            local = self.fallback()
+            if local.available:
+                local.on_start = self.on_start
+                local.on_wait = self.on_wait
+                self._local = local
+                event_log.info("audio_local_fallback", output=local.output_name)
+
+    def _close(self):
+        self.connected = False
+        self._done.clear()
+        self._lengths.clear()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._buffer = b""
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Audio server: a long-lived process that owns the audio output and the
+decoded clips, so the game restarts (crash, content update, config change)
+without reopening the mixer or decoding anything again.
+
+The game talks to it with audio_client.AudioClient over a Unix socket, one
+command per line (paths contain no spaces):
+
+    queue <id> <role> <path>    play after the role's queued clips
+    play <id> <role> <path>     stop the role, then play
+    stop <role>
+    fire <key>                  earcon, right now
+    background <path>|-         ambience loop, - stops it
+    load <path>                 decode now, play later
+    probe <id> <ms>             self-test tone
+    sink lost|back              from the game's Bluetooth status
+
+and gets back, one event per line:
+
+    ready <output> <fallback 0/1> <frequency> <size> <channels>   (or "unavailable")
+    length <id> <ms>                        clip length, right after its queue/play
+    started <output> <perf_counter_ns>      a clip started playing
+    done <id>                               finished, stopped or unplayable
+    probe <id> ok|fail
+    output <output> <fallback 0/1>          after a failover
+
+One game at a time: a new connection replaces the previous one, whose
+clips are stopped. Decoded PCM also goes to the shared ClipStore, so even a
+restart of the server itself finds the clips decoded.
+
+    python3 audio_server.py [--warm audio/]
+"""
+
+import os
+
+# The game has the default log ring and file
+os.environ.setdefault("CLAVIER_LOG_RING", "/dev/shm/clavier-audio.log")
+os.environ.setdefault("CLAVIER_LOG_FILE", "logs/clavier-audio.log")
+
+from collections import deque
+import select
+import signal
+import socket
+import sys
+import time
+
+from audio import AudioOutput, POLL_INTERVAL, ROLE_CHANNELS
+from audio_backends import DecodeError
+from clip_store import ClipStore
+from earcons import Earcons
+import event_log
+from rt_profile import RtProfile
+
+SOCKET_PATH = os.environ.get("CLAVIER_AUDIO_SOCKET", "/run/clavier-audio.sock")
+
+
+def _word(name):
+    return name.replace(" ", "_")  # device names can have spaces ("bcm2835 Headphones")
+
+
+class AudioServer:
+
+    def __init__(self, output, path=SOCKET_PATH):
+        self.output = output
+        self.path = path
+        self._server = None
+        self._client = None
+        self._buffer = b""
+        self._pending = {role: deque() for role in ROLE_CHANNELS}   # command ids, in queue order
+        self._output_state = None
+        output.on_start = lambda name: self._send(f"started {_word(name)} {time.perf_counter_ns()}")
+
+    def serve_forever(self):
+        try:
+            os.unlink(self.path)    # left by a previous run
+        except FileNotFoundError:
+            pass
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(1)
+        event_log.info("audio_server_ready", socket=self.path, output=self.output.output_name)
+        while True:
+            watched = [self._server] if self._client is None else [self._server, self._client]
+            readable, _, _ = select.select(watched, [], [], POLL_INTERVAL)
+            if self._server in readable:
+                self._accept()
+            elif readable:
+                self._receive()
+            self.output.service()
+            self._report()
+
+    def close(self):
+        self._disconnect()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _accept(self):
+        conn, _ = self._server.accept()
+        if self._client is not None:
+            event_log.info("audio_client_replaced")
+        self._disconnect()
+        self._client = conn
+        self._output_state = self._state()
+        if self.output.available:
+            frequency, size, channels = self.output.sample_format
+            self._send(f"ready {self._output_state} {frequency} {size} {channels}")
+        else:
+            self._send("unavailable")
+        event_log.info("audio_client_connected")
+
+    def _disconnect(self):
+        if self._client is None:
+            return
+        self._client.close()
+        self._client = None
+        self._buffer = b""
+        for role in ROLE_CHANNELS:
+            self.output.stop(role)  # nobody left to hear them
+            self._pending[role].clear()
+
+    def _receive(self):
+        try:
+            data = self._client.recv(4096)
+        except OSError:
+            data = b""
+        if not data:
+            event_log.info("audio_client_gone")
+            self._disconnect()
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            try:
+                self._handle(line.decode().split())
+            except (ValueError, KeyError, IndexError, DecodeError) as e:
+                event_log.warning("audio_bad_command", command=line[:80], error=e)
+
+    def _handle(self, words):
+        command, args = words[0], words[1:]
+        if command == "queue":
+            self._queue(int(args[0]), args[1], args[2])
+        elif command == "play":
+            self.output.stop(args[1])
+            self._queue(int(args[0]), args[1], args[2])
+        elif command == "stop":
+            self.output.stop(args[0])
+        elif command == "fire":
+            self.output.fire(args[0])
+        elif command == "background":
+            self.output.background(None if args[0] == "-" else args[0])
+        elif command == "load":
+            self.output.load(args[0])
+        elif command == "probe":
+            ok = self.output.probe(int(args[1]) / 1000)
+            self._send(f"probe {args[0]} {'ok' if ok else 'fail'}")
+        elif command == "sink":
+            if args[0] == "lost":
+                self.output.sink_lost()
+            else:
+                self.output.sink_back()
+        else:
+            raise ValueError(f"unknown command {command!r}")
+
+    def _queue(self, command_id, role, path):
+        if role not in ROLE_CHANNELS:
+            raise ValueError(f"unknown role {role!r}")
+        if self.output.available:
+            length = self.output.duration(path)     # decodes it now: the client times its wait on it
+            if length is not None:
+                self._send(f"length {command_id} {int(length * 1000)}")
+        self._pending[role].append(command_id)
+        self.output.queue(path, role)
+
+    def _report(self):
+        """Sends `done` for every clip that left its role's channel, and output changes."""
+        for role, pending in self._pending.items():
+            remaining = self.output.pending(role)
+            while len(pending) > remaining:
+                self._send(f"done {pending.popleft()}")
+        state = self._state()
+        if state != self._output_state:
+            self._output_state = state
+            self._send(f"output {state}")
+
+    def _state(self):
+        return f"{_word(self.output.output_name)} {int(self.output.on_fallback)}"
+
+    def _send(self, line):
+        if self._client is None:
+            return
+        try:
+            self._client.sendall(line.encode() + b"\n")
+        except OSError:
+            pass    # the next recv() sees the client gone
+
+
+def warm(output, directory):
+    """Decodes every clip of `directory` (from the ClipStore when it has them)."""
+    start = time.monotonic()
+    count = 0
+    for name in sorted(os.listdir(directory)):
+        if ":" in name or name.startswith("."):
+            continue    # Zone.Identifier streams and the like
+        try:
+            output.load(os.path.join(directory, name))
+            count += 1
+        except DecodeError as e:
+            event_log.warning("warm_failed", clip=name, error=e)
+    event_log.info("audio_warm", clips=count, s=time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    event_log.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    rt = RtProfile.from_env()
+    rt_warnings = rt.apply("audio")     # before init: the mixer threads inherit it
+    output = AudioOutput(store=ClipStore())
+    output.init()
+    Earcons(output).build()
+    if len(sys.argv) == 3 and sys.argv[1] == "--warm" and output.available:
+        warm(output, sys.argv[2])
+    for warning in rt_warnings + rt.after_warmup():
+        event_log.warning("rt_profile_incomplete", reason=warning)
+    server = AudioServer(output)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        output.quit()
+        event_log.close()
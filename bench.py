@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the game's own code paths:
+
+    scan_rate       scan_keys() per second, nothing pressed
+    scan_jitter     lateness of the scanner's deadline loop (rt_profile.measure)
+    press_latency   key down to next_key() returning it, bouncing contacts,
+                    default and tuned debounce windows
+    clip_cache      clip load: decode (miss), cache hit, shared ClipStore hit
+    phrase          play_audio() of a three-clip feedback phrase (null audio: game overhead only)
+    level_steps     questions answered per second in level 1 by a simulated child
+    startup         game import + every clip decoded, cold and warm ClipStore
+
+    python3 bench.py                        # simulated GPIO (any machine)
+    python3 bench.py --gpio rpi             # the real matrix: scan_rate, scan_jitter, clip_cache...
+    python3 bench.py --quick --only scan_rate --only phrase
+    python3 bench.py --compare bench/a.json bench/b.json
+
+Results go to bench/<machine>-<commit>-<date>.json with the machine (Pi
+model or CPU), the commit and the settings, for comparisons between
+commits and hardware models. The game runs in a scratch directory (logs,
+sessions, progress, clip store), reading the clips of audio/; audio goes
+to the null backend unless CLAVIER_AUDIO_BACKEND says otherwise.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT, "bench")
+AUDIO_DIR = os.path.join(ROOT, "audio") + "/"
+PHRASE = ("bravo0", "cest_bien_la_lettre", "b")   # level 1, right answer
+BENCHMARKS = ("scan_rate", "scan_jitter", "press_latency", "clip_cache", "phrase", "level_steps", "startup")
+NEEDS_SIM = ("press_latency", "level_steps")    # they press keys
+
+
+def summary(values):
+    """n, mean and percentiles of a list of numbers."""
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p / 100))]
+    return {"n": len(values), "mean": round(sum(values) / len(values), 3),
+            "p50": round(pick(50), 3), "p95": round(pick(95), 3), "p99": round(pick(99), 3),
+            "max": round(values[-1], 3)}
+
+
+def setup_environment(gpio, scratch):
+    """Points the game's files at `scratch`. Must run before any game module is imported."""
+    os.environ.update({
+        "CLAVIER_LOG_RING": os.path.join(scratch, "clavier.log.ring"),
+        "CLAVIER_LOG_FILE": os.path.join(scratch, "logs", "clavier.log"),
+        "CLAVIER_LOG_LEVEL": os.environ.get("CLAVIER_LOG_LEVEL", "WARNING"),
+        "CLAVIER_AUDIO_SOCKET": os.path.join(scratch, "no-audio-server.sock"),
+        "CLAVIER_AUDIO_BACKEND": os.environ.get("CLAVIER_AUDIO_BACKEND", "null"),
+        "CLAVIER_AUDIO_WAV": "",
+        "CLAVIER_AUDIO_TIMELINE": "",
+        "CLAVIER_CLIP_STORE": os.environ.get("CLAVIER_CLIP_STORE", os.path.join(scratch, "clips")),
+        "CLAVIER_CONFIG": os.path.join(scratch, "device_config.json"),
+        "CLAVIER_METRICS_SOCKET": os.path.join(scratch, "metrics.sock"),
+    })
+    if gpio == "sim":
+        import sim_gpio
+        sim_gpio.install()
+    os.chdir(scratch)
+
+
+def load_game():
+    import keyboard_game
+    keyboard_game.AUDIO_DIR = AUDIO_DIR
+    return keyboard_game
+
+
+def pins_of(game, key):
+    for r, row in enumerate(game.KEY_MAP):
+        if key in row:
+            return game.ROW_PINS[r], game.COL_PINS[row.index(key)]
+    raise KeyError(key)
+
+
+# --- Benchmarks ---
+
+def bench_scan_rate(game, seconds):
+    game.setup_gpio()
+    scans = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        game.scan_keys()
+        scans += 1
+    elapsed = time.perf_counter() - start
+    return {"scans_per_s": round(scans / elapsed, 1), "ms_per_scan": round(elapsed / scans * 1000, 3)}
+
+
+def bench_scan_jitter(seconds):
+    from scanner import SCAN_PERIOD
+    out = subprocess.run([sys.executable, os.path.join(ROOT, "rt_profile.py"), "--measure", str(seconds),
+                          "--period", str(SCAN_PERIOD)], capture_output=True, text=True, check=True).stdout
+    result = json.loads(out)
+    return {"period_ms": SCAN_PERIOD * 1000, "rt_profile": os.environ.get("CLAVIER_RT", "0") != "0",
+            "late_us": {k: result[k] for k in ("count", "p50", "p95", "p99", "max")},
+            "warnings": result["warnings"]}
+
+
+def bench_press_latency(game, presses, bounce, hold):
+    import sim_gpio
+    from debounce import MIN_SAMPLES
+    game.setup_gpio()
+    game.setup_key_events()
+    keys = [key for row in game.KEY_MAP for key in row]
+    results = {"bounce_ms": bounce * 1000, "hold_ms": hold * 1000}
+    for case in ("default_windows", "tuned_windows"):
+        if case == "tuned_windows":
+            for key in keys:
+                for _ in range(MIN_SAMPLES):
+                    game.debouncer.record(key, bounce)
+            game.debouncer.retune()
+        latencies, wrong, missed = [], 0, 0
+        for _ in range(presses):
+            key = random.choice(keys)
+            down = sim_gpio.press(*pins_of(game, key), hold=hold, bounce=bounce, delay=0.02)
+            give_up = game.timers.schedule(hold + 1.0)    # wakes next_key() if the press is lost
+            read = None
+            while read is None and not give_up.fired:
+                read = game.next_key()
+            read_at = time.perf_counter()
+            give_up.cancel()
+            time.sleep(max(0.0, down + hold + 0.01 - time.perf_counter()))   # one key at a time
+            if read is None:
+                missed += 1
+                continue
+            latencies.append((read_at - down) * 1000)
+            wrong += read != key
+        windows = [game.debouncer.window(key) * 1000 for key in keys]
+        results[case] = {"window_ms": round(sum(windows) / len(windows), 2), "latency_ms": summary(latencies),
+                         "wrong_keys": wrong, "missed": missed}
+    return results
+
+
+def bench_clip_cache(clips):
+    from audio import AudioOutput
+    from audio_backends import WavBackend, pygame
+    from clip_store import ClipStore
+    if pygame is None:
+        return {"skipped": "pygame not installed, nothing decodes mp3"}
+    files = sorted(os.path.join(AUDIO_DIR, name) for name in os.listdir(AUDIO_DIR) if name.endswith(".mp3"))[:clips]
+    store = ClipStore(os.path.join(os.getcwd(), "clips-cache-bench"))
+
+    def load_all(output):
+        times = []
+        for path in files:
+            start = time.perf_counter()
+            output.load(path)
+            times.append((time.perf_counter() - start) * 1_000_000)
+        return times
+
+    first = AudioOutput([None], WavBackend(wav_path=None, timeline_path=None), store=store)
+    first.init()
+    miss = load_all(first)
+    hit = load_all(first)
+    first.quit()
+    second = AudioOutput([None], WavBackend(wav_path=None, timeline_path=None), store=store)
+    second.init()
+    from_store = load_all(second)
+    second.quit()
+    return {"clips": len(files), "miss_us": summary(miss), "hit_us": summary(hit), "store_us": summary(from_store)}
+
+
+def bench_phrase(game, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for name in PHRASE:
+            game.play_audio(name)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"clips": len(PHRASE), "audio": game.audio.output_name, "ms_per_phrase": summary(times),
+            "note": "includes play_audio's fixed 50 ms pause before each clip"}
+
+
+def bench_level_steps(game, steps, hold):
+    """Level 1 answered right by a simulated child, then left with key 4."""
+    import progress_store
+    import session_log
+    import sim_gpio
+    game.setup_gpio()
+    game.setup_key_events()
+    game.session = session_log.SessionLog.start()
+    game.progress = progress_store.ProgressStore()
+    asked = [0]
+    log_event = game.log_event
+
+    def answer(etype, *fields, sync=False):
+        log_event(etype, *fields, sync=sync)
+        if etype == session_log.QUESTION:
+            asked[0] += 1
+            key = fields[0] if asked[0] <= steps else '4'
+            sim_gpio.press(*pins_of(game, key), hold=hold, bounce=0.001)
+
+    game.log_event = answer
+    try:
+        start = time.perf_counter()
+        game.level_1()
+        elapsed = time.perf_counter() - start
+    finally:
+        game.log_event = log_event
+        game.session.close()
+        game.progress.close()
+        game.session = game.progress = None
+    return {"steps": steps, "seconds": round(elapsed, 3), "steps_per_s": round(steps / elapsed, 3),
+            "ms_per_step": round(elapsed / steps * 1000, 1), "hold_ms": hold * 1000}
+
+
+def bench_startup(gpio):
+    """Two fresh processes on a fresh ClipStore: the first decodes, the second finds the store warm."""
+    from audio_backends import pygame
+    env = dict(os.environ, CLAVIER_CLIP_STORE=tempfile.mkdtemp(prefix="clips-", dir=os.getcwd()),
+               CLAVIER_AUDIO_BACKEND="wav" if pygame is not None else "null")
+    results = {"audio": env["CLAVIER_AUDIO_BACKEND"]}
+    for run in ("cold", "warm"):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-child", "--gpio", gpio],
+                             env=env, capture_output=True, text=True, check=True).stdout
+        results[run] = {"process_s": round(time.perf_counter() - start, 3), **json.loads(out.splitlines()[-1])}
+    return results
+
+
+def startup_child(gpio):
+    start = time.perf_counter()
+    scratch = tempfile.mkdtemp(prefix="clavier-bench-")
+    setup_environment(gpio, scratch)
+    game = load_game()
+    imported = time.perf_counter() - start
+    clips = 0
+    if hasattr(game.audio, "load") and game.audio.available:
+        for name in game.audio_manifest():
+            path = os.path.join(AUDIO_DIR, name + game.EXPECTED_AUDIO_EXT)
+            if os.path.exists(path):
+                game.audio.load(path)
+                clips += 1
+    print(json.dumps({"import_s": round(imported, 3), "ready_s": round(time.perf_counter() - start, 3),
+                      "clips": clips}))
+    game.audio.quit()
+    game.event_log.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+# --- Runner ---
+
+def machine():
+    try:
+        with open("/proc/device-tree/model") as f:
+            return f.read().strip("\0\n")
+    except OSError:
+        return platform.processor() or platform.machine()
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(gpio, only, quick):
+    scale = 0.25 if quick else 1.0
+    selected = [name for name in BENCHMARKS if not only or name in only]
+    results = {}
+    game = None
+    for name in selected:
+        if gpio != "sim" and name in NEEDS_SIM:
+            results[name] = {"skipped": "needs simulated key presses (--gpio sim)"}
+            continue
+        if name not in ("scan_jitter", "clip_cache", "startup") and game is None:
+            game = load_game()
+        print(f"{name}...", file=sys.stderr)
+        start = time.perf_counter()
+        if name == "scan_rate":
+            results[name] = bench_scan_rate(game, 5 * scale)
+        elif name == "scan_jitter":
+            results[name] = bench_scan_jitter(10 * scale)
+        elif name == "press_latency":
+            results[name] = bench_press_latency(game, max(5, int(40 * scale)), bounce=0.005, hold=0.1)
+        elif name == "clip_cache":
+            results[name] = bench_clip_cache(max(5, int(40 * scale)))
+        elif name == "phrase":
+            results[name] = bench_phrase(game, max(3, int(20 * scale)))
+        elif name == "level_steps":
+            results[name] = bench_level_steps(game, max(3, int(15 * scale)), hold=0.1)
+        elif name == "startup":
+            results[name] = bench_startup(gpio)
+        results[name]["bench_s"] = round(time.perf_counter() - start, 2)
+    if game is not None:
+        game.audio.quit()
+        game.event_log.close()
+    return results
+
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    lines = [f"{'':<48} {a['commit']:>12} {b['commit']:>12}",
+             f"{'':<48} {a['machine'][:12]:>12} {b['machine'][:12]:>12}"]
+    values_b = dict(flatten(b["results"]))
+    for name, value in flatten(a["results"]):
+        if name not in values_b or name.endswith("bench_s"):
+            continue
+        other = values_b[name]
+        change = f"{(other - value) / value * 100:+7.1f}%" if value else ""
+        lines.append(f"{name:<48} {value:>12g} {other:>12g} {change}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keyboard game benchmarks")
+    parser.add_argument("--gpio", choices=("sim", "rpi"), default="sim",
+                        help="sim: simulated matrix (any machine), rpi: RPi.GPIO on the real matrix")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="run only this benchmark (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, for a smoke test")
+    parser.add_argument("--out", help="result file (default bench/<machine>-<commit>-<date>.json)")
+    parser.add_argument("--compare", nargs=2, metavar="JSON", help="compare two result files")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare))
+        sys.exit(0)
+    if args.startup_child:
+        startup_child(args.gpio)
+        sys.exit(0)
+
+    report = {"machine": machine(), "commit": commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "gpio": args.gpio,
+              "audio": os.environ.get("CLAVIER_AUDIO_BACKEND", "null"), "quick": args.quick}
+    scratch = tempfile.mkdtemp(prefix="clavier-bench-")
+    setup_environment(args.gpio, scratch)
+    try:
+        report["results"] = run(args.gpio, args.only, args.quick)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, "{}-{}-{}.json".format(
+        "".join(c if c.isalnum() else "_" for c in report["machine"])[:40], report["commit"],
+        time.strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(json.dumps(report["results"], indent=1))
+    print(f"written to {out}", file=sys.stderr)
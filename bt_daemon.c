@@ -0,0 +1,476 @@
+// Bluetooth daemon for the keyboard: one process owns the speaker connection,
+// the reconnect button and the status LED (replaces bt_led and bt_monitor,
+// which both drove LED_LINE 25 for different speakers).
+//
+// - connection state comes from BlueZ PropertiesChanged signals (sd-bus)
+// - the button is read through falling-edge events, the retry backoff is a timerfd
+// - every change is published on a Unix socket, one line per event:
+//       connected 3C:B0:ED:C3:89:4B
+//       disconnected 3C:B0:ED:C3:89:4B
+//   New clients first receive the current state of every speaker. Clients may
+//   send "status" (state again), "reconnect" (same as the button) or
+//   "blink 2,4" (blink these fault codes on the LED, BLINK_REPEAT times, then
+//   show the connection state again; sent by the game's boot self-test).
+//
+// Build: gcc -o bt_daemon bt_daemon.c -lgpiod -lsystemd
+// Test without a radio: BT_DAEMON_SOCKET=/tmp/bt.sock ./bt_daemon --session
+// (on a session bus running fake_bluez.py, see that file)
+
+#define _GNU_SOURCE  // accept4
+#include <errno.h>
+#include <poll.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <gpiod.h>
+#include <time.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/timerfd.h>
+#include <sys/un.h>
+#include <systemd/sd-bus.h>
+
+#define CHIP_NAME "gpiochip0"
+#define BUTTON_LINE 11
+#define LED_LINE 25
+
+#define SOCKET_PATH "/run/clavier-bt.sock"
+#define MAX_CLIENTS 8
+
+#define RETRY_MIN 1        // seconds, first retry after a disconnection
+#define RETRY_MAX 60       // seconds, backoff ceiling
+#define DEBOUNCE_MS 200    // ignore button edges closer than this
+
+#define BLINK_ON_MS 200
+#define BLINK_OFF_MS 200
+#define BLINK_PAUSE_MS 1000  // between two codes
+#define BLINK_REPEAT 3
+#define MAX_BLINK_STEPS 256
+
+#define BLUEZ_SERVICE "org.bluez"
+#define BLUEZ_ADAPTER_PATH "/org/bluez/hci0"
+#define BLUEZ_DEVICE_IFACE "org.bluez.Device1"
+
+// Known speakers (one per box build), the LED is on when any is connected
+static const char *speaker_macs[] = { "3C:B0:ED:C3:89:4B", "DA:FE:25:0E:EE:19" };
+#define N_SPEAKERS (int)(sizeof(speaker_macs) / sizeof(speaker_macs[0]))
+
+struct speaker {
+    const char *mac;
+    char path[64];
+    int connected;
+    int connecting;     // Connect() call in flight
+};
+
+static struct speaker speakers[N_SPEAKERS];
+static sd_bus *bus = NULL;
+static struct gpiod_line *led = NULL;   // NULL in --session mode without GPIO
+static int clients[MAX_CLIENTS];
+static int n_clients = 0;
+static int timer_fd = -1;
+static int retry_delay = RETRY_MIN;
+
+// Fault code blinking: LED value and duration of each step, the connection
+// state is shown again after the last one
+struct blink_step {
+    int value;
+    int ms;
+};
+static struct blink_step blink_steps[MAX_BLINK_STEPS];
+static int n_blink_steps = 0;
+static int blink_step = -1;     // step being shown, -1 = not blinking
+static int blink_fd = -1;
+
+// --- State publishing ---
+
+static int any_connected(void) {
+    for (int i = 0; i < N_SPEAKERS; i++)
+        if (speakers[i].connected)
+            return 1;
+    return 0;
+}
+
+static void drop_client(int i) {
+    close(clients[i]);
+    clients[i] = clients[--n_clients];
+}
+
+static void send_state(int fd, const struct speaker *s) {
+    char line[64];
+    int len = snprintf(line, sizeof(line), "%s %s\n", s->connected ? "connected" : "disconnected", s->mac);
+    // Never block on a slow client, it just loses the connection
+    if (send(fd, line, len, MSG_DONTWAIT | MSG_NOSIGNAL) != len)
+        shutdown(fd, SHUT_RDWR);
+}
+
+// One-shot timer, 0 disarms it
+static void arm_timer(int seconds) {
+    struct itimerspec spec = {0};
+    spec.it_value.tv_sec = seconds;
+    timerfd_settime(timer_fd, 0, &spec, NULL);
+}
+
+static void schedule_retry(void) {
+    arm_timer(retry_delay);
+    retry_delay = retry_delay * 2 > RETRY_MAX ? RETRY_MAX : retry_delay * 2;
+}
+
+static void set_connected(struct speaker *s, int connected) {
+    if (connected == s->connected)
+        return;
+    s->connected = connected;
+    printf("Bluetooth speaker %s %s\n", s->mac, connected ? "connected" : "disconnected");
+    fflush(stdout);
+
+    for (int i = 0; i < n_clients; i++)
+        send_state(clients[i], s);
+
+    if (led && blink_step < 0)
+        gpiod_line_set_value(led, any_connected());
+
+    if (any_connected()) {
+        retry_delay = RETRY_MIN;
+        arm_timer(0);
+    } else {
+        schedule_retry();
+    }
+}
+
+// --- Fault codes on the LED ---
+
+static void arm_ms(int fd, int ms) {
+    struct itimerspec spec = {0};
+    spec.it_value.tv_sec = ms / 1000;
+    spec.it_value.tv_nsec = (long)(ms % 1000) * 1000000;
+    timerfd_settime(fd, 0, &spec, NULL);
+}
+
+static void add_blink_step(int value, int ms) {
+    if (n_blink_steps < MAX_BLINK_STEPS)
+        blink_steps[n_blink_steps++] = (struct blink_step){ value, ms };
+}
+
+// Shows the current step and arms the timer for the next one
+static void show_blink_step(void) {
+    if (blink_step >= n_blink_steps) {
+        blink_step = -1;
+        if (led)
+            gpiod_line_set_value(led, any_connected());
+        return;
+    }
+    if (led)
+        gpiod_line_set_value(led, blink_steps[blink_step].value);
+    arm_ms(blink_fd, blink_steps[blink_step].ms);
+}
+
+// "2,4": codes 1-9 separated by commas, replaces any blinking in progress
+static void start_blink(const char *codes) {
+    int parsed[16];
+    int n = 0;
+    for (const char *p = codes; *p && *p != '\n' && n < 16; p++)
+        if (*p >= '1' && *p <= '9')
+            parsed[n++] = *p - '0';
+    if (n == 0)
+        return;
+    n_blink_steps = 0;
+    for (int r = 0; r < BLINK_REPEAT; r++) {
+        for (int i = 0; i < n; i++) {
+            for (int k = 0; k < parsed[i]; k++) {
+                add_blink_step(1, BLINK_ON_MS);
+                add_blink_step(0, BLINK_OFF_MS);
+            }
+            add_blink_step(0, BLINK_PAUSE_MS);
+        }
+    }
+    printf("Blinking %d fault code(s)\n", n);
+    fflush(stdout);
+    blink_step = 0;
+    show_blink_step();
+}
+
+// --- BlueZ ---
+
+// "3C:B0:ED:C3:89:4B" -> "/org/bluez/hci0/dev_3C_B0_ED_C3_89_4B"
+static void device_path(char *buf, size_t len, const char *mac) {
+    snprintf(buf, len, "%s/dev_%s", BLUEZ_ADAPTER_PATH, mac);
+    for (char *p = buf + strlen(BLUEZ_ADAPTER_PATH); *p; p++)
+        if (*p == ':')
+            *p = '_';
+}
+
+static int query_connected(const struct speaker *s) {
+    sd_bus_error error = SD_BUS_ERROR_NULL;
+    int connected = 0;
+    if (sd_bus_get_property_trivial(bus, BLUEZ_SERVICE, s->path, BLUEZ_DEVICE_IFACE,
+                                    "Connected", &error, 'b', &connected) < 0)
+        connected = 0;  // unknown device or no bluetoothd: not connected
+    sd_bus_error_free(&error);
+    return connected;
+}
+
+// PropertiesChanged(s interface, a{sv} changed, as invalidated)
+static int on_properties_changed(sd_bus_message *m, void *userdata, sd_bus_error *ret_error) {
+    struct speaker *s = userdata;
+    const char *interface;
+
+    if (sd_bus_message_read(m, "s", &interface) < 0 || strcmp(interface, BLUEZ_DEVICE_IFACE) != 0)
+        return 0;
+    if (sd_bus_message_enter_container(m, 'a', "{sv}") < 0)
+        return 0;
+    while (sd_bus_message_enter_container(m, 'e', "sv") > 0) {
+        const char *name;
+        if (sd_bus_message_read(m, "s", &name) < 0)
+            return 0;
+        if (strcmp(name, "Connected") == 0) {
+            int connected;
+            if (sd_bus_message_read(m, "v", "b", &connected) < 0)
+                return 0;
+            set_connected(s, connected);
+        } else if (sd_bus_message_skip(m, "v") < 0) {
+            return 0;
+        }
+        sd_bus_message_exit_container(m);
+    }
+    return 0;
+}
+
+// bluetoothd restarted or went away
+static int on_owner_changed(sd_bus_message *m, void *userdata, sd_bus_error *ret_error) {
+    const char *name, *old_owner, *new_owner;
+    if (sd_bus_message_read(m, "sss", &name, &old_owner, &new_owner) < 0)
+        return 0;
+    for (int i = 0; i < N_SPEAKERS; i++) {
+        speakers[i].connecting = 0;
+        set_connected(&speakers[i], new_owner[0] ? query_connected(&speakers[i]) : 0);
+    }
+    return 0;
+}
+
+static int on_connect_reply(sd_bus_message *m, void *userdata, sd_bus_error *ret_error) {
+    struct speaker *s = userdata;
+    const sd_bus_error *error = sd_bus_message_get_error(m);
+    s->connecting = 0;
+    if (error)
+        printf("Connecting %s failed: %s\n", s->mac, error->message ? error->message : error->name);
+    // On success the Connected signal does the rest
+    return 0;
+}
+
+// Asynchronous org.bluez.Device1.Connect: the loop keeps serving the button and clients
+static void reconnect_all(void) {
+    for (int i = 0; i < N_SPEAKERS; i++) {
+        struct speaker *s = &speakers[i];
+        if (s->connected || s->connecting)
+            continue;
+        if (sd_bus_call_method_async(bus, NULL, BLUEZ_SERVICE, s->path, BLUEZ_DEVICE_IFACE,
+                                     "Connect", on_connect_reply, s, "") >= 0)
+            s->connecting = 1;
+    }
+}
+
+// --- Socket clients ---
+
+static int open_socket(const char *path) {
+    struct sockaddr_un addr = { .sun_family = AF_UNIX };
+    int fd = socket(AF_UNIX, SOCK_STREAM | SOCK_CLOEXEC | SOCK_NONBLOCK, 0);
+    if (fd < 0)
+        return -1;
+    strncpy(addr.sun_path, path, sizeof(addr.sun_path) - 1);
+    unlink(path);
+    if (bind(fd, (struct sockaddr *)&addr, sizeof(addr)) < 0 || listen(fd, 4) < 0) {
+        close(fd);
+        return -1;
+    }
+    chmod(path, 0666);  // the game does not run as root
+    return fd;
+}
+
+static void accept_client(int listen_fd) {
+    int fd = accept4(listen_fd, NULL, NULL, SOCK_CLOEXEC | SOCK_NONBLOCK);
+    if (fd < 0)
+        return;
+    if (n_clients == MAX_CLIENTS) {
+        close(fd);
+        return;
+    }
+    clients[n_clients++] = fd;
+    for (int i = 0; i < N_SPEAKERS; i++)
+        send_state(fd, &speakers[i]);
+}
+
+// Returns 0 when the client went away
+static int handle_client(int fd) {
+    char buf[128];
+    ssize_t len = recv(fd, buf, sizeof(buf) - 1, 0);
+    if (len <= 0)
+        return len < 0 && errno == EAGAIN;
+    buf[len] = '\0';
+    if (strncmp(buf, "blink ", 6) == 0) {
+        start_blink(buf + 6);
+    } else if (strstr(buf, "reconnect")) {
+        retry_delay = RETRY_MIN;
+        reconnect_all();
+    } else if (strstr(buf, "status")) {
+        for (int i = 0; i < N_SPEAKERS; i++)
+            send_state(fd, &speakers[i]);
+    }
+    return 1;
+}
+
+// --- Main loop ---
+
+static int bus_poll_timeout(void) {
+    uint64_t usec;
+    struct timespec now;
+    if (sd_bus_get_timeout(bus, &usec) < 0 || usec == UINT64_MAX)
+        return -1;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    uint64_t now_usec = (uint64_t)now.tv_sec * 1000000 + now.tv_nsec / 1000;
+    return usec <= now_usec ? 0 : (int)((usec - now_usec + 999) / 1000);
+}
+
+int main(int argc, char **argv) {
+    struct gpiod_chip *chip;
+    struct gpiod_line *button = NULL;
+    const char *socket_path = getenv("BT_DAEMON_SOCKET");
+    int session = argc > 1 && strcmp(argv[1], "--session") == 0;
+    long long last_press_ms = 0;
+    int listen_fd;
+    int r;
+
+    chip = gpiod_chip_open_by_name(CHIP_NAME);
+    if (!chip) {
+        perror("Open chip failed");
+        if (!session)
+            return 1;
+    } else {
+        button = gpiod_chip_get_line(chip, BUTTON_LINE);
+        led = gpiod_chip_get_line(chip, LED_LINE);
+        if (!button || !led) {
+            perror("Get line failed");
+            return 1;
+        }
+        if (gpiod_line_request_falling_edge_events_flags(button, "bt_button",
+                                                         GPIOD_LINE_REQUEST_FLAG_BIAS_PULL_UP) < 0) {
+            perror("Request button events failed");
+            return 1;
+        }
+        if (gpiod_line_request_output(led, "bt_led", 0) < 0) {
+            perror("Request LED output failed");
+            return 1;
+        }
+    }
+
+    r = session ? sd_bus_open_user(&bus) : sd_bus_open_system(&bus);
+    if (r < 0) {
+        fprintf(stderr, "Failed to connect to the bus: %s\n", strerror(-r));
+        return 1;
+    }
+
+    timer_fd = timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC | TFD_NONBLOCK);
+    blink_fd = timerfd_create(CLOCK_MONOTONIC, TFD_CLOEXEC | TFD_NONBLOCK);
+    listen_fd = open_socket(socket_path ? socket_path : SOCKET_PATH);
+    if (timer_fd < 0 || blink_fd < 0 || listen_fd < 0) {
+        perror("Socket/timer setup failed");
+        return 1;
+    }
+
+    r = sd_bus_add_match(bus, NULL,
+                         "type='signal',sender='org.freedesktop.DBus',"
+                         "member='NameOwnerChanged',arg0='" BLUEZ_SERVICE "'",
+                         on_owner_changed, NULL);
+    for (int i = 0; i < N_SPEAKERS && r >= 0; i++) {
+        speakers[i].mac = speaker_macs[i];
+        device_path(speakers[i].path, sizeof(speakers[i].path), speaker_macs[i]);
+        r = sd_bus_match_signal(bus, NULL, BLUEZ_SERVICE, speakers[i].path,
+                                "org.freedesktop.DBus.Properties", "PropertiesChanged",
+                                on_properties_changed, &speakers[i]);
+    }
+    if (r < 0) {
+        fprintf(stderr, "Failed to subscribe to BlueZ signals: %s\n", strerror(-r));
+        return 1;
+    }
+
+    // Subscribed first, so a change during the initial query cannot be missed
+    for (int i = 0; i < N_SPEAKERS; i++)
+        speakers[i].connected = query_connected(&speakers[i]);
+    if (led)
+        gpiod_line_set_value(led, any_connected());
+    if (!any_connected()) {
+        printf("Attempting initial connection...\n");
+        reconnect_all();
+        schedule_retry();
+    }
+
+    for (;;) {
+        struct pollfd fds[5 + MAX_CLIENTS];
+        int nfds = 0;
+
+        while ((r = sd_bus_process(bus, NULL)) > 0)
+            ;
+        if (r < 0) {
+            fprintf(stderr, "Bus error: %s\n", strerror(-r));
+            break;
+        }
+
+        fds[nfds++] = (struct pollfd){ .fd = sd_bus_get_fd(bus), .events = sd_bus_get_events(bus) };
+        fds[nfds++] = (struct pollfd){ .fd = timer_fd, .events = POLLIN };
+        fds[nfds++] = (struct pollfd){ .fd = listen_fd, .events = POLLIN };
+        fds[nfds++] = (struct pollfd){ .fd = button ? gpiod_line_event_get_fd(button) : -1, .events = POLLIN };
+        fds[nfds++] = (struct pollfd){ .fd = blink_fd, .events = POLLIN };
+        for (int i = 0; i < n_clients; i++)
+            fds[nfds++] = (struct pollfd){ .fd = clients[i], .events = POLLIN };
+
+        if (poll(fds, nfds, bus_poll_timeout()) < 0) {
+            if (errno == EINTR)
+                continue;
+            perror("poll failed");
+            break;
+        }
+
+        if (fds[1].revents & POLLIN) {
+            uint64_t expirations;
+            if (read(timer_fd, &expirations, sizeof(expirations)) > 0 && !any_connected()) {
+                reconnect_all();
+                schedule_retry();
+            }
+        }
+
+        if (fds[2].revents & POLLIN)
+            accept_client(listen_fd);
+
+        if (fds[3].revents & POLLIN) {
+            struct gpiod_line_event event;
+            if (gpiod_line_event_read(button, &event) == 0) {
+                long long now_ms = (long long)event.ts.tv_sec * 1000 + event.ts.tv_nsec / 1000000;
+                if (now_ms - last_press_ms >= DEBOUNCE_MS) {
+                    last_press_ms = now_ms;
+                    printf("Button pressed: reconnecting...\n");
+                    retry_delay = RETRY_MIN;
+                    reconnect_all();
+                }
+            }
+        }
+
+        if (fds[4].revents & POLLIN) {
+            uint64_t expirations;
+            if (read(blink_fd, &expirations, sizeof(expirations)) > 0 && blink_step >= 0) {
+                blink_step++;
+                show_blink_step();
+            }
+        }
+
+        // Walk backwards: drop_client() moves the last client into the freed slot
+        for (int i = nfds - 1; i >= 5; i--) {
+            if (fds[i].revents && !handle_client(fds[i].fd))
+                drop_client(i - 5);
+        }
+    }
+
+    sd_bus_unref(bus);
+    if (chip)
+        gpiod_chip_close(chip);
+    return 1;
+}
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Client side of bt_daemon: keeps track of the Bluetooth speaker state.
+
+A background thread stays subscribed to the daemon's Unix socket (and
+reconnects if the daemon restarts). The game asks `speaker_connected` before
+playing a prompt and can block on `wait_connected()` instead of talking into
+a dead speaker.
+"""
+
+import os
+import socket
+import threading
+import time
+
+SOCKET_PATH = os.environ.get("BT_DAEMON_SOCKET", "/run/clavier-bt.sock")
+RETRY_DELAY = 2.0   # seconds between attempts to reach the daemon
+
+
+class BluetoothStatus:
+
+    def __init__(self, path=SOCKET_PATH, on_change=None):
+        self.path = path
+        self.on_change = on_change      # called with (mac, connected) from the reader thread
+        self.speakers = {}              # mac -> connected
+        self.daemon_running = False
+        self._ready = threading.Event() # set while a speaker is usable
+        self._ready.set()               # no daemon yet: don't hold the game
+        self._sock = None
+        self._thread = threading.Thread(target=self._run, name="bt-status", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def speaker_connected(self):
+        return self._ready.is_set()
+
+    def wait_connected(self, timeout=None):
+        """Blocks until a speaker is connected. Returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def reconnect(self):
+        """Asks the daemon to reconnect now (same as the button)."""
+        try:
+            if self._sock is not None:
+                self._sock.sendall(b"reconnect\n")
+        except OSError:
+            pass
+
+    def _update(self):
+        # Without the daemon we know nothing, assume the speaker works
+        if not self.daemon_running or any(self.speakers.values()):
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    def _run(self):
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    self._sock = sock
+                    self.daemon_running = True
+                    for line in sock.makefile("r"):
+                        state, _, mac = line.strip().partition(" ")
+                        if state not in ("connected", "disconnected"):
+                            continue
+                        connected = state == "connected"
+                        changed = self.speakers.get(mac) != connected
+                        self.speakers[mac] = connected
+                        self._update()
+                        if changed and self.on_change is not None:
+                            self.on_change(mac, connected)
+            except OSError:
+                pass
+            self._sock = None
+            self.daemon_running = False
+            self.speakers.clear()
+            self._update()
+            time.sleep(RETRY_DELAY)
+
+
+if __name__ == "__main__":
+    status = BluetoothStatus(on_change=lambda mac, c: print(mac, "connected" if c else "disconnected"))
+    status.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
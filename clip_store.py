@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Decoded clips shared between processes, in tmpfs.
+
+Decoding an mp3 costs tens of milliseconds on the Pi; reading its PCM back
+from /dev/shm is a memcpy. The store keeps the raw PCM of every clip
+decoded by the game or the audio server, so whichever process starts next
+(a restarted game, a restarted server) begins with a warm cache. It lives
+in RAM only: a reboot starts from the SD card again.
+
+A clip is keyed by its path, and versioned by its mtime, size, the sample
+format and the decoder that made the PCM: an updated mp3, another mixer
+format or another backend's decoder is decoded again, and the stale
+version is removed when the new one is stored. Empty PCM is never stored.
+"""
+
+import glob
+import hashlib
+import os
+
+import event_log
+
+STORE_DIR = os.environ.get("CLAVIER_CLIP_STORE", "/dev/shm/clavier-clips")
+MAX_BYTES = int(os.environ.get("CLAVIER_CLIP_STORE_MB", "128")) * 1024 * 1024
+
+
+class ClipStore:
+
+    def __init__(self, directory=STORE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._full = False
+
+    def _paths(self, filepath, fmt, decoder):
+        """(path of the current version, glob of every version), None if the clip is unreadable."""
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        clip_id = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:16]
+        version = hashlib.sha1(f"{st.st_mtime_ns}:{st.st_size}:{tuple(fmt)}:{decoder}".encode()).hexdigest()[:8]
+        return (os.path.join(self.directory, f"{clip_id}-{version}.pcm"),
+                os.path.join(self.directory, f"{clip_id}-*.pcm"))
+
+    def get(self, filepath, fmt, decoder):
+        """Raw PCM of `filepath` in `fmt` made by `decoder`, or None if it has not been stored."""
+        paths = self._paths(filepath, fmt, decoder)
+        if paths is None:
+            return None
+        try:
+            with open(paths[0], "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, filepath, fmt, decoder, data):
+        if not data:
+            return      # a backend that decodes nothing: another one would read silence
+        paths = self._paths(filepath, fmt, decoder)
+        if paths is None or self._full:
+            return
+        if self.size() + len(data) > self.max_bytes:
+            self._full = True
+            event_log.warning("clip_store_full", directory=self.directory, mb=self.max_bytes // (1024 * 1024))
+            return
+        path, versions = paths
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)   # another process never reads half a clip
+            for old in glob.glob(versions):
+                if old != path:
+                    os.unlink(old)
+        except OSError as e:
+            event_log.warning("clip_store_failed", clip=filepath, error=e)
+
+    def size(self):
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.directory))
+        except OSError:
+            return 0
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-key adaptive debounce.
+
+Every accepted press records how long its contact took to settle (time from
+the first edge to the last bounce). From the histogram of these settle times
+each key gets its own window: the 99th percentile times SAFETY_MARGIN,
+clamped between DEBOUNCE_MIN and DEBOUNCE_MAX. Good switches answer in a
+couple of milliseconds, worn ones wait long enough not to double-fire.
+
+A key's histogram is halved whenever it holds HISTORY presses, so the window
+follows the switch as it wears instead of its whole life. A settle time as
+long as the window itself is only a lower bound (a later bounce would have
+come after the sampling stopped): it is counted apart, and a key with more
+than 1% of those goes back to DEBOUNCE_MAX to be measured again from scratch.
+"""
+
+DEBOUNCE_MIN = 0.002        # s, never trust a contact faster than this
+DEBOUNCE_MAX = 0.05         # s, the old global DEBOUNCE
+SAFETY_MARGIN = 1.5
+MIN_SAMPLES = 20            # presses needed before a key leaves DEBOUNCE_MAX
+RETUNE_EVERY = 50           # presses between two recomputations
+HISTORY = 200               # presses a key's histogram holds before it is halved
+BUCKET = 0.001              # 1 ms histogram buckets
+N_BUCKETS = int(DEBOUNCE_MAX / BUCKET) + 1  # last bucket = "50 ms or more"
+
+
+class AdaptiveDebounce:
+
+    def __init__(self, keys, config=None):
+        config = config or {}
+        windows = config.get("debounce", {})
+        hists = config.get("debounce_hist", {})
+        capped = config.get("debounce_capped", {})
+        self.windows = {key: windows.get(key, DEBOUNCE_MAX) for key in keys}
+        self.hists = {}
+        for key in keys:
+            hist = hists.get(key)
+            self.hists[key] = list(hist) if hist and len(hist) == N_BUCKETS else [0] * N_BUCKETS
+        self.capped = {key: capped.get(key, 0) for key in keys}   # settle times cut by the window
+        self._since_retune = 0
+
+    def window(self, key):
+        return self.windows.get(key, DEBOUNCE_MAX)
+
+    def record(self, key, settle_time):
+        """Counts one settle time. Returns True when the windows were just recomputed."""
+        hist = self.hists.get(key)
+        if hist is None:
+            return False
+        if settle_time >= self.windows[key]:
+            self.capped[key] += 1
+        else:
+            hist[min(int(settle_time / BUCKET), N_BUCKETS - 1)] += 1
+        if sum(hist) + self.capped[key] >= HISTORY:
+            hist[:] = [count / 2 for count in hist]
+            self.capped[key] /= 2
+        self._since_retune += 1
+        if self._since_retune >= RETUNE_EVERY:
+            self.retune()
+            return True
+        return False
+
+    def retune(self):
+        self._since_retune = 0
+        for key, hist in self.hists.items():
+            total = sum(hist)
+            if total + self.capped[key] < MIN_SAMPLES:
+                continue
+            if self.capped[key] > 0.01 * (total + self.capped[key]):
+                # The window hides the tail: widen it and measure again from scratch
+                self.windows[key] = DEBOUNCE_MAX
+                hist[:] = [0] * N_BUCKETS
+                self.capped[key] = 0
+                continue
+            seen = 0
+            for i, count in enumerate(hist):
+                seen += count
+                if seen >= 0.99 * total:
+                    break
+            p99 = (i + 1) * BUCKET      # upper edge of the bucket
+            self.windows[key] = min(DEBOUNCE_MAX, max(DEBOUNCE_MIN, p99 * SAFETY_MARGIN))
+
+    def to_config(self, config):
+        config["debounce"] = {key: round(w, 4) for key, w in self.windows.items()}
+        config["debounce_hist"] = {key: [round(c, 3) for c in hist] for key, hist in self.hists.items()}
+        config["debounce_capped"] = {key: round(c, 3) for key, c in self.capped.items()}
+        return config
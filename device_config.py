@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Per-device settings that the box learns or that differ between builds
+(per-key debounce windows...), kept in a small JSON file next to the game.
+"""
+
+import json
+import os
+
+CONFIG_PATH = os.environ.get("CLAVIER_CONFIG", "device_config.json")
+
+
+def load_config(path=CONFIG_PATH):
+    """Returns the saved settings, or {} if there are none (or the file is damaged)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_config(config, path=CONFIG_PATH):
+    """Writes the settings atomically: a power cut leaves either the old or the new file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Short synthesised feedback sounds ("earcons"): chime for a right answer,
+buzz for a wrong one, tick to acknowledge any other key.
+
+They are computed with NumPy at startup, in the output's own sample format,
+and handed to AudioOutput as in-memory clips: firing one is a single
+channel start on the reserved earcon channel, no file, no decoding. The
+spoken feedback that follows is layered on top.
+
+Without NumPy the game simply has no earcons.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import event_log
+
+EARCON_VOLUME = 0.35    # of full scale, under the speech
+
+
+def _envelope(n, rate, attack=0.003, decay=None):
+    """Linear attack then exponential decay (time constant `decay` s), or a short release."""
+    t = np.arange(n) / rate
+    env = np.minimum(1.0, t / attack)
+    if decay is not None:
+        env *= np.exp(-t / decay)
+    else:
+        release = int(0.01 * rate)
+        env[-release:] *= np.linspace(1.0, 0.0, release)
+    return env
+
+
+def chime(rate):
+    """Two bright notes going up (C6 then E6)."""
+    n = int(0.25 * rate)
+    t = np.arange(n) / rate
+    first = np.sin(2 * np.pi * 1047 * t) * _envelope(n, rate, decay=0.06)
+    second = np.zeros(n)
+    offset = int(0.07 * rate)
+    second[offset:] = np.sin(2 * np.pi * 1319 * t[:n - offset]) * _envelope(n - offset, rate, decay=0.08)
+    return 0.5 * first + 0.6 * second
+
+
+def buzz(rate):
+    """Low, rough and short: odd harmonics of 150 Hz."""
+    n = int(0.18 * rate)
+    t = np.arange(n) / rate
+    wave = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in (1, 3, 5, 7))
+    return 0.6 * wave * _envelope(n, rate, attack=0.005)
+
+
+def tick(rate):
+    """A dry click."""
+    n = int(0.012 * rate)
+    t = np.arange(n) / rate
+    return np.sin(2 * np.pi * 2200 * t) * _envelope(n, rate, attack=0.0005, decay=0.002)
+
+
+SYNTHS = {"chime": chime, "buzz": buzz, "tick": tick}
+
+
+def to_pcm(mono, fmt, volume=EARCON_VOLUME):
+    """Raw PCM bytes of a float signal in [-1, 1] in the (frequency, size, channels) format."""
+    frequency, size, channels = fmt
+    signal = np.clip(mono * volume, -1.0, 1.0)
+    if size == 32:
+        samples = signal.astype(np.float32)
+    else:
+        bits = abs(size)
+        full = 2 ** (bits - 1) - 1
+        if size < 0:
+            samples = (signal * full).astype({8: np.int8, 16: np.int16}[bits])
+        else:
+            samples = (signal * full + full + 1).astype({8: np.uint8, 16: np.uint16}[bits])
+    return np.repeat(samples, channels).tobytes()  # interleaved, same on every channel
+
+
+class Earcons:
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.names = set()
+
+    def build(self):
+        """Synthesises every earcon into the audio clip cache. Call after audio.init()."""
+        if np is None:
+            event_log.info("earcons_disabled", reason="numpy not installed")
+            return
+        if not self.audio.available:
+            return
+        fmt = self.audio.sample_format
+        for name, synth in SYNTHS.items():
+            self.audio.add_clip("earcon:" + name, to_pcm(synth(fmt[0]), fmt))
+            self.names.add(name)
+
+    def play(self, name):
+        """Fires an earcon without waiting for it (a no-op if it could not be built)."""
+        if name in self.names:
+            self.audio.fire("earcon:" + name)
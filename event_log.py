@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Structured event log written by a background thread.
+
+    event_log.info("play", clip=filepath)
+    event_log.warning("clip_missing", clip=filepath)
+
+The game thread only puts a tuple on a bounded queue (never blocks: when
+the queue is full the event is dropped and counted). The writer thread
+formats one line per event and sends it to:
+- the console (stdout: serial console or journald), from CONSOLE_LEVEL up,
+  in one write per batch;
+- a ring buffer in a tmpfs file (RING_PATH), every level, so the last
+  RING_SIZE bytes survive a crash of the game without wearing the SD card;
+- the persistent log (LOG_PATH), from FILE_LEVEL up, appended and fsync'ed
+  in batches every FLUSH_INTERVAL seconds or FLUSH_LINES lines.
+
+Repeated warnings (same event and fields) are rate limited: RATE_BURST per
+RATE_WINDOW seconds, then a single line with the number suppressed.
+
+Importing the module starts nothing: the process that owns the log (the
+game, the audio server) calls start() in its startup path. Until then
+events only go to the console, and the last EARLY_EVENTS of them are
+replayed into the ring and the file once the log starts. A tool that
+imports a game module never touches the running game's ring.
+
+The previous run's ring is kept as RING_PATH + ".prev". Read it after a
+crash with `python3 event_log.py /dev/shm/clavier.log.prev`.
+"""
+
+import atexit
+import collections
+import mmap
+import os
+import queue
+import sys
+import threading
+import time
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARN", ERROR: "ERROR"}
+_LEVELS_BY_NAME = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "WARN": WARNING, "ERROR": ERROR}
+
+CONSOLE_LEVEL = _LEVELS_BY_NAME.get(os.environ.get("CLAVIER_LOG_LEVEL", "INFO").upper(), INFO)
+FILE_LEVEL = INFO
+RING_PATH = os.environ.get("CLAVIER_LOG_RING", "/dev/shm/clavier.log")
+RING_SIZE = 256 * 1024
+LOG_PATH = os.environ.get("CLAVIER_LOG_FILE", "logs/clavier.log")
+MAX_FILE_SIZE = 1024 * 1024     # then clavier.log -> clavier.log.1
+FLUSH_INTERVAL = 10.0
+FLUSH_LINES = 256
+QUEUE_SIZE = 4096
+RATE_WINDOW = 60.0
+RATE_BURST = 3
+RATE_KEYS = 1024                # rate-limited keys kept before the expired ones are pruned
+EARLY_EVENTS = 256              # events kept for replay until start()
+
+_RING_HEADER = 16               # write position as ASCII digits + newline
+
+
+class RingSink:
+    """Fixed-size circular log file, memory-mapped (meant for tmpfs)."""
+
+    def __init__(self, path, size=RING_SIZE):
+        self.size = size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, _RING_HEADER + size)
+            self._map = mmap.mmap(fd, _RING_HEADER + size)
+        finally:
+            os.close(fd)
+        self.pos = 0
+        self._map[:_RING_HEADER] = b"%15d\n" % 0
+
+    def write(self, data):
+        data = data[-self.size:]
+        first = min(len(data), self.size - self.pos)
+        start = _RING_HEADER + self.pos
+        self._map[start:start + first] = data[:first]
+        rest = len(data) - first
+        if rest:
+            self._map[_RING_HEADER:_RING_HEADER + rest] = data[first:]
+        self.pos = (self.pos + len(data)) % self.size
+        self._map[:_RING_HEADER] = b"%15d\n" % self.pos
+
+    def close(self):
+        self._map.close()
+
+
+def read_ring(path=RING_PATH):
+    """Contents of a ring file, oldest line first."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = int(data[:_RING_HEADER])
+    body = data[_RING_HEADER:]
+    ordered = (body[pos:] + body[:pos]).lstrip(b"\0")
+    if body[pos:pos + 1] not in (b"\0", b""):
+        ordered = ordered.partition(b"\n")[2]  # first line was partly overwritten
+    return ordered.decode("utf-8", "replace")
+
+
+def _format(ts, level, event, fields):
+    stamp = time.strftime("%H:%M:%S", time.localtime(ts)) + f".{int(ts % 1 * 1000):03d}"
+    parts = [stamp, LEVEL_NAMES.get(level, str(level)), event]
+    for key, value in fields.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        else:
+            value = str(value)
+            if " " in value or not value:
+                value = '"' + value.replace('"', "'") + '"'
+        parts.append(f"{key}={value}")
+    return " ".join(parts) + "\n"
+
+
+class EventLog:
+
+    def __init__(self, log_path=LOG_PATH, ring_path=RING_PATH, console=sys.stdout,
+                 console_level=CONSOLE_LEVEL):
+        self.log_path = log_path
+        self.console = console
+        self.console_level = console_level
+        self.dropped = 0                # events lost because the queue was full
+        self._closed = False
+        self._queue = queue.SimpleQueue()   # no lock dance on put, bounded by hand below
+        self._ring_path = ring_path
+        self._ring = None               # opened on the first event
+        self._pending = []              # lines waiting for the next file flush
+        self._last_flush = time.monotonic()
+        self._rates = {}                # key -> [window start, count]
+        self._suppressed = []           # counts of pruned windows, written with the next batch
+        self._writer = threading.Thread(target=self._write_loop, name="event-log", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # --- Game thread ---
+
+    def log(self, level, event, **fields):
+        if self._closed:  # shutting down: write directly, nobody reads the queue any more
+            if level >= self.console_level and self.console is not None:
+                self.console.write(_format(time.time(), level, event, fields))
+            return
+        if self._queue.qsize() >= QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._queue.put((time.time(), level, event, fields, True))
+
+    def replay(self, items):
+        """Events (ts, level, event, fields) already shown on the console: ring and file only."""
+        for ts, level, event, fields in items:
+            self._queue.put((ts, level, event, fields, False))
+
+    def debug(self, event, **fields):
+        self.log(DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(ERROR, event, **fields)
+
+    def close(self):
+        """Writes everything still queued, flushes the file and stops the writer."""
+        if self._writer.is_alive() and not self._closed:
+            self._queue.put(None)
+            self._writer.join()
+        self._closed = True
+
+    # --- Writer thread ---
+
+    def _allowed(self, ts, level, event, fields):
+        """Rate limit; returns (emit?, number suppressed since the last emitted one)."""
+        if level < WARNING:
+            return True, 0
+        if len(self._rates) >= RATE_KEYS:
+            self._prune_rates(ts)
+        key = (event, tuple(fields.items()))
+        rate = self._rates.get(key)
+        if rate is None or ts - rate[0] >= RATE_WINDOW:
+            suppressed = max(0, rate[1] - RATE_BURST) if rate else 0
+            self._rates[key] = [ts, 1]
+            return True, suppressed
+        rate[1] += 1
+        return rate[1] <= RATE_BURST, 0
+
+    def _prune_rates(self, ts):
+        """Forgets the expired windows, then the oldest ones if that is not enough,
+        reporting what they suppressed."""
+        keys = [key for key, (start, _) in self._rates.items() if ts - start >= RATE_WINDOW]
+        if len(self._rates) - len(keys) >= RATE_KEYS // 2:
+            keys = list(self._rates)[:len(self._rates) - RATE_KEYS // 2]  # oldest first
+        for key in keys:
+            start, count = self._rates.pop(key)
+            if count > RATE_BURST:
+                event, fields = key
+                self._suppressed.append((ts, WARNING, event, dict(fields, suppressed=count - RATE_BURST)))
+
+    def _write_loop(self):
+        running = True
+        while running:
+            timeout = max(0.0, self._last_flush + FLUSH_INTERVAL - time.monotonic())
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < QUEUE_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+
+            console, ring = [], []
+            for item in batch:
+                if item is None:
+                    continue
+                ts, level, event, fields, to_console = item
+                emit, suppressed = self._allowed(ts, level, event, fields)
+                if not emit:
+                    continue
+                if suppressed:
+                    fields = dict(fields, suppressed=suppressed)
+                line = _format(ts, level, event, fields)
+                ring.append(line)
+                if to_console and level >= self.console_level:
+                    console.append(line)
+                if level >= FILE_LEVEL:
+                    self._pending.append(line)
+            for ts, level, event, fields in self._suppressed:
+                line = _format(ts, level, event, fields)
+                console.append(line)
+                ring.append(line)
+                self._pending.append(line)
+            self._suppressed.clear()
+            if self.dropped:
+                line = _format(time.time(), WARNING, "log_dropped", {"count": self.dropped})
+                self.dropped = 0
+                console.append(line)
+                ring.append(line)
+                self._pending.append(line)
+
+            try:
+                if console and self.console is not None:
+                    self.console.write("".join(console))
+                    self.console.flush()
+            except (OSError, ValueError):
+                pass
+            if ring and self._open_ring():
+                self._ring.write("".join(ring).encode())
+            if (not running or len(self._pending) >= FLUSH_LINES
+                    or time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+                self._flush_file()
+
+    def _open_ring(self):
+        if self._ring is None and self._ring_path:
+            try:
+                if os.path.exists(self._ring_path):  # keep the previous run's ring for post-mortem
+                    os.replace(self._ring_path, self._ring_path + ".prev")
+                self._ring = RingSink(self._ring_path)
+            except OSError:
+                self._ring_path = None  # no tmpfs: console and file only
+        return self._ring is not None
+
+    def _flush_file(self):
+        self._last_flush = time.monotonic()
+        if not self._pending or not self.log_path:
+            return
+        data, self._pending = "".join(self._pending), []
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > MAX_FILE_SIZE:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            try:
+                self.console.write(f"Error writing {self.log_path}: {e}\n")
+            except (OSError, ValueError, AttributeError):
+                pass
+
+
+_log = None                     # EventLog of this process, created by start()
+_early = collections.deque(maxlen=EARLY_EVENTS)    # (ts, level, event, fields) logged before start()
+
+
+def start(**kwargs):
+    """Starts the writer thread of this process's log (ring, file, console). Idempotent."""
+    global _log
+    if _log is None:
+        _log = EventLog(**kwargs)
+        _log.replay(_early)
+        _early.clear()
+    return _log
+
+
+def log(level, event, **fields):
+    if _log is not None:
+        _log.log(level, event, **fields)
+        return
+    ts = time.time()
+    _early.append((ts, level, event, fields))
+    if level >= CONSOLE_LEVEL:
+        try:
+            sys.stdout.write(_format(ts, level, event, fields))
+        except (OSError, ValueError):
+            pass
+
+
+def debug(event, **fields):
+    log(DEBUG, event, **fields)
+
+
+def info(event, **fields):
+    log(INFO, event, **fields)
+
+
+def warning(event, **fields):
+    log(WARNING, event, **fields)
+
+
+def error(event, **fields):
+    log(ERROR, event, **fields)
+
+
+def close():
+    if _log is not None:
+        _log.close()
+
+
+if __name__ == "__main__":
+    sys.stdout.write(read_ring(sys.argv[1] if len(sys.argv) > 1 else RING_PATH))
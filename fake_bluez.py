@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Fake BlueZ device on the session bus, to test bt_daemon without a radio.
+
+It owns org.bluez, exports /org/bluez/hci0/dev_<MAC> with org.bluez.Device1
+and flips its Connected property (sending PropertiesChanged) every time
+Enter is pressed, or every --period seconds.
+
+    dbus-run-session -- sh -c 'BT_DAEMON_SOCKET=/tmp/bt.sock ./bt_daemon --session & python3 fake_bluez.py'
+    BT_DAEMON_SOCKET=/tmp/bt.sock python3 bt_status.py   # in another terminal
+
+Needs PyGObject (python3-gi), installed by default on Raspberry Pi OS.
+"""
+
+import argparse
+import sys
+
+from gi.repository import Gio, GLib
+
+DEVICE_XML = """
+<node>
+  <interface name="org.bluez.Device1">
+    <property name="Address" type="s" access="read"/>
+    <property name="Connected" type="b" access="read"/>
+  </interface>
+</node>
+"""
+
+
+class FakeDevice:
+
+    def __init__(self, mac, connected=False):
+        self.mac = mac
+        self.path = "/org/bluez/hci0/dev_" + mac.replace(":", "_")
+        self.connected = connected
+        self.connection = None
+
+    def on_bus_acquired(self, connection, name):
+        self.connection = connection
+        info = Gio.DBusNodeInfo.new_for_xml(DEVICE_XML).interfaces[0]
+        connection.register_object(self.path, info, None, self.get_property, None)
+        print(f"Fake device {self.path} ready (connected={self.connected})")
+
+    def get_property(self, connection, sender, path, interface, name):
+        if name == "Connected":
+            return GLib.Variant("b", self.connected)
+        return GLib.Variant("s", self.mac)
+
+    def toggle(self, *args):
+        self.connected = not self.connected
+        changed = {"Connected": GLib.Variant("b", self.connected)}
+        self.connection.emit_signal(None, self.path, "org.freedesktop.DBus.Properties",
+                                    "PropertiesChanged",
+                                    GLib.Variant("(sa{sv}as)", ("org.bluez.Device1", changed, [])))
+        print(f"Connected -> {self.connected}")
+        return True  # keep the GLib source alive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("mac", nargs="?", default="3C:B0:ED:C3:89:4B")
+    parser.add_argument("--connected", action="store_true", help="start connected")
+    parser.add_argument("--period", type=float, help="toggle automatically every N seconds")
+    args = parser.parse_args()
+
+    device = FakeDevice(args.mac, args.connected)
+    Gio.bus_own_name(Gio.BusType.SESSION, "org.bluez", Gio.BusNameOwnerFlags.NONE,
+                     device.on_bus_acquired, None, None)
+
+    if args.period:
+        GLib.timeout_add(int(args.period * 1000), device.toggle)
+    else:
+        def on_enter(source, condition):
+            if not sys.stdin.readline():
+                return False  # EOF, stop watching stdin
+            return device.toggle()
+        GLib.io_add_watch(sys.stdin, GLib.IO_IN, on_enter)
+
+    try:
+        GLib.MainLoop().run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Always-on flight recorder: the last CAPACITY events of the game in memory.
+
+Each event is a fixed 20-byte record (perf_counter_ns timestamp, event
+type, string id, two integers) packed into a bytearray allocated once at
+startup. Strings (keys, clip names, levels) are stored once in a string
+table and referenced by id, so recording an event is a struct.pack_into
+and never grows anything on the hot path.
+
+dump() writes the ring to a compact binary file. The game dumps it on an
+unhandled exception, on SIGUSR1 and when the watchdog trips. Decode a dump
+into a readable timeline with:
+
+    python3 flight_recorder.py logs/flight-*.bin
+"""
+
+import itertools
+import json
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+
+CAPACITY = 4096                 # events, ~80 KiB
+DUMP_DIR = "logs/"
+
+RECORD = struct.Struct("<qHHii")         # ts_ns, type, string id, a, b
+FILE_HEADER = struct.Struct("<4sHIQI")   # magic, version, capacity, events written, string table length
+MAGIC = b"CLFR"
+VERSION = 1
+
+# Event types (a and b meaning in the comment)
+KEY = 1             # key; settle time us
+PLAY = 2            # clip requested
+CLIP_START = 3      # audio device; press-to-sound us (-1 if not a reaction to a key)
+STATE = 4           # state name (level, menu, speaker...)
+TIMEOUT = 5         # item that timed out
+TIMING = 6          # name; duration us
+STALL = 7           # active span; stall duration ms
+ERROR = 8           # exception type
+DUMP = 9            # reason
+
+EVENT_NAMES = {KEY: "KEY", PLAY: "PLAY", CLIP_START: "CLIP_START", STATE: "STATE",
+               TIMEOUT: "TIMEOUT", TIMING: "TIMING", STALL: "STALL", ERROR: "ERROR", DUMP: "DUMP"}
+
+
+class FlightRecorder:
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._ring = bytearray(RECORD.size * capacity)
+        self._counter = itertools.count()       # next() is atomic under the GIL
+        self._written = 0
+        self._ids = {"": 0}                     # string -> id
+        self._strings = [""]
+        self._lock = threading.RLock()          # new strings and dumps; RLock: SIGUSR1 runs on the main thread
+
+    def _string_id(self, text):
+        sid = self._ids.get(text)
+        if sid is None:
+            with self._lock:
+                sid = self._ids.get(text)
+                if sid is None:
+                    sid = self._ids[text] = len(self._strings)
+                    self._strings.append(text)
+        return sid
+
+    def record(self, etype, text="", a=0, b=0):
+        i = next(self._counter)
+        RECORD.pack_into(self._ring, (i % self.capacity) * RECORD.size,
+                         time.perf_counter_ns(), etype, self._string_id(text), a, b)
+        self._written = i + 1
+
+    def dump(self, reason, directory=DUMP_DIR):
+        """Writes the ring to directory/flight-<date>.bin and returns the path."""
+        self.record(DUMP, reason)
+        with self._lock:
+            ring = bytes(self._ring)
+            written = self._written
+            strings = json.dumps(self._strings).encode()
+        os.makedirs(directory, exist_ok=True)
+        # the event count keeps two dumps in the same second apart
+        path = os.path.join(directory, time.strftime("flight-%Y%m%d-%H%M%S") + f"-{written}.bin")
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION, self.capacity, written, len(strings)))
+            f.write(strings)
+            f.write(ring)
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def install(self, on_dump=None):
+        """Dumps on SIGUSR1 and on exceptions nobody caught (any thread).
+        `on_dump(path)` is called after each dump. Call from the main thread."""
+        def dump(reason):
+            try:
+                path = self.dump(reason)
+            except OSError:
+                return
+            if on_dump is not None:
+                on_dump(path)
+
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump("sigusr1"))
+
+        previous_hook = sys.excepthook
+        def excepthook(exc_type, exc, tb):
+            self.record(ERROR, exc_type.__name__)
+            dump("exception")
+            previous_hook(exc_type, exc, tb)
+        sys.excepthook = excepthook
+
+        previous_thread_hook = threading.excepthook
+        def thread_excepthook(args):
+            self.record(ERROR, args.exc_type.__name__)
+            dump(f"exception in {args.thread.name if args.thread else 'thread'}")
+            previous_thread_hook(args)
+        threading.excepthook = thread_excepthook
+
+
+def decode(path):
+    """Yields (seconds relative to the dump, type name, text, a, b), oldest first."""
+    with open(path, "rb") as f:
+        magic, version, capacity, written, strings_len = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a flight recorder dump")
+        strings = json.loads(f.read(strings_len))
+        ring = f.read(RECORD.size * capacity)
+    events = []
+    for i in range(max(0, written - capacity), written):
+        ts, etype, sid, a, b = RECORD.unpack_from(ring, (i % capacity) * RECORD.size)
+        events.append((ts, etype, strings[sid] if sid < len(strings) else f"#{sid}", a, b))
+    end = events[-1][0] if events else 0
+    for ts, etype, text, a, b in events:
+        yield (ts - end) / 1e9, EVENT_NAMES.get(etype, str(etype)), text, a, b
+
+
+recorder = FlightRecorder()
+record = recorder.record
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:]:
+        print(f"== {name}")
+        for rel, etype, text, a, b in decode(name):
+            extra = " ".join(str(v) for v in (a, b) if v)
+            print(f"{rel:+12.6f}s {etype:<10} {text} {extra}".rstrip())
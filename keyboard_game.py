@@ -2,13 +2,36 @@
 
 import RPi.GPIO as GPIO
 import time
-import pygame
 import os # To check for file existence
 import random
+import threading
+from collections import deque
+
+import event_log
+import flight_recorder
+import progress_store
+from rt_profile import RtProfile
+from latency import LatencyMonitor
+import metrics
+from debounce import AdaptiveDebounce
+from earcons import Earcons
+from device_config import load_config, save_config
+from audio import AudioOutput
+from audio_backends import DecodeError
+from audio_client import AudioClient
+from bt_status import BluetoothStatus
+from clip_store import ClipStore
+from scanner import ScannerError, ScannerProcess
+import self_test
+import session_log
+import stall_detector
+from scheduler import LeitnerScheduler, box_for
+from timers import TimerService
+import tracing
 
 # GPIO Pin Configuration (Adjust to your wiring!)
 
-DEBOUNCE = 0.05
+DEBOUNCE = 0.05 # upper bound, each key learns its own window (see debounce.py)
 
 ROW_PINS = [8, 10, 12, 16, 18]
 COL_PINS = [7, 11, 13, 15, 19, 21]
@@ -51,25 +74,57 @@ questions_dur = {
 # Debounce time (in seconds)
 DEBOUNCE_TIME = 0.02 # 20ms
 
+# Timeouts (in seconds)
+QUESTION_TIMEOUT = 30       # temps pour trouver la lettre
+REMINDER_DELAY = 10         # on repose la question après 10 s de silence
+INACTIVITY_TIMEOUT = 5 * 60 # retour au menu après 5 min sans appui
+CONFIRM_TIMEOUT = 5         # délai pour confirmer "4" une deuxième fois
+POLL_INTERVAL = 0.02        # only used if edge detection is unavailable
+
+MENU_KEYS = {'1', '2', '3', '4'}
+YES_NO_KEYS = {'1', '2'}    # 1 = oui, 2 = non
+
 # --- Audio Setup ---
 AUDIO_DIR = "audio/"
 EXPECTED_AUDIO_EXT = ".mp3"
+AMBIENCE_CLIP = "ambiance" # optional loop under the levels, ducked while speaking
+
+def local_audio():
+    """Our own mixer, clips still shared in /dev/shm. audio.available stays False if it cannot start."""
+    output = AudioOutput(store=ClipStore())
+    if output.init():
+        Earcons(output).build()
+    return output
+
+audio = AudioClient(fallback=local_audio) # the audio server keeps the mixer and the decoded clips across restarts
+if not audio.init():
+    audio = local_audio() # no server
+
+latency = LatencyMonitor() # key edge -> first sound, per level and audio device
+
+def on_clip_start(device, started_ns=None):
+    elapsed_us = latency.sound_started(device, started_ns)
+    flight_recorder.record(flight_recorder.CLIP_START, device, -1 if elapsed_us is None else elapsed_us)
 
-try:
-    pygame.mixer.init()
-    print("Pygame mixer initialized for audio playback.")
-except Exception as e:
-    print(f"Error initializing pygame mixer: {e}")
-    print("Audio playback will not be available.")
-    pygame = None # Disable pygame functions if init fails
+audio.on_start = on_clip_start
+
+WORK_SPANS = {"decode", "start", "debounce", "lookup"} # the other spans wait (clip, held key, level)
+
+def on_slow_span(name, duration_ns, arg):
+    if name in WORK_SPANS:
+        flight_recorder.record(flight_recorder.TIMING, f"{name} {arg}" if arg else name, duration_ns // 1000)
+
+tracing.tracer.on_slow = on_slow_span
+
+earcons = Earcons(audio) # synthesised chime / buzz / tick, fired on key press
+earcons.build()
 
 # --- GPIO Setup ---
 def setup_gpio():
     """Sets up the GPIO pins for the keyboard matrix with diodes - reversed approach."""
     GPIO.setmode(GPIO.BOARD)
     GPIO.setwarnings(False)
-
-    GPIO.setup(22, GPIO.OUT)
+    # Pin 22 (BCM 25) is the status LED: bt_daemon owns it, the self-test sends it its blink codes
 
     # For our reversed approach:
     # 1. Set all rows as outputs (initially LOW)
@@ -84,11 +139,54 @@ def setup_gpio():
     for c_pin in COL_PINS:
         GPIO.setup(c_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
         
-    print("GPIO setup complete.")
+    event_log.info("gpio_ready")
+
+# --- Metrics (curl --unix-socket /run/clavier-metrics.sock http://localhost/metrics) ---
+scans = metrics.counter("clavier_scans_total", "Matrix scans")
+presses = metrics.counter("clavier_presses_total", "Debounced key presses")
+missing_clips = metrics.counter("clavier_missing_clips_total", "Clips requested but not found")
+question_timeouts = metrics.counter("clavier_question_timeouts_total", "Questions left unanswered")
+questions_asked = metrics.counter("clavier_questions_total", "Questions asked")
+sessions_started = metrics.counter("clavier_sessions_total", "Sessions started or resumed")
+exporter = None # metrics.Exporter, started in __main__
 
 # --- Key Scanning ---
+SETTLE_SAMPLE = 0.0005 # s between two reads while a contact settles
+DEBOUNCE_SAVE_IDLE = 10 # s without a press before new debounce windows are written
+SCANNER_MODE = os.environ.get("CLAVIER_SCANNER", "inline") # "process": scan in a process of its own (scanner.py)
+
+config = load_config()
+debouncer = AdaptiveDebounce([key for row in KEY_MAP for key in row], config)
+
+def save_debounce():
+    try:
+        save_config(debouncer.to_config(config))
+    except OSError as e:
+        event_log.warning("debounce_save_failed", error=e)
+
+def settle(c_pin, window):
+    """Samples a column until it has not changed for `window` seconds.
+
+    Returns (final value, settle time from the first edge to the last bounce).
+    """
+    start = last_change = time.perf_counter()
+    value = 1
+    while True:
+        now = time.perf_counter()
+        if now - last_change >= window:
+            return value, last_change - start
+        if now - start > 2 * DEBOUNCE: # keeps chattering, take what we have
+            return value, now - start
+        time.sleep(SETTLE_SAMPLE)
+        current = GPIO.input(c_pin)
+        if current != value:
+            value = current
+            last_change = time.perf_counter()
+
+@tracing.traced("scan")
 def scan_keys() -> str | None:
     """Return first key detected, or None.  Never blocks for long."""
+    scans.inc()
     # make sure every row is LOW
     for r in ROW_PINS:
         GPIO.output(r, GPIO.LOW)
@@ -99,51 +197,339 @@ def scan_keys() -> str | None:
 
         for c_idx, c_pin in enumerate(COL_PINS):
             if GPIO.input(c_pin):           # column went HIGH
-                time.sleep(DEBOUNCE)        # debounce check
-                if GPIO.input(c_pin):       # still HIGH → accept
-                    key = KEY_MAP[r_idx][c_idx]
+                key = KEY_MAP[r_idx][c_idx]
+                # debounce check with this key's own window
+                with tracing.span("debounce", key):
+                    value, settle_time = settle(c_pin, debouncer.window(key))
+                if value:                   # still HIGH → accept
+                    presses.inc()
+                    flight_recorder.record(flight_recorder.KEY, key, int(settle_time * 1_000_000))
+                    if debouncer.record(key, settle_time):
+                        debounce_save.restart(DEBOUNCE_SAVE_IDLE) # windows were just recomputed
 
                     GPIO.output(r_pin, GPIO.LOW)   # **drop row now**
 
                     # wait (non-blocking) until key released
-                    t_start = time.time()
-                    while GPIO.input(c_pin):
-                        time.sleep(0.001)
-                        # safety timeout (2 s)
-                        if time.time() - t_start > 2:
-                            break
+                    with tracing.span("release_wait", key):
+                        stall_detector.idle() # the child holds the key as long as they like
+                        t_start = time.time()
+                        while GPIO.input(c_pin):
+                            time.sleep(0.001)
+                            # safety timeout (2 s)
+                            if time.time() - t_start > 2:
+                                break
+                        stall_detector.beat()
 
                     return key
         GPIO.output(r_pin, GPIO.LOW)        # next row
 
     return None
 
+# --- Waiting for Input ---
+# Between scans every row is held HIGH, so pressing any key raises its column.
+# A rising edge on a column wakes the waiting thread: the game sleeps until
+# either a key is pressed or the next timer deadline, never at a fixed rate.
+timers = TimerService()
+def on_inactivity():
+    flight_recorder.record(flight_recorder.STATE, "inactivity")
+    tracing.instant("inactivity")
+
+inactivity = timers.schedule(INACTIVITY_TIMEOUT, on_inactivity)
+# The config fsync waits for a pause of the child, never in the middle of a scan
+debounce_save = timers.schedule(DEBOUNCE_SAVE_IDLE, save_debounce)
+debounce_save.cancel() # armed by the next retune
+
+_key_edge = threading.Event()
+_edges_armed = False
+_edge_at = 0 # perf_counter_ns of the last rising edge, 0 = none since the wait started
+
+def _on_column_edge(channel):
+    global _edge_at
+    _edge_at = time.perf_counter_ns()
+    _key_edge.set()
+
+def setup_key_events():
+    """Enables rising-edge detection on every column."""
+    global _edges_armed
+    try:
+        for c_pin in COL_PINS:
+            GPIO.add_event_detect(c_pin, GPIO.RISING, callback=_on_column_edge)
+        _edges_armed = True
+    except RuntimeError as e:
+        event_log.warning("edge_detection_unavailable", error=e, fallback="polling")
+
+def arm_edges():
+    """Holds every row HIGH so that the next press raises a column edge."""
+    global _edge_at
+    _key_edge.clear()
+    _edge_at = 0
+    for r in ROW_PINS:
+        GPIO.output(r, GPIO.HIGH)
+    # A key that is already held down will not produce a new edge
+    if any(GPIO.input(c) for c in COL_PINS):
+        _key_edge.set()
+
+def wait_for_edge(timeout=None):
+    """Sleeps until a column goes HIGH or `timeout` seconds pass (None = forever)."""
+    if not _edges_armed:
+        time.sleep(POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL))
+        return
+    arm_edges()
+    _key_edge.wait(timeout)
+    # scan_keys() pulls the rows back LOW before probing
+
+_early_keys = deque() # (key, edge perf_counter_ns) pressed while a clip played
+
+def read_keys_while_playing():
+    """audio.on_wait: scans the presses made during a clip, next_key() returns them."""
+    if scan_process is not None or not _edges_armed:
+        return # the scanner process queues them itself; polling sees held keys only
+    if _key_edge.is_set():
+        pressed_at = _edge_at or time.perf_counter_ns()
+        key = scan_keys()
+        if key:
+            _early_keys.append((key, pressed_at))
+    arm_edges()
+
+audio.on_wait = read_keys_while_playing
+
+# --- Real-Time Profile (CLAVIER_RT=1, see rt_profile.py) ---
+rt = RtProfile.from_env()
+
+def apply_rt_profile():
+    """Affinity of the game and audio threads, real-time priority of the audio threads."""
+    for warning in rt.apply("game") + rt.apply_audio_threads():
+        event_log.warning("rt_profile_incomplete", reason=warning)
+
+def warm_clips(names):
+    """Decodes `names` now rather than at their first play. Beats after each clip: a long list is not a stall."""
+    if not (isinstance(audio, AudioOutput) and audio.available): # the audio server warms its own clips
+        return
+    for name in sorted(names):
+        filepath = os.path.join(AUDIO_DIR, name + EXPECTED_AUDIO_EXT)
+        if os.path.exists(filepath):
+            try:
+                audio.load(filepath)
+            except DecodeError as e:
+                event_log.warning("clip_decode_failed", clip=filepath, error=e)
+        stall_detector.beat()
+
+def rt_after_warmup():
+    """Decodes the menu's clips, then locks them in RAM and freezes the GC."""
+    if not rt.enabled:
+        return
+    warm_clips(level_clips("menu"))
+    for warning in rt.after_warmup():
+        event_log.warning("rt_profile_incomplete", reason=warning)
+    event_log.info("rt_profile", cpus={role: sorted(c) for role, c in rt.cpus.items()}, policy=rt.policy)
+
+def rt_warm_level(level):
+    """Decodes a level's clips before it starts and locks them with the rest."""
+    if not rt.enabled:
+        return
+    warm_clips(level_clips(level))
+    for warning in rt.lock():
+        event_log.warning("rt_profile_incomplete", reason=warning)
+
+# --- Scanner Process (CLAVIER_SCANNER=process) ---
+scan_process = None # ScannerProcess, started in __main__
+
+def start_scanner():
+    """Moves the matrix scan to its own process, or falls back to edge detection."""
+    global scan_process
+    cpu = os.environ.get("CLAVIER_SCANNER_CPU") # e.g. 0, else the RT profile's
+    priority = os.environ.get("CLAVIER_SCANNER_PRIORITY") # e.g. 50, else the RT profile's
+    cpus = {int(cpu)} if cpu else rt.cpus.get("scanner")
+    priority = int(priority) if priority else rt.priority("scanner")
+    process = ScannerProcess(ROW_PINS, COL_PINS, KEY_MAP, debouncer.window,
+                             cpus=cpus, priority=priority, policy=rt.sched_policy or os.SCHED_FIFO)
+    try:
+        for warning in process.start():
+            event_log.warning("scanner_tuning_failed", reason=warning)
+    except ScannerError as e:
+        event_log.error("scanner_failed", error=e, fallback="inline")
+        process.stop()
+        setup_key_events()
+        return
+    scan_process = process
+    event_log.info("scanner_started", cpus=sorted(cpus) if cpus else "any", priority=priority or "normal")
+
+def stop_scanner():
+    global scan_process
+    if scan_process is not None:
+        event_log.info("scanner_stats", **scan_process.stats())
+        scan_process.stop()
+        scan_process = None
+
+def scanner_key(timeout):
+    """Next key from the scanner process: (key, edge perf_counter_ns), or (None, None) on timeout."""
+    try:
+        event = scan_process.get(timeout)
+    except ScannerError as e:
+        event_log.error("scanner_failed", error=e, fallback="inline")
+        stop_scanner()
+        setup_key_events()
+        return None, None
+    if event is None:
+        return None, None
+    key, edge_ns, settle_us = event
+    presses.inc()
+    flight_recorder.record(flight_recorder.KEY, key, settle_us)
+    if debouncer.record(key, settle_us / 1_000_000):
+        debounce_save.restart(DEBOUNCE_SAVE_IDLE)
+        scan_process.set_windows(debouncer.window) # the scanner debounces with the new windows
+    return key, edge_ns
+
+def next_key():
+    """Waits for a key press or the next deadline, fires due timers, returns the key or None."""
+    stall_detector.idle() # waiting for a key is not a stall
+    if _early_keys:
+        key, pressed_at = _early_keys.popleft()
+        stall_detector.beat()
+    elif scan_process is not None:
+        key, pressed_at = scanner_key(timers.time_until_next())
+        stall_detector.beat()
+    else:
+        wait_for_edge(timers.time_until_next())
+        stall_detector.beat()
+        pressed_at = _edge_at or time.perf_counter_ns() # no edge: held key or polling
+        key = scan_keys()
+    timers.run_due()
+    if key:
+        inactivity.restart(INACTIVITY_TIMEOUT)
+        if debounce_save.active:
+            debounce_save.restart(DEBOUNCE_SAVE_IDLE)
+        latency.press(pressed_at)
+    return key
+
+def wait_for_key(timeout=None, allowed=None):
+    """Blocks until a key in `allowed` (any key if None) is pressed.
+
+    Returns the key, or None once `timeout` seconds have passed or the
+    inactivity timeout fires. Other timers keep firing while waiting.
+    """
+    deadline = timers.schedule(timeout, tracing.instant, "wait_timeout") if timeout is not None else None
+    watch_idle = not inactivity.fired   # don't bail out on an already expired timer
+    try:
+        while True:
+            key = next_key()
+            if key and (allowed is None or key in allowed):
+                earcons.play("tick")
+                return key
+            latency.cancel() # ignored key, no feedback coming
+            if deadline is not None and deadline.fired:
+                return None
+            if watch_idle and inactivity.fired:
+                return None
+    finally:
+        if deadline is not None:
+            deadline.cancel()
+
+def acknowledge(key, target):
+    """Earcon for an answer, fired before the game does anything else with the key."""
+    earcons.play("chime" if key == target else "tick" if key == '4' else "buzz")
+
+def on_question_timeout(item):
+    question_timeouts.inc()
+    flight_recorder.record(flight_recorder.TIMEOUT, item)
+    tracing.instant("timeout", item)
+
+def reset_timers():
+    """Drops every pending deadline (leftover reminders...) and re-arms inactivity."""
+    save_pending = debounce_save.active
+    timers.clear()
+    inactivity.restart(INACTIVITY_TIMEOUT)
+    if save_pending:
+        debounce_save.restart(DEBOUNCE_SAVE_IDLE)
+
+# --- Session Journal ---
+session = None # session_log.SessionLog, opened in __main__
+
+def log_event(etype, *fields, sync=False):
+    if etype == session_log.QUESTION:
+        questions_asked.inc()
+    if session is not None:
+        session.log(etype, *fields, sync=sync)
+
+def latency_ms(since):
+    return int((time.monotonic() - since) * 1000)
+
+# --- Progress Store ---
+progress = None # progress_store.ProgressStore, opened in __main__
+
+def record_attempt(target, word, key, rt_ms, kind="word"):
+    """Feeds the per-letter / per-word statistics (rt_ms=None on timeout).
+    Words are kept per level under `kind`: "word" for level 2, "word3" for level 3."""
+    if progress is None or key == '4':
+        return
+    hit = key == target
+    progress.record("letter", target, hit, rt_ms)
+    if word:
+        progress.record(kind, word, hit, rt_ms)
+
+def make_scheduler(kind, items):
+    """Leitner scheduler over `items`, starting boxes taken from the child's history."""
+    boxes = {}
+    if progress is not None:
+        boxes = {item: box_for(progress.stats(kind, item)) for item in items}
+    return LeitnerScheduler(items, boxes)
+
+# --- Bluetooth Speaker ---
+bluetooth = None # BluetoothStatus, subscribed to bt_daemon in __main__
+
+def on_speaker_change(mac, connected):
+    # Called from the bt_status thread: reroute audio right away
+    if connected:
+        audio.sink_back()
+    elif not bluetooth.speaker_connected:
+        audio.sink_lost()
+
+def wait_for_speaker():
+    """Pauses the game, timers included, while no speaker can be heard."""
+    if bluetooth is None or bluetooth.speaker_connected or audio.on_fallback:
+        return
+    event_log.info("speaker_lost", msg="jeu en pause")
+    flight_recorder.record(flight_recorder.STATE, "speaker_lost")
+    paused_at = time.monotonic()
+    stall_detector.idle()
+    bluetooth.wait_connected()
+    stall_detector.beat()
+    timers.shift(time.monotonic() - paused_at) # the child's turn was not wasted
+    event_log.info("speaker_back", paused_s=time.monotonic() - paused_at)
+    flight_recorder.record(flight_recorder.STATE, "speaker_back")
+
 # --- Audio Playback ---
+@tracing.traced("play_audio")
 def play_audio(base_filename):
-    time.sleep(0.05)
     """Plays an audio file from the AUDIO_DIR."""
-    if not pygame or not pygame.mixer.get_init():
-        print(f"Audio Disabled - Would play: {base_filename}")
+    flight_recorder.record(flight_recorder.PLAY, base_filename)
+    with tracing.span("sleep"):
+        time.sleep(0.05)
+    wait_for_speaker()
+    if not audio.available:
+        event_log.debug("play_skipped", clip=base_filename, reason="audio disabled")
         return
 
     # Construct filename (e.g., "a.mp3", "niveau_1.mp3")
     # Use lowercase and replace spaces/symbols if necessary in your actual files
-    filename = base_filename.lower() + EXPECTED_AUDIO_EXT
-    filepath = os.path.join(AUDIO_DIR, filename)
-
-    if not os.path.exists(filepath):
-        print(f"Warning: Audio file not found: {filepath}")
+    with tracing.span("lookup"):
+        filename = base_filename.lower() + EXPECTED_AUDIO_EXT
+        filepath = os.path.join(AUDIO_DIR, filename)
+        found = os.path.exists(filepath)
+
+    if not found:
+        missing_clips.inc()
+        event_log.warning("clip_missing", clip=filepath)
         return
 
-    try:
-        print(f"Playing: {filepath}")
-        sound = pygame.mixer.Sound(filepath)
-        sound.play()
-        # Wait for the sound to finish playing
-        while pygame.mixer.get_busy():
-            time.sleep(0.05) # Short sleep to avoid busy-waiting
-    except Exception as e:
-        print(f"Error playing audio file {filepath}: {e}")
+    event_log.debug("play", clip=filepath)
+    # Decoded once, replayed from the start on another device if the speaker drops
+    audio.play(filepath)
+
+def ambience(on):
+    """Starts or stops the ambience loop (nothing if there is no ambiance clip)."""
+    filepath = os.path.join(AUDIO_DIR, AMBIENCE_CLIP + EXPECTED_AUDIO_EXT)
+    audio.background(filepath if on and os.path.exists(filepath) else None)
 
 def play_letter(letter, neutral=False):
     if letter.upper() in ALPHABET:
@@ -152,42 +538,102 @@ def play_letter(letter, neutral=False):
         else:
             play_audio(letter.lower() + str(random.randint(0, 3)))
     else:
-        print(f"Warning: Letter {letter} invalid.")
+        event_log.warning("invalid_letter", letter=letter)
         
 def play_ou_est_lettre(letter) : 
     if letter.upper() in ALPHABET:
         play_audio("ou_est_la_lettre_" + letter.lower())
     else:
-        print(f"Warning: Letter {letter} invalid.")
+        event_log.warning("invalid_letter", letter=letter)
         
     
 def play_peux_tu_trouver_la_lettre(letter) : 
     if letter.upper() in ALPHABET:
         play_audio("peux_tu_trouver_la_lettre_" + letter.lower())
     else:
-        print(f"Warning: Letter {letter} invalid.")
+        event_log.warning("invalid_letter", letter=letter)
         
+def _repeat_word_question(prompt, word):
+    # Reminder used by levels 2 and 3 after a long silence
+    play_audio(prompt)
+    play_audio(word)
 
 
 # --- Game Levels ---
 
+LETTER_POSITIONS = (
+    "premiere_lettre", "deuxieme_lettre", "troisieme_lettre", "quatrieme_lettre",
+    "cinquieme_lettre", "sixieme_lettre", "septieme_lettre", "huitieme_lettre",
+    "neuvieme_lettre", "dixieme_lettre", "11eme_lettre", "12eme_lettre",
+)
+
+# Every fixed prompt the game can play, checked by the boot self-test
+PROMPTS = (
+    "appuie_sur_1_oui_2_non", "appuyez_sur_4_quitter_jeu", "appuyez_sur_touche_pour_lettre",
+    "au_revoir", "aucune_question_disponible", "bienvenue", "bravo", "bravo0", "bravo1",
+    "ca_cest_la_lettre", "cest_bien_la_lettre", "essaie_encore", "est", "felicitations",
+    "la_lettre", "menu_prompt_court", "niveau_1", "niveau_2", "niveau_3",
+    "niveau_questions_difficiles", "non", "non1", "non_configuree", "oui", "plus_de_questions",
+    "premiere_lettre_de", "retour_menu", "retour_menu_confirmer", "temps_ecoule", "touche",
+    "toutes_questions_repondues", "veux_tu_continuer",
+)
+
+# Clips the game refers to that were never recorded: play_audio() skips them
+# (clip_missing), the boot self-test does not count them. Remove a name once its clip ships.
+UNRECORDED = frozenset((
+    "bravo", "ca_cest_la_lettre", "est", "menu_prompt_court", "niveau_questions_difficiles",
+    "non_configuree", "premiere_lettre", "dixieme_lettre", "c2",
+    "bougie", "boulanger", "cinosaure", "jardin", "lamibulo", "orange", "oreiller",
+    "ronflement", "salamandre", "trottinette", "uniforme",
+))
+
+def audio_manifest():
+    """Names (without extension) of all the recorded clips play_audio() may be asked for."""
+    names = set(PROMPTS) | set(LETTER_POSITIONS)
+    for letter in ALPHABET:
+        letter = letter.lower()
+        names.add(letter)
+        names.update(letter + str(i) for i in range(4))
+        names.add("ou_est_la_lettre_" + letter)
+        names.add("peux_tu_trouver_la_lettre_" + letter)
+    names.update(word.lower() for word in questions)
+    names.update(word.lower() for word in questions_dur)
+    return names - UNRECORDED
+
+def level_clips(level):
+    """The recorded clips the menu ("menu") or a level ('1', '2', '3') plays."""
+    letters = [letter.lower() for letter in ALPHABET]
+    names = set(letters)
+    if level in ("menu", "1"):
+        names.update(letter + str(i) for letter in letters for i in range(4))
+    if level == "menu":
+        names.update(PROMPTS)
+    elif level == "1":
+        names.update("ou_est_la_lettre_" + letter for letter in letters)
+        names.update("peux_tu_trouver_la_lettre_" + letter for letter in letters)
+    elif level == "2":
+        names.update(word.lower() for word in questions)
+    elif level == "3":
+        names.update(LETTER_POSITIONS)
+        names.update(word.lower() for word in questions)
+        names.update(word.lower() for word in questions_dur)
+    return names - UNRECORDED
+
 # niveau default / passif 
 def level_0():
+    reset_timers()
     play_audio("appuyez_sur_touche_pour_lettre")
     play_audio("appuyez_sur_4_quitter_jeu")
     while True:
-        key = scan_keys()
+        key = next_key()
         if key:
-            if key == '1':
-                level_1()
-            elif key == '2':
-                level_2()   
-            elif key == '3':
-                level_3()
+            earcons.play("tick")
+            if key in LEVELS:
+                run_level(key)
             elif key == '4':
                 play_audio("retour_menu") 
                 play_audio("retour_menu_confirmer")
-                confirm = scan_keys()
+                confirm = wait_for_key(CONFIRM_TIMEOUT)
                 if confirm== '4' :
                     play_audio("au_revoir")
                     
@@ -197,8 +643,6 @@ def level_0():
             else:
                 play_letter(key, neutral=False) # Assumes "a.mp3", "b.mp3", etc. exist
 
-        time.sleep(0.02) # Small delay to prevent high CPU usage
-
     
 
 
@@ -217,31 +661,43 @@ def level_0():
 
 #        time.sleep(0.02) # Small delay to prevent high CPU usage
 
-def level_1():
+def level_1(resume=None):
+    reset_timers()
     play_audio("niveau_1")
     play_audio("appuyez_sur_touche_pour_lettre")
     play_audio("appuyez_sur_4_quitter_jeu")
     counter = 1
+    letters = make_scheduler("letter", ALPHABET)
+    target_letter = None
     while True: # Loop for multiple questions
-        target_letter = random.choice(ALPHABET)
+        # Les lettres ratées reviennent plus souvent que celles déjà connues
+        target_letter = letters.pick(avoid=target_letter)
         choice = random.randint(0,1)
         
         if choice == 0 :
             play_ou_est_lettre(target_letter) 
         elif choice == 1 :
             play_peux_tu_trouver_la_lettre(target_letter)
+        log_event(session_log.QUESTION, target_letter, "")
+        asked_at = time.monotonic()
             
-        start_time = time.time()
+        deadline = timers.schedule(QUESTION_TIMEOUT, on_question_timeout, target_letter) # Give 30 seconds to find
+        reminder = timers.schedule(REMINDER_DELAY, play_ou_est_lettre, target_letter,
+                                   interval=REMINDER_DELAY)
         found = False
+        missed = False
         timed_out = False
         while not found and not timed_out:
-            if time.time() - start_time > 30: # Give 30 seconds to find
-                timed_out = True
-                break
-
-            key = scan_keys()
+            key = next_key()
             if key:
+                acknowledge(key, target_letter)
+                reminder.restart()
+                rt_ms = latency_ms(asked_at)
+                log_event(session_log.KEY, key, rt_ms)
+                record_attempt(target_letter, "", key, rt_ms)
+                missed = missed or key != target_letter
                 if key == target_letter:
+                    log_event(session_log.OUTCOME, "hit", target_letter, "", sync=True)
                     if choice == 0:
                         play_audio("bravo0") # Needs "bravo.mp3"
                         play_audio("cest_bien_la_lettre") # Needs "cest_bien_la_lettre.mp3"
@@ -262,11 +718,20 @@ def level_1():
                     play_letter(key, neutral=True) 
                     play_audio("essaie_encore")
                     play_ou_est_lettre(target_letter)
-            time.sleep(0.02)
+            elif deadline.fired:
+                timed_out = True
+            elif inactivity.fired:
+                play_audio("retour_menu")
+                return
+        deadline.cancel()
+        reminder.cancel()
 
         if timed_out:
+            log_event(session_log.OUTCOME, "timeout", target_letter, "", sync=True)
+            record_attempt(target_letter, "", None, None)
             play_audio("temps_ecoule")
             play_audio("la_lettre")
+        letters.update(target_letter, hit=found and not missed)
 
         counter=counter+1
 
@@ -274,18 +739,17 @@ def level_1():
         # Ask if the user wants to continue
             play_audio("veux_tu_continuer")
             play_audio("appuie_sur_1_oui_2_non") 
-            while True:
-                key = scan_keys()
-                if key == '1': # Assuming 'A' is top-left
-                    break # Continue level 2 loop
-                elif key == '2': # Assuming 'P' is bottom-right
-                    play_audio("retour_menu_confirmer")
-                    
-                    play_audio("retour_menu") 
-                    return # Exit level 2 function
-                time.sleep(0.02)
+            key = wait_for_key(allowed=YES_NO_KEYS)
+            if key is None: # nobody answered
+                play_audio("retour_menu")
+                return
+            elif key == '2':
+                play_audio("retour_menu_confirmer")
+                play_audio("retour_menu") 
+                return # Exit level 1 function
 
-def level_2():
+def level_2(resume=None):
+    reset_timers()
     play_audio("niveau_2") # Needs "niveau_3.mp3"
     # Filter questions based on available keys (excluding 'P' and None)
     flat_key_map = {letter for row in KEY_MAP for letter in row if letter and letter != 'P'}
@@ -298,59 +762,84 @@ def level_2():
         return
 
     words = list(available_questions.keys())
+    if resume:
+        # Reprise après coupure : on ne repose pas les mots déjà faits ni ceux abandonnés
+        skip = set(resume["done"]) | set(resume["dropped"])
+        words = [w for w in words if w not in skip]
+        counter = 1 + len(skip) # one question per outcome, each synced to the journal
+    log_event(session_log.WORDS, *words)
+    deck = make_scheduler("word", words)
+    word = None
 
     while True: # Loop for multiple questions
-        if not words:
+        if not deck.remaining:
             play_audio("plus_de_questions") # Needs "plus_de_questions.mp3"
             break # Exit the loop if no more words
 
-        word = random.choice(words)
+        word = deck.pick(avoid=word)
         target_letter = available_questions[word]
         play_audio("premiere_lettre_de") # Needs "premiere_lettre_de.mp3"
         play_audio(word) # Needs audio files for each word (e.g., "kangourou.mp3")
+        log_event(session_log.QUESTION, target_letter, word)
+        asked_at = time.monotonic()
 
-        start_time = time.time()
+        deadline = timers.schedule(QUESTION_TIMEOUT, on_question_timeout, word) # Give 30 seconds
+        reminder = timers.schedule(REMINDER_DELAY, _repeat_word_question, "premiere_lettre_de", word,
+                                   interval=REMINDER_DELAY)
         found = False
         timed_out = False
+        missed = False
         while not found and not timed_out:
-             if time.time() - start_time > 30: # Give 30 seconds
-                timed_out = True
-                break
-
-             key = scan_keys()
+             key = next_key()
              if key:
+                acknowledge(key, target_letter)
+                reminder.restart()
+                rt_ms = latency_ms(asked_at)
+                log_event(session_log.KEY, key, rt_ms)
+                record_attempt(target_letter, word, key, rt_ms)
                 if key == target_letter:
+                    log_event(session_log.OUTCOME, "hit", target_letter, word, sync=True)
                     play_audio("oui") # Needs "oui.mp3"
                     play_audio(target_letter)
                     play_audio(word)
                     play_audio("bravo")
                     found = True
-                    # Remove the word so it's not asked again immediately
-                    if word in words:
-                        words.remove(word)
+                    if missed:
+                        deck.update(word, hit=True) # box 0 -> 1: comes back later in the level
+                    else:
+                        deck.remove(word) # found at once, not asked again
                 elif key == '4': # Allow exiting mid-question
                     play_audio("retour_menu_confirmer")
                     play_audio("retour_menu") 
                     return
                 else:
+                    deck.update(word, hit=False) # back to box 0
+                    missed = True
                     play_audio("non")
                     play_audio("ca_cest_la_lettre")
                     play_audio(key)
                     play_audio("essaie_encore")
-             time.sleep(0.02)
+             elif deadline.fired:
+                timed_out = True
+             elif inactivity.fired:
+                play_audio("retour_menu")
+                return
+        deadline.cancel()
+        reminder.cancel()
 
         if timed_out:
+            log_event(session_log.OUTCOME, "timeout", target_letter, word, sync=True)
+            record_attempt(target_letter, word, None, None)
             play_audio("temps_ecoule")
             play_audio("premiere_lettre_de")
             play_audio(word)
             play_audio("est") # Needs "est.mp3"
             play_audio(target_letter)
-            # Remove the word even if timed out to avoid immediate repeat
-            if word in words:
-                words.remove(word)
+            # Not asked again in this level, as before the Leitner deck (its miss is in the progress store)
+            deck.remove(word)
 
         # Check if there are any words left before asking to continue
-        if not words:
+        if not deck.remaining:
             play_audio("toutes_questions_repondues") # Needs "toutes_questions_repondues.mp3"
             break # Exit level 3 loop
 
@@ -360,17 +849,14 @@ def level_2():
         # Ask if the user wants to continue
             play_audio("veux_tu_continuer")
             play_audio("appuie_sur_1_oui_2_non") 
-            while True:
-                key = scan_keys()
-                if key == '1': # Assuming 'A' is top-left
-                    break # Continue level 2 loop
-                elif key == '2': # Assuming 'P' is bottom-right
-                    play_audio("retour_menu") 
-                    return # Exit level 2 function
-                time.sleep(0.02)
+            key = wait_for_key(allowed=YES_NO_KEYS)
+            if key is None or key == '2':
+                play_audio("retour_menu") 
+                return # Exit level 2 function
 
 
-def level_3():
+def level_3(resume=None):
+    reset_timers()
     play_audio("niveau_3")
     flat_key_map = {letter for row in KEY_MAP for letter in row if letter and letter != 'P'}
     counter = 1
@@ -387,6 +873,16 @@ def level_3():
     compteur = 0
     max_letter = 12  # douzieme_lettre
 
+    if resume and resume["words"]:
+        # Reprise après coupure : mêmes mots, sans ceux déjà faits
+        skip = set(resume["done"]) | set(resume["dropped"])
+        all_words = [w for w in resume["words"] if w not in skip]
+        # The outcomes are synced before PROGRESS: count from them, it may be missing or one behind
+        compteur = len(resume["done"])
+        counter = 1 + len(skip)
+        letter_pos = max(resume["progress"].get("letter_pos", 0), compteur // 5)
+    log_event(session_log.WORDS, *all_words)
+
     while word_index < len(all_words) and letter_pos < max_letter:
         # On prend le bon mot selon l'étape (mots ou mots_durs)
         if word_index < 10:
@@ -407,46 +903,31 @@ def level_3():
             continue
 
         # Choix du bon audio pour la position de la lettre
-        if letter_pos == 0:
-            play_audio("premiere_lettre")
-        elif letter_pos == 1:
-            play_audio("deuxieme_lettre")
-        elif letter_pos == 2:
-            play_audio("troisieme_lettre")
-        elif letter_pos == 3:
-            play_audio("quatrieme_lettre")
-        elif letter_pos == 4:
-            play_audio("cinquieme_lettre")
-        elif letter_pos == 5:
-            play_audio("sixieme_lettre")
-        elif letter_pos == 6:
-            play_audio("septieme_lettre")
-        elif letter_pos == 7:
-            play_audio("huitieme_lettre")
-        elif letter_pos == 8:
-            play_audio("neuvieme_lettre")
-        elif letter_pos == 9:
-            play_audio("dixieme_lettre")
-        elif letter_pos == 10:
-            play_audio("onzieme_lettre")
-        elif letter_pos == 11:
-            play_audio("douzieme_lettre")
+        if letter_pos < len(LETTER_POSITIONS):
+            position_prompt = LETTER_POSITIONS[letter_pos]
         else:
-            play_audio("lettre_suivante")
+            position_prompt = "lettre_suivante"
+        play_audio(position_prompt)
 
         play_audio(word.lower())
+        log_event(session_log.QUESTION, target_letter, word)
+        asked_at = time.monotonic()
 
-        start_time = time.time()
+        deadline = timers.schedule(QUESTION_TIMEOUT, on_question_timeout, word)
+        reminder = timers.schedule(REMINDER_DELAY, _repeat_word_question, position_prompt, word.lower(),
+                                   interval=REMINDER_DELAY)
         found = False
         timed_out = False
         while not found and not timed_out:
-            if time.time() - start_time > 30:
-                timed_out = True
-                break
-
-            key = scan_keys()
+            key = next_key()
             if key:
+                acknowledge(key, target_letter)
+                reminder.restart()
+                rt_ms = latency_ms(asked_at)
+                log_event(session_log.KEY, key, rt_ms)
+                record_attempt(target_letter, word, key, rt_ms, kind="word3")
                 if key == target_letter:
+                    log_event(session_log.OUTCOME, "hit", target_letter, word, sync=True)
                     play_audio("oui")
                     play_audio(target_letter)
                     play_audio(word)
@@ -457,7 +938,7 @@ def level_3():
                 elif key == '4':
                         play_audio("retour_menu") 
                         play_audio("retour_menu_confirmer")
-                        confirm = scan_keys()
+                        confirm = wait_for_key(CONFIRM_TIMEOUT)
                         if confirm== '4' :
                             play_audio("au_revoir")
                             return 
@@ -466,9 +947,17 @@ def level_3():
                     play_audio("ca_cest_la_lettre")
                     play_audio(key)
                     play_audio("essaie_encore")
-            time.sleep(0.02)
+            elif deadline.fired:
+                timed_out = True
+            elif inactivity.fired:
+                play_audio("retour_menu")
+                return
+        deadline.cancel()
+        reminder.cancel()
 
         if timed_out:
+            log_event(session_log.OUTCOME, "timeout", target_letter, word, sync=True)
+            record_attempt(target_letter, word, None, None, kind="word3")
             play_audio("temps_ecoule")
             play_audio(word)
             play_audio("est")
@@ -495,31 +984,77 @@ def level_3():
             break
 
         counter=counter+1
+        log_event(session_log.PROGRESS, f"compteur={compteur}", f"letter_pos={letter_pos}",
+                  f"counter={counter}", sync=True)
 
         if counter%10 == 1 :
         # Ask if the user wants to continue
             play_audio("veux_tu_continuer")
             play_audio("appuie_sur_1_oui_2_non") 
-            while True:
-                key = scan_keys()
-                if key == '1':
-                    break # Continue level 2 loop
-                elif key == '2': 
-                    play_audio("retour_menu_confirmer")
-                    play_audio("retour_menu") 
-                    return # Exit level 2 function
-                time.sleep(0.02)
+            key = wait_for_key(allowed=YES_NO_KEYS)
+            if key is None: # nobody answered
+                play_audio("retour_menu")
+                return
+            elif key == '2': 
+                play_audio("retour_menu_confirmer")
+                play_audio("retour_menu") 
+                return # Exit level 3 function
+    
+
+LEVELS = {'1': level_1, '2': level_2, '3': level_3}
+
+def run_level(level, resume=None):
+    """Runs level '1', '2' or '3' and journals it (LEVEL_END only on a normal exit)."""
+    log_event(session_log.LEVEL_START, level, sync=True)
+    latency.level = level
+    flight_recorder.record(flight_recorder.STATE, "level", int(level))
+    rt_warm_level(level)
+    with tracing.span("level", level):
+        ambience(True)
+        try:
+            LEVELS[level](resume)
+        finally:
+            ambience(False)
+            latency.level = "menu"
+            flight_recorder.record(flight_recorder.STATE, "menu")
+    log_event(session_log.LEVEL_END, level, sync=True)
+    reset_timers()
     
 
 
 
 # --- Main Program ---
 if __name__ == "__main__":
+    event_log.start() # this process owns the ring: the events of the imports above are replayed into it
     try:
+        # Dumps the last events on SIGUSR1 (kill -USR1) or an exception in any thread
+        flight_recorder.recorder.install(on_dump=lambda path: event_log.warning("flight_dump", path=path))
+        # Logs the stacks when the game loop stops beating (CLAVIER_HW_WATCHDOG to feed /dev/watchdog)
+        stall_detector.detector.start()
         setup_gpio()
-        GPIO.output(22, 1)
+        # Before edge detection: the self-test drives the columns for a moment
+        self_test.run(ROW_PINS, COL_PINS, audio, audio_manifest(), AUDIO_DIR, EXPECTED_AUDIO_EXT)
+        if SCANNER_MODE == "process":
+            start_scanner()
+        else:
+            setup_key_events()
+        apply_rt_profile()
+        bluetooth = BluetoothStatus(on_change=on_speaker_change).start()
+        exporter = metrics.Exporter(metrics.registry).start()
 
         play_audio("bienvenue") # Needs "bienvenue.mp3"
+
+        progress = progress_store.ProgressStore()
+
+        # Reprise de la dernière session si le boîtier a été débranché en pleine partie
+        session = session_log.SessionLog.resume()
+        if session is None:
+            session = session_log.SessionLog.start()
+        sessions_started.inc()
+        rt_after_warmup() # the allocations of startup are behind us
+        if session.state["level"] in LEVELS: # fresh sessions have no level yet
+            event_log.info("level_resume", level=session.state["level"])
+            run_level(session.state["level"], resume=dict(session.state))
         
 
         # Main loop for level selection menu
@@ -532,38 +1067,64 @@ if __name__ == "__main__":
 
             # Wait for a valid menu selection
             while not selected_level_key:
-                key = scan_keys()
-                if key in ['1', '2', '3', '4']: # Check if key is a valid menu option
+                key = wait_for_key(allowed=MENU_KEYS)
+                if key: # Only valid menu options wake us up
                     # Verify the key actually exists in the KEY_MAP
                     if any(key in row for row in KEY_MAP):
                          selected_level_key = key
                     else:
-                         print(f"Warning: Menu key '{key}' pressed but not found in KEY_MAP.")
+                         event_log.warning("menu_key_unmapped", key=key)
                          play_audio("touche")
                          play_audio(key + "0")
                          play_audio("non_configuree")
+                         stall_detector.idle()
                          time.sleep(1)
                          play_audio("menu_prompt_court")
-                time.sleep(0.02)
 
             # Execute selected action
-            if selected_level_key == '1':
-                 level_1()
-            elif selected_level_key == '2':
-                 level_2()
-            elif selected_level_key == '3':
-                 level_3()
+            if selected_level_key in LEVELS:
+                 run_level(selected_level_key)
             elif selected_level_key == '4':
                 play_audio("au_revoir") # Needs "au_revoir.mp3"
+                session.close()
                 break # Exit the main program loop
 
 
     except KeyboardInterrupt:
-        print("Programme interrompu par l'utilisateur.")
+        event_log.info("interrupted")
     except Exception as e:
-        print(f"Une erreur est survenue: {e}")
-        # Potentially log the error here
+        event_log.error("crash", error=repr(e))
+        flight_recorder.record(flight_recorder.ERROR, type(e).__name__)
+        try:
+            event_log.error("flight_dump", path=flight_recorder.recorder.dump("exception"))
+        except OSError as dump_e:
+            event_log.error("flight_dump_failed", error=dump_e)
     finally:
+        # Unfinished sessions stay resumable, only make sure nothing is left in memory
+        if session is not None:
+            session.flush()
+        if progress is not None:
+            progress.close()
+        stall_detector.detector.stop()
+        stop_scanner()
+        if exporter is not None:
+            exporter.close()
+        debouncer.retune()
+        save_debounce()
+        event_log.close() # everything below is shutdown output, printed directly
+        try:
+            path = latency.dump()
+            if path:
+                print(latency.report())
+                print(f"Latency histograms written to {path}")
+        except OSError as e:
+            print(f"Warning: could not write latency histograms: {e}")
+        if tracing.tracer.enabled:
+            try:
+                print(f"Trace written to {tracing.tracer.export_chrome()}")
+            except OSError as e:
+                print(f"Warning: could not write trace: {e}")
+
         print("Nettoyage GPIO...")
         # Check if GPIO has been initialized before cleaning up
         # This avoids errors if setup_gpio() failed
@@ -578,8 +1139,6 @@ if __name__ == "__main__":
         except Exception as gpio_e:
              print(f"Erreur lors du nettoyage GPIO: {gpio_e}")
 
-        # Quit pygame mixer
-        if pygame and pygame.mixer.get_init():
-            pygame.mixer.quit()
-            print("Pygame mixer quit.")
+        # Close the audio output (writes the WAV/timeline of the null and wav backends)
+        audio.quit()
         print("Programme terminé.")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Press-to-sound latency: from the key's rising edge to the moment the first
+feedback clip starts playing.
+
+keyboard_game calls press() when a key is read and the audio output calls
+sound_started() when a clip actually starts. The interval goes into an
+HDR-style histogram per (level, audio backend): values are bucketed with a
+relative error under 1 % from 1 us up to 60 s in a fixed array, so
+recording is O(1) and never allocates.
+
+At the end of a session the histograms are dumped as JSON next to the
+session logs. Print them with:
+
+    python3 latency.py sessions/latency-*.json
+"""
+
+from array import array
+import json
+import math
+import os
+import time
+
+SUB_BUCKET_BITS = 8             # 128 sub-buckets per power of two: < 0.8 % error
+MAX_VALUE_US = 60_000_000
+LATENCY_HORIZON = 5.0           # s, a clip starting later than that is not feedback to the press
+LATENCY_DIR = "sessions/"
+PERCENTILES = (50, 95, 99)
+
+def _index(value, bits=SUB_BUCKET_BITS):
+    sub = 1 << bits
+    if value < sub:
+        return value
+    shift = value.bit_length() - bits
+    return sub + (shift - 1) * (sub >> 1) + (value >> shift) - (sub >> 1)
+
+
+def _highest(index, bits=SUB_BUCKET_BITS):
+    """Largest value that falls into bucket `index`."""
+    sub = 1 << bits
+    if index < sub:
+        return index
+    half = sub >> 1
+    shift, rest = divmod(index - sub, half)
+    shift += 1
+    return ((rest + half + 1) << shift) - 1
+
+
+class HdrHistogram:
+    """Log-linear histogram of integer microseconds."""
+
+    def __init__(self, max_value=MAX_VALUE_US):
+        self.max_value = max_value
+        self.counts = array("Q", bytes(8 * (_index(max_value) + 1)))
+        self.count = 0
+        self.max = 0
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[_index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(_highest(index), self.max)
+        return self.max
+
+    def summary(self):
+        out = {"count": self.count, "max": self.max}
+        for p in PERCENTILES:
+            out[f"p{p}"] = self.percentile(p)
+        return out
+
+    def to_json(self):
+        return {"count": self.count, "max": self.max, "sub_bucket_bits": SUB_BUCKET_BITS,
+                "buckets": {str(i): n for i, n in enumerate(self.counts) if n}}
+
+    @classmethod
+    def from_json(cls, data):
+        hist = cls()
+        bits = data.get("sub_bucket_bits", 7)   # dumps before the field had 7
+        for index, n in data["buckets"].items():
+            if bits != SUB_BUCKET_BITS:
+                index = _index(min(_highest(int(index), bits), hist.max_value))
+            hist.counts[int(index)] += n
+        hist.count = data["count"]
+        hist.max = data["max"]
+        return hist
+
+
+class LatencyMonitor:
+
+    def __init__(self):
+        self.level = "menu"             # set by run_level
+        self.histograms = {}            # (level, backend) -> HdrHistogram
+        self._pressed_at = None         # perf_counter_ns of the pending press
+
+    def press(self, edge_ns):
+        """A key was read; its edge happened at `edge_ns` (perf_counter_ns)."""
+        self._pressed_at = edge_ns
+
+    def cancel(self):
+        """The press is ignored by the game, no feedback will follow."""
+        self._pressed_at = None
+
+    def sound_started(self, backend, started_ns=None):
+        """Returns the press-to-sound latency in us, or None if the clip is not feedback to a press.
+        `started_ns` (perf_counter_ns) when the start is reported after the fact."""
+        pressed_at = self._pressed_at
+        if started_ns is None:
+            started_ns = time.perf_counter_ns()
+        if pressed_at is None or started_ns < pressed_at:
+            return None
+        self._pressed_at = None
+        elapsed_us = (started_ns - pressed_at) // 1000
+        if elapsed_us > LATENCY_HORIZON * 1_000_000:
+            return None
+        key = (self.level, backend)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = HdrHistogram()
+        hist.record(elapsed_us)
+        return elapsed_us
+
+    def report(self):
+        return format_report({key: hist.summary() for key, hist in self.histograms.items()})
+
+    def dump(self, directory=LATENCY_DIR):
+        """Writes the histograms as JSON and returns the path (None if nothing was measured)."""
+        if not self.histograms:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("latency-%Y%m%d-%H%M%S.json"))
+        data = [{"level": level, "backend": backend, **hist.to_json()}
+                for (level, backend), hist in self.histograms.items()]
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return path
+
+
+def format_report(summaries):
+    lines = [f"{'level':<6} {'backend':<20} {'n':>6} " + " ".join(f"{f'p{p}':>8}" for p in PERCENTILES) + f" {'max':>8}"]
+    for (level, backend), s in sorted(summaries.items()):
+        values = " ".join(f"{s[f'p{p}'] / 1000:8.1f}" for p in PERCENTILES)
+        lines.append(f"{level:<6} {backend:<20} {s['count']:>6} {values} {s['max'] / 1000:8.1f}")
+    lines.append("(milliseconds, key edge to first sound)")
+    return "\n".join(lines)
+
+
+def load(paths):
+    """Merges dumped histograms, returns {(level, backend): HdrHistogram}."""
+    merged = {}
+    for path in paths:
+        with open(path) as f:
+            for entry in json.load(f):
+                hist = HdrHistogram.from_json(entry)
+                key = (entry["level"], entry["backend"])
+                if key in merged:
+                    total = merged[key]
+                    for i, n in enumerate(hist.counts):
+                        total.counts[i] += n
+                    total.count += hist.count
+                    total.max = max(total.max, hist.max)
+                else:
+                    merged[key] = hist
+    return merged
+
+
+if __name__ == "__main__":
+    import sys
+    histograms = load(sys.argv[1:])
+    print(format_report({key: hist.summary() for key, hist in histograms.items()}))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Metrics registry in Prometheus text format, served over a Unix socket.
+
+Counters and histograms are plain Python objects updated in the hot paths
+without any lock: each one has a single writer (the game thread), and the
+exporter thread only reads, so at worst it sees a value one update old.
+The exporter answers HTTP/1.0 GET requests on its own daemon thread, so a
+slow scraper never blocks the game:
+
+    curl --unix-socket /run/clavier-metrics.sock http://localhost/metrics
+"""
+
+from array import array
+import bisect
+import os
+import socket
+import threading
+
+import event_log
+
+SOCKET_PATH = os.environ.get("CLAVIER_METRICS_SOCKET", "/run/clavier-metrics.sock")
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    kind = "counter"
+    __slots__ = ("name", "labels", "value")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def render(self):
+        return [f"{self.name}{_labels(self.labels)} {self.value}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+    __slots__ = ("name", "labels", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = array("Q", bytes(8 * (len(buckets) + 1)))  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_labels(self.labels, ('le', bound))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labels)} {self.sum}")
+        lines.append(f"{self.name}_count{_labels(self.labels)} {self.count}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._families = {}     # name -> (kind, help, {labels tuple: metric})
+        self._lock = threading.Lock()   # only taken when a metric is created
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+        with self._lock:
+            family = self._families.setdefault(name, (cls.kind, help, {}))
+            if family[0] != cls.kind:
+                raise ValueError(f"metric {name} already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(name, dict(key), **kwargs)
+            return metric
+
+    def counter(self, name, help, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for name, (kind, help, metrics) in list(self._families.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in list(metrics.values()):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Exporter:
+    """Serves a registry as HTTP over a Unix socket, from a daemon thread."""
+
+    def __init__(self, registry, path=SOCKET_PATH):
+        self.registry = registry
+        self.path = path
+        self._server = None
+
+    def start(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        try:
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(self.path)
+            self._server.listen(4)
+        except OSError as e:
+            event_log.warning("metrics_unavailable", socket=self.path, error=e)
+            self._server = None
+            return self
+        threading.Thread(target=self._run, name="metrics", daemon=True).start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                try:
+                    conn.settimeout(1.0)
+                    request = conn.recv(1024).split(b"\r\n", 1)[0].split()
+                    if len(request) >= 2 and request[0] == b"GET" and request[1] in (b"/", b"/metrics"):
+                        body = self.registry.render().encode()
+                        head = b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    else:
+                        body = b"not found\n"
+                        head = b"HTTP/1.0 404 Not Found\r\nContent-Type: text/plain\r\n"
+                    conn.sendall(head + b"Content-Length: %d\r\n\r\n" % len(body) + body)
+                except OSError:
+                    pass
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
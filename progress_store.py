@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Per-child progress store.
+
+Every answer is kept in a local SQLite database (WAL mode) together with
+aggregates per (child, letter) and (child, word): attempts, hits and median
+reaction time. The aggregates live in memory and are updated as answers come
+in, so the levels read them in O(1); the database writes are queued to a
+background thread and grouped in one transaction per batch, the game thread
+never waits on SQLite.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+
+import event_log
+
+DB_PATH = "progress.db"
+DEFAULT_CHILD = os.environ.get("CLAVIER_CHILD", "enfant")
+BATCH_SIZE = 64
+
+# Reaction-time histogram: geometric buckets from 100 ms to ~80 s, enough for
+# a median without keeping every sample around
+RT_MIN_MS = 100
+RT_GROWTH = 1.25
+RT_BUCKETS = 30
+RT_EDGES = [RT_MIN_MS * RT_GROWTH ** i for i in range(RT_BUCKETS)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    child TEXT NOT NULL,
+    kind TEXT NOT NULL,         -- 'letter', 'word' (level 2) or 'word3' (level 3)
+    item TEXT NOT NULL,
+    hit INTEGER NOT NULL,
+    rt_ms INTEGER,              -- NULL on timeout
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    child TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    item TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    median_rt_ms INTEGER,
+    rt_hist BLOB NOT NULL,
+    PRIMARY KEY (child, kind, item)
+);
+"""
+
+
+def rt_bucket(rt_ms):
+    for i in range(RT_BUCKETS - 1):
+        if rt_ms < RT_EDGES[i + 1]:
+            return i
+    return RT_BUCKETS - 1
+
+
+class ItemStats:
+    """Running aggregates for one letter or word."""
+
+    __slots__ = ("attempts", "hits", "median_rt_ms", "rt_hist")
+
+    def __init__(self, attempts=0, hits=0, median_rt_ms=None, rt_hist=None):
+        self.attempts = attempts
+        self.hits = hits
+        self.median_rt_ms = median_rt_ms
+        self.rt_hist = rt_hist if rt_hist is not None else array("I", bytes(4 * RT_BUCKETS))
+
+    @property
+    def accuracy(self):
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def add(self, hit, rt_ms):
+        self.attempts += 1
+        if hit:
+            self.hits += 1
+        if rt_ms is not None:
+            self.rt_hist[rt_bucket(rt_ms)] += 1
+            self.median_rt_ms = self._median()
+
+    def _median(self):
+        total = sum(self.rt_hist)
+        seen = 0
+        for i, count in enumerate(self.rt_hist):
+            seen += count
+            if seen * 2 >= total:
+                # geometric middle of the bucket
+                return int(RT_EDGES[i] * RT_GROWTH ** 0.5)
+        return None
+
+
+class ProgressStore:
+
+    def __init__(self, path=DB_PATH, child=DEFAULT_CHILD):
+        self.path = path
+        self.child = child
+        self._stats = {}        # (kind, item) -> ItemStats
+        self._queue = queue.Queue()
+
+        db = self._connect()
+        for kind, item, attempts, hits, median, hist in db.execute(
+                "SELECT kind, item, attempts, hits, median_rt_ms, rt_hist FROM stats WHERE child = ?",
+                (child,)):
+            rt_hist = array("I")
+            rt_hist.frombytes(hist)
+            self._stats[kind, item] = ItemStats(attempts, hits, median, rt_hist)
+        db.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="progress-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        return db
+
+    # --- Game thread side (never touches the disk) ---
+
+    def record(self, kind, item, hit, rt_ms=None):
+        """Counts one answer for `item` ('letter' or 'word'). rt_ms=None for a timeout."""
+        stats = self._stats.get((kind, item))
+        if stats is None:
+            stats = self._stats[kind, item] = ItemStats()
+        stats.add(hit, rt_ms)
+        self._queue.put(((kind, item, int(hit), rt_ms, time.time()),
+                         (stats.attempts, stats.hits, stats.median_rt_ms, stats.rt_hist.tobytes())))
+
+    def stats(self, kind, item):
+        """Aggregates for one item, or None if it was never asked."""
+        return self._stats.get((kind, item))
+
+    def all_stats(self, kind):
+        return {item: s for (k, item), s in self._stats.items() if k == kind}
+
+    def close(self):
+        """Writes what is still queued and stops the writer thread."""
+        self._queue.put(None)
+        self._writer.join()
+
+    # --- Writer thread ---
+
+    def _write_loop(self):
+        db = self._connect()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [entry for entry in batch if entry is not None]
+            if not batch:
+                continue
+
+            rows = []
+            latest = {}     # only the last aggregate of each item matters
+            for (kind, item, hit, rt_ms, ts), agg in batch:
+                rows.append((self.child, kind, item, hit, rt_ms, ts))
+                latest[kind, item] = agg
+            try:
+                with db:
+                    db.executemany("INSERT INTO attempts VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    db.executemany(
+                        "INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(self.child, kind, item) + agg for (kind, item), agg in latest.items()])
+            except sqlite3.Error as e:
+                event_log.error("progress_write_failed", error=e)
+        db.close()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Real-time scheduling profile for the keyboard runtime.
+
+On the box the scan shares the CPU with journald, the Bluetooth stack and
+bt_daemon. With CLAVIER_RT=1 the game (and the audio server) apply at
+startup:
+- CPU affinity per role: game thread, scanner process, audio threads
+  (SDL's mixer thread, the ALSA writer). On a multi-core Pi the scanner
+  gets the last core to itself; override with CLAVIER_RT_CPUS, e.g.
+  "game=0,audio=0-1,scanner=3".
+- a real-time policy for the scanner and the audio threads (CLAVIER_RT_POLICY
+  fifo or rr, default fifo; priorities in PRIORITIES). The game thread stays
+  SCHED_OTHER: it must never starve the others.
+- after warmup (the menu's clips decoded, session open): mlockall() of
+  the pages in RAM so far, decoded audio included, so no clip is ever paged
+  out, and gc.freeze() so the collector stops walking the startup objects.
+  MCL_ONFAULT: reserved but untouched memory (thread stacks, malloc arenas)
+  is not faulted in, it is locked if it is ever used. Skipped when the
+  process has more than CLAVIER_RT_MLOCK_MB resident (default 96, 0 = never
+  lock). Each level locks again once its own clips are decoded.
+
+Each step that the system refuses (no CAP_SYS_NICE, RLIMIT_MEMLOCK too
+low) is returned as a warning; the rest of the profile still applies.
+
+Jitter benchmark: the same deadline loop as the scanner, under load, with
+and without the profile:
+
+    python3 rt_profile.py --bench 10
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+PRIORITIES = {"scanner": 50, "audio": 40}   # real-time priority per role, 1..99
+AUDIO_THREADS = ("SDLAudio", "alsa-writer")  # thread names (comm) of the audio output
+MCL_CURRENT = 1
+MCL_ONFAULT = 4     # Linux 4.4+: lock pages as they are touched, not all at once
+MLOCK_LIMIT_MB = int(os.environ.get("CLAVIER_RT_MLOCK_MB", "96"))
+
+
+def parse_cpus(spec):
+    """{role: set of cpus} from "game=0,audio=0-1,scanner=3"."""
+    cpus = {}
+    for item in filter(None, spec.split(",")):
+        role, _, value = item.partition("=")
+        first, _, last = value.partition("-")
+        cpus.setdefault(role.strip(), set()).update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def default_cpus():
+    """The scanner alone on the last core, everything else on the others. Nothing on one core."""
+    available = sorted(os.sched_getaffinity(0))
+    if len(available) < 2:
+        return {}
+    rest = set(available[:-1])
+    return {"game": rest, "audio": rest, "scanner": {available[-1]}}
+
+
+class RtProfile:
+
+    def __init__(self, enabled=False, cpus=None, policy="fifo", lock_memory=True, freeze_gc=True,
+                 lock_limit=MLOCK_LIMIT_MB * 1024 * 1024):
+        self.enabled = enabled
+        self.cpus = cpus if cpus is not None else {}
+        self.policy = policy            # "fifo", "rr" or "other"
+        self.lock_memory = lock_memory
+        self.freeze_gc = freeze_gc
+        self.lock_limit = lock_limit    # resident bytes above which mlockall() is skipped
+
+    @classmethod
+    def from_env(cls):
+        if os.environ.get("CLAVIER_RT", "0") == "0":
+            return cls()
+        spec = os.environ.get("CLAVIER_RT_CPUS")
+        return cls(enabled=True, cpus=parse_cpus(spec) if spec else default_cpus(),
+                   policy=os.environ.get("CLAVIER_RT_POLICY", "fifo"))
+
+    @property
+    def sched_policy(self):
+        return {"fifo": os.SCHED_FIFO, "rr": os.SCHED_RR}.get(self.policy)
+
+    def priority(self, role):
+        """Real-time priority of `role`, None if it runs under the normal scheduler."""
+        if not self.enabled or self.sched_policy is None:
+            return None
+        return PRIORITIES.get(role)
+
+    def apply(self, role, tid=0):
+        """Affinity and policy of `role` for a thread (0 = the calling one). Returns the warnings."""
+        if not self.enabled:
+            return []
+        warnings = []
+        cpus = self.cpus.get(role)
+        if cpus:
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError as e:
+                warnings.append(f"{role} affinity {sorted(cpus)}: {e}")
+        priority = self.priority(role)
+        if priority is not None:
+            try:
+                os.sched_setscheduler(tid, self.sched_policy, os.sched_param(priority))
+            except OSError as e:
+                warnings.append(f"{role} SCHED_{self.policy.upper()} {priority}: {e}")
+        return warnings
+
+    def apply_audio_threads(self):
+        """Applies the audio role to the audio output threads already running in this process."""
+        warnings = []
+        for tid, name in threads():
+            if name.startswith(AUDIO_THREADS):
+                warnings += self.apply("audio", tid)
+        return warnings
+
+    def lock(self):
+        """Locks the memory in RAM so far, if it fits under lock_limit. Returns the warnings."""
+        if not self.enabled or not self.lock_memory or not self.lock_limit:
+            return []
+        resident = resident_bytes()
+        if resident > self.lock_limit:
+            return [f"mlockall skipped: {resident >> 20} MB resident, limit {self.lock_limit >> 20} MB"
+                    " (CLAVIER_RT_MLOCK_MB)"]
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_ONFAULT) != 0:
+            return [f"mlockall: {os.strerror(ctypes.get_errno())}"]
+        return []
+
+    def after_warmup(self):
+        """Locks the memory mapped so far and freezes the GC. Returns the warnings."""
+        if not self.enabled:
+            return []
+        warnings = self.lock()
+        if self.freeze_gc:
+            gc.collect()
+            gc.freeze()     # startup objects move to a generation the collector never scans
+        return warnings
+
+
+def resident_bytes():
+    """Resident size of this process: what mlockall(MCL_CURRENT | MCL_ONFAULT) pins now."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def threads():
+    """(tid, name) of every thread of this process."""
+    result = []
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/comm") as f:
+                result.append((int(tid), f.read().strip()))
+        except OSError:
+            pass    # the thread just ended
+    return result
+
+
+# --- Jitter benchmark ---
+
+def measure(seconds, period, profile):
+    """Runs the scanner's deadline loop for `seconds`, returns how late each tick woke (us)."""
+    from latency import HdrHistogram
+    warnings = profile.apply("scanner") + profile.after_warmup()
+    hist = HdrHistogram()
+    next_tick = time.perf_counter()
+    end = next_tick + seconds
+    while next_tick < end:
+        [str(i) for i in range(30)]     # a scan's worth of small allocations
+        next_tick += period
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        late = time.perf_counter() - next_tick
+        hist.record(late * 1_000_000)
+        if late > period:
+            next_tick = time.perf_counter()
+    return {**hist.summary(), "warnings": warnings}
+
+
+def bench(seconds, period, load):
+    """Measures with and without the profile while `load` busy processes run."""
+    hogs = [subprocess.Popen([sys.executable, "-c", "while True: pass"]) for _ in range(load)]
+    results = {}
+    try:
+        for name, env in (("off", {"CLAVIER_RT": "0"}), ("on", {"CLAVIER_RT": "1"})):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", str(seconds),
+                                  "--period", str(period)], env={**os.environ, **env},
+                                 capture_output=True, text=True, check=True).stdout
+            results[name] = json.loads(out)
+    finally:
+        for hog in hogs:
+            hog.kill()
+    return results
+
+
+def format_bench(results, period):
+    lines = [f"scan deadline lateness, period {period * 1000:g} ms (us)",
+             f"{'profile':<8} {'n':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}"]
+    for name, r in results.items():
+        lines.append(f"{name:<8} {r['count']:>7} {r['p50']:>7} {r['p95']:>7} {r['p99']:>7} {r['max']:>7}")
+        lines += [f"  ({name}) {w}" for w in r["warnings"]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan jitter with and without the real-time profile")
+    parser.add_argument("--bench", type=float, metavar="SECONDS", default=10.0, help="duration of each run")
+    parser.add_argument("--period", type=float, default=0.002, help="scan period, s")
+    parser.add_argument("--load", type=int, default=os.cpu_count(), help="busy processes competing for the CPU")
+    parser.add_argument("--measure", type=float, metavar="SECONDS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        json.dump(measure(args.measure, args.period, RtProfile.from_env()), sys.stdout)
+    else:
+        print(format_bench(bench(args.bench, args.period, args.load), args.period))
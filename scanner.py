@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Matrix scanner in a process of its own.
+
+On a single-core Pi Zero the game thread shares the GIL with mp3 decoding
+and the game logic, so a scan can be late by tens of milliseconds while a
+clip decodes. ScannerProcess runs the scan in a separate Python process
+(`python3 scanner.py ...`, started by the game), optionally pinned to a
+core and raised to SCHED_FIFO (see rt_profile.py). It checks the columns every SCAN_PERIOD on
+absolute deadlines, whatever the game is doing.
+
+Keys go to the game through a single-producer single-consumer ring in
+multiprocessing.shared_memory: the scanner only writes the head, the game
+only writes the tail, so neither ever waits for the other. The scanner
+writes one byte on a pipe after each key so the game can sleep in select()
+until a key or its next timer. The same block carries each key's debounce
+window (written by the game when AdaptiveDebounce retunes) and the scan
+statistics.
+
+The scan itself is the game's: all rows HIGH while idle, and when a column
+goes HIGH, probe row by row, debounce with the key's own window, wait for
+the release.
+"""
+
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+
+from debounce import DEBOUNCE_MAX
+
+SCAN_PERIOD = 0.002         # s between two idle checks of the columns
+ROW_SETTLE = 0.0008         # s after raising a row
+SETTLE_SAMPLE = 0.0005      # s between two reads while a contact settles
+RELEASE_TIMEOUT = 2.0
+CAPACITY = 64               # key events, power of two
+
+HEADER = struct.Struct("<IIIIII")   # head, tail, dropped, scans, max late us, late scans
+EVENT = struct.Struct("<qIH2x")     # edge perf_counter_ns, settle us, key index
+WINDOW = struct.Struct("<f")        # debounce window of a key, s
+
+_MASK = 0xFFFFFFFF
+
+
+class ScannerError(Exception):
+    """The scanner process died or could not start."""
+
+
+class KeyRing:
+    """Key events, debounce windows and statistics in one shared memory block."""
+
+    def __init__(self, n_keys, name=None):
+        size = HEADER.size + CAPACITY * EVENT.size + n_keys * WINDOW.size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.buf = self.shm.buf
+        self.n_keys = n_keys
+        self._events = HEADER.size
+        self._windows = HEADER.size + CAPACITY * EVENT.size
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(self, field):
+        return struct.unpack_from("<I", self.buf, 4 * field)[0]
+
+    def _set(self, field, value):
+        struct.pack_into("<I", self.buf, 4 * field, value & _MASK)   # aligned 4-byte store
+
+    # --- Scanner side ---
+
+    def push(self, key_index, edge_ns, settle_us):
+        head, tail = self._get(0), self._get(1)
+        if (head - tail) & _MASK >= CAPACITY:
+            self._set(2, self._get(2) + 1)      # the game is not reading: drop, count
+            return False
+        EVENT.pack_into(self.buf, self._events + (head % CAPACITY) * EVENT.size,
+                        edge_ns, settle_us, key_index)
+        self._set(0, head + 1)                  # publish after the event is written
+        return True
+
+    def window(self, key_index):
+        return WINDOW.unpack_from(self.buf, self._windows + key_index * WINDOW.size)[0]
+
+    def count_scan(self, late_us, late):
+        self._set(3, self._get(3) + 1)
+        if late:
+            self._set(5, self._get(5) + 1)
+        if late_us > self._get(4):
+            self._set(4, late_us)
+
+    # --- Game side ---
+
+    def pop(self):
+        """(key index, edge ns, settle us) of the oldest event, None if empty."""
+        head, tail = self._get(0), self._get(1)
+        if head == tail:
+            return None
+        edge_ns, settle_us, key_index = EVENT.unpack_from(
+            self.buf, self._events + (tail % CAPACITY) * EVENT.size)
+        self._set(1, tail + 1)
+        return key_index, edge_ns, settle_us
+
+    def set_window(self, key_index, window):
+        WINDOW.pack_into(self.buf, self._windows + key_index * WINDOW.size, window)
+
+    def stats(self):
+        head, tail, dropped, scans, late_max, late = HEADER.unpack_from(self.buf)
+        return {"scans": scans, "late_scans": late, "late_max_ms": late_max / 1000, "dropped": dropped}
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+
+def _attach(name):
+    """Attaches to an existing block without letting this process's resource
+    tracker unlink it at exit (the creator owns it)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# --- Game side ---
+
+class ScannerProcess:
+
+    def __init__(self, row_pins, col_pins, key_map, window, period=SCAN_PERIOD,
+                 cpus=None, priority=None, policy=os.SCHED_FIFO, gpio="RPi.GPIO"):
+        self.keys = [key for row in key_map for key in row]
+        self.row_pins = row_pins
+        self.col_pins = col_pins
+        self.period = period
+        self.cpus = cpus                # cores to pin the scanner to, None = any
+        self.priority = priority        # real-time priority, None = normal scheduling
+        self.policy = policy            # SCHED_FIFO or SCHED_RR
+        self.gpio = gpio                # module with the RPi.GPIO interface
+        self.ring = KeyRing(len(self.keys))
+        self.set_windows(window)
+        self._process = None
+        self._wake = None
+
+    def set_windows(self, window):
+        """Hands the debounce window of every key (window(key) -> s) to the scanner."""
+        for i, key in enumerate(self.keys):
+            self.ring.set_window(i, window(key))
+
+    def start(self):
+        """Starts the scanner process. Returns the warnings about affinity and priority."""
+        wake_r, wake_w = os.pipe()
+        args = [sys.executable, os.path.abspath(__file__), self.ring.name, str(wake_w),
+                ",".join(map(str, self.row_pins)), ",".join(map(str, self.col_pins)),
+                str(len(self.keys)), str(self.period), self.gpio]
+        try:
+            self._process = subprocess.Popen(args, pass_fds=(wake_w,))
+        except OSError as e:
+            os.close(wake_r)
+            raise ScannerError(e) from e
+        finally:
+            os.close(wake_w)    # the scanner's copy is the only one: EOF when it dies
+        self._wake = wake_r
+        os.set_blocking(wake_r, False)
+        return self._tune()
+
+    def _tune(self):
+        warnings = []
+        pid = self._process.pid
+        if self.cpus:
+            try:
+                os.sched_setaffinity(pid, self.cpus)
+            except OSError as e:
+                warnings.append(f"affinity: {e}")
+        if self.priority is not None:
+            try:
+                os.sched_setscheduler(pid, self.policy, os.sched_param(self.priority))
+            except OSError as e:
+                warnings.append(f"real-time priority: {e}")
+        return warnings
+
+    def get(self, timeout=None):
+        """Next key event (key, edge perf_counter_ns, settle us), None after `timeout` s."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            event = self.ring.pop()
+            if event is not None:
+                key_index, edge_ns, settle_us = event
+                return self.keys[key_index], edge_ns, settle_us
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if select.select([self._wake], [], [], remaining)[0]:
+                try:
+                    if not os.read(self._wake, 64):    # wakeups of events already read are drained too
+                        raise ScannerError(f"scanner process exited ({self._process.poll()})")
+                except BlockingIOError:
+                    pass
+
+    def stats(self):
+        return self.ring.stats()
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(1.0)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+        if self._wake is not None:
+            os.close(self._wake)
+            self._wake = None
+        self.ring.close()
+        self.ring.shm.unlink()
+
+
+# --- Scanner side ---
+
+def settle(gpio, c_pin, window, limit):
+    """Samples a column until it has not changed for `window` seconds (see keyboard_game.settle)."""
+    start = last_change = time.perf_counter()
+    value = 1
+    while True:
+        now = time.perf_counter()
+        if now - last_change >= window:
+            return value, last_change - start
+        if now - start > limit:
+            return value, now - start
+        time.sleep(SETTLE_SAMPLE)
+        current = gpio.input(c_pin)
+        if current != value:
+            value = current
+            last_change = time.perf_counter()
+
+
+def scan(gpio, ring, row_pins, col_pins):
+    """Probes the matrix row by row, returns (key index, settle s) of the first key held, or None."""
+    for r in row_pins:
+        gpio.output(r, gpio.LOW)
+    for r_idx, r_pin in enumerate(row_pins):
+        gpio.output(r_pin, gpio.HIGH)
+        time.sleep(ROW_SETTLE)
+        for c_idx, c_pin in enumerate(col_pins):
+            if gpio.input(c_pin):
+                index = r_idx * len(col_pins) + c_idx
+                value, settle_time = settle(gpio, c_pin, ring.window(index), 2 * DEBOUNCE_MAX)
+                if not value:
+                    continue
+                gpio.output(r_pin, gpio.LOW)
+                deadline = time.monotonic() + RELEASE_TIMEOUT
+                while gpio.input(c_pin) and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                return index, settle_time
+        gpio.output(r_pin, gpio.LOW)
+    return None
+
+
+def run(shm_name, wake_fd, row_pins, col_pins, n_keys, period, gpio_module):
+    import importlib
+    gpio = importlib.import_module(gpio_module)
+    gpio.setmode(gpio.BOARD)
+    gpio.setwarnings(False)
+    for r_pin in row_pins:
+        gpio.setup(r_pin, gpio.OUT)
+    for c_pin in col_pins:
+        gpio.setup(c_pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+
+    ring = KeyRing(n_keys, shm_name)
+    parent = os.getppid()
+    next_tick = time.perf_counter()
+    while os.getppid() == parent:       # the game is gone: so are we
+        for r in row_pins:
+            gpio.output(r, gpio.HIGH)   # idle: any key raises its column
+        if any(gpio.input(c) for c in col_pins):
+            edge_ns = time.perf_counter_ns()
+            found = scan(gpio, ring, row_pins, col_pins)
+            if found is not None:
+                index, settle_time = found
+                if ring.push(index, edge_ns, int(settle_time * 1_000_000)):
+                    try:
+                        os.write(wake_fd, b"k")
+                    except BlockingIOError:
+                        pass            # the pipe is full of wakeups already
+            next_tick = time.perf_counter()     # the press took its time, not a late scan
+        next_tick += period
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        late = time.perf_counter() - next_tick  # how far past its deadline this scan starts
+        ring.count_scan(int(late * 1_000_000), late > period / 2)
+        if late > period:
+            next_tick = time.perf_counter()     # skip the missed ticks
+
+
+if __name__ == "__main__":
+    name, fd, rows, cols, n_keys, period, gpio_module = sys.argv[1:8]
+    os.set_blocking(int(fd), False)
+    try:
+        run(name, int(fd), [int(p) for p in rows.split(",")], [int(p) for p in cols.split(",")],
+            int(n_keys), float(period), gpio_module)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Adaptive choice of the next letter / word (Leitner boxes).
+
+Each item sits in a box: missed items go back to box 0, answered ones move up
+one box. The lower the box, the more often the item is drawn. Weights are kept
+in a Fenwick tree so that both drawing an item and moving it to another box
+cost O(log n), even with thousands of words.
+"""
+
+import random
+
+# Draw weight of each box: box 0 (new or missed) comes up 16x more often than box 4
+BOX_WEIGHTS = (16, 8, 4, 2, 1)
+
+
+class FenwickTree:
+    """Prefix sums over a list of weights with O(log n) update and search."""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self._step = 1 << size.bit_length()   # highest power of two for the search
+
+    def add(self, index, delta):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        i, s = self.size, 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def find(self, value):
+        """Smallest index whose prefix sum is > value."""
+        pos = 0
+        step = self._step
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+def box_for(stats):
+    """Starting box from the progress store aggregates (progress_store.ItemStats)."""
+    if stats is None or stats.attempts == 0:
+        return 0
+    return round(stats.accuracy * (len(BOX_WEIGHTS) - 1))
+
+
+class LeitnerScheduler:
+
+    def __init__(self, items, boxes=None, rng=random):
+        self.items = list(items)
+        self.index = {item: i for i, item in enumerate(self.items)}
+        self.boxes = [0] * len(self.items)
+        self.weights = [0] * len(self.items)
+        self.rng = rng
+        self.remaining = len(self.items)    # items that can still be drawn
+        self.tree = FenwickTree(len(self.items))
+        for i, item in enumerate(self.items):
+            box = boxes.get(item, 0) if boxes else 0
+            self.boxes[i] = box
+            self._set_weight(i, BOX_WEIGHTS[box])
+
+    def _set_weight(self, i, weight):
+        self.tree.add(i, weight - self.weights[i])
+        self.weights[i] = weight
+
+    def pick(self, avoid=None):
+        """Draws the next item, proportionally to its box weight. None if empty."""
+        total = self.tree.total()
+        if total <= 0:
+            return None
+        for _ in range(3):  # a few retries so the same item is not asked twice in a row
+            item = self.items[self.tree.find(self.rng.random() * total)]
+            if item != avoid:
+                break
+        return item
+
+    def update(self, item, hit):
+        """Moves `item` up one box on a hit, back to box 0 on a miss."""
+        i = self.index[item]
+        if self.weights[i] == 0:
+            return  # removed
+        box = min(self.boxes[i] + 1, len(BOX_WEIGHTS) - 1) if hit else 0
+        self.boxes[i] = box
+        self._set_weight(i, BOX_WEIGHTS[box])
+
+    def remove(self, item):
+        """Stops drawing `item` (e.g. a word already answered in level 2)."""
+        i = self.index[item]
+        if self.weights[i]:
+            self.remaining -= 1
+            self._set_weight(i, 0)
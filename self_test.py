@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Power-on self-test of the keyboard box, run at every start.
+
+Checks, in a few milliseconds:
+- the matrix wiring: stuck-high columns, row/column shorts (or a key held at
+  boot), row-row and column-column shorts;
+- the audio clips: every clip the game can ask for exists in AUDIO_DIR;
+- the mixer: a short synthesised tone actually plays.
+
+Faults are logged on one line and blinked on the status LED. The LED
+belongs to bt_daemon (it shows the speaker connection), so the codes are
+sent to the daemon ("blink 2,4" on its socket), which blinks each one
+three times and then shows the connection again. Blink codes:
+
+    1  column stuck HIGH
+    2  row/column short, or a key held down at boot
+    3  row-row or column-column short
+    4  missing audio clips
+    5  mixer does not play
+
+Run it by hand with `python3 self_test.py`.
+"""
+
+import os
+import socket
+import time
+
+import RPi.GPIO as GPIO
+
+from bt_status import SOCKET_PATH as BT_SOCKET
+import event_log
+
+SETTLE = 0.0001         # s after changing a pin before reading, plenty without key bounce
+PROBE_DURATION = 0.03   # s of tone played through the mixer
+
+STUCK_COLUMN = 1
+ROW_COLUMN_SHORT = 2
+LINE_SHORT = 3
+MISSING_CLIPS = 4
+MIXER_FAILED = 5
+
+
+def _high(pins):
+    return [p for p in pins if GPIO.input(p)]
+
+
+def check_matrix(row_pins, col_pins):
+    """Returns a list of (code, message). Expects rows as LOW outputs and
+    columns as pulled-down inputs (setup_gpio), and leaves them that way."""
+    faults = []
+    for r in row_pins:
+        GPIO.output(r, GPIO.LOW)
+    time.sleep(SETTLE)
+    stuck = _high(col_pins)
+    for c in stuck:
+        faults.append((STUCK_COLUMN, f"column {c} stuck HIGH"))
+
+    # Bulk scan: all rows HIGH at once, only look row by row if a column answers
+    for r in row_pins:
+        GPIO.output(r, GPIO.HIGH)
+    time.sleep(SETTLE)
+    answered = [c for c in _high(col_pins) if c not in stuck]
+    for r in row_pins:
+        GPIO.output(r, GPIO.LOW)
+    if answered:
+        for r in row_pins:
+            GPIO.output(r, GPIO.HIGH)
+            time.sleep(SETTLE)
+            for c in _high(answered):
+                faults.append((ROW_COLUMN_SHORT, f"row {r} / column {c} short or key held"))
+            GPIO.output(r, GPIO.LOW)
+
+    # Line to line: drive one line HIGH, the others of the same kind listen.
+    # The diodes block any path through a pressed key, so only a real short shows.
+    for r in row_pins:
+        GPIO.setup(r, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    for i, r in enumerate(row_pins):
+        GPIO.setup(r, GPIO.OUT, initial=GPIO.HIGH)
+        time.sleep(SETTLE)
+        for other in _high(row_pins[i + 1:]):
+            faults.append((LINE_SHORT, f"rows {r} and {other} shorted"))
+        GPIO.setup(r, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+
+    # Rows stay pulled-down inputs here: a column shorted to a row must not
+    # fight a LOW row output. Columns already found shorted to a row are left alone.
+    skipped = set(stuck) | set(answered)
+    listening = [c for c in col_pins if c not in skipped]
+    for i, c in enumerate(listening):
+        GPIO.setup(c, GPIO.OUT, initial=GPIO.HIGH)
+        time.sleep(SETTLE)
+        for other in _high(listening[i + 1:]):
+            faults.append((LINE_SHORT, f"columns {c} and {other} shorted"))
+        GPIO.setup(c, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    for r in row_pins:
+        GPIO.setup(r, GPIO.OUT, initial=GPIO.LOW)
+    return faults
+
+
+def check_clips(names, audio_dir, ext):
+    """Returns a list of (code, message) for clips of `names` missing from `audio_dir`."""
+    try:
+        present = set(os.listdir(audio_dir))
+    except OSError as e:
+        return [(MISSING_CLIPS, f"audio directory unreadable: {e}")]
+    missing = sorted(name for name in names if name + ext not in present)
+    if not missing:
+        return []
+    shown = ", ".join(missing[:5]) + (", ..." if len(missing) > 5 else "")
+    return [(MISSING_CLIPS, f"{len(missing)} clip(s) missing: {shown}")]
+
+
+def check_mixer(audio):
+    if not audio.available:
+        return [(MIXER_FAILED, "mixer not initialized")]
+    if not audio.probe(PROBE_DURATION):
+        return [(MIXER_FAILED, f"mixer does not play on {audio.output_name}")]
+    return []
+
+
+def blink_codes(codes, path=BT_SOCKET):
+    """Has bt_daemon blink the fault codes on its LED. False if the daemon is not there."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(0.5)
+            sock.connect(path)
+            sock.sendall(f"blink {','.join(str(c) for c in codes)}\n".encode())
+        return True
+    except OSError as e:
+        event_log.warning("status_led_unavailable", socket=path, error=e)
+        return False
+
+
+def run(row_pins, col_pins, audio, clip_names, audio_dir, ext):
+    """Runs every check, reports in the event log and on the LED. Returns the list of faults."""
+    start = time.perf_counter()
+    faults = check_matrix(row_pins, col_pins)
+    faults += check_clips(clip_names, audio_dir, ext)
+    faults += check_mixer(audio)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if faults:
+        codes = sorted({code for code, _ in faults})
+        event_log.error("self_test", result="FAILED", ms=elapsed, codes=",".join(str(c) for c in codes),
+                        faults="; ".join(msg for _, msg in faults))
+        blink_codes(codes)
+    else:
+        event_log.info("self_test", result="OK", ms=elapsed)
+    return faults
+
+
+if __name__ == "__main__":
+    import keyboard_game as game
+    try:
+        game.setup_gpio()
+        run(game.ROW_PINS, game.COL_PINS, game.audio, game.audio_manifest(),
+            game.AUDIO_DIR, game.EXPECTED_AUDIO_EXT)
+    finally:
+        game.audio.quit()
+        GPIO.cleanup()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Crash-safe session journal.
+
+Every game event (level change, question, key, outcome...) is appended to
+sessions/<date>.log as a small framed binary record:
+
+    crc32 (4) | body length (2) | event type (1) | timestamp (8) | body
+
+The body is the event fields joined with \\x1f. Records are buffered in memory
+and written + fsync'ed in batches to keep SD-card wear low. Every
+SNAPSHOT_EVERY events the replayed state is saved next to the log
+(<date>.snap, written atomically) together with the log offset it covers, so
+resuming after a power cut only has to replay the last few records.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+
+SESSION_DIR = "sessions/"
+SYNC_EVERY = 16         # fsync after this many buffered records...
+SYNC_INTERVAL = 5.0     # ...or when the oldest buffered record is this old (s)
+SNAPSHOT_EVERY = 64     # events between two snapshots
+
+HEADER = struct.Struct("<IHBd")
+FIELD_SEP = "\x1f"
+
+# Event types
+SESSION_START = 1
+SESSION_END = 2
+LEVEL_START = 3     # level
+LEVEL_END = 4       # level
+QUESTION = 5        # target letter, word ("" for level 1)
+KEY = 6             # key, latency in ms
+OUTCOME = 7         # "hit" / "timeout", target letter, word
+PROGRESS = 8        # "name=value" pairs (level 3 compteur, letter_pos...)
+WORDS = 9           # word list drawn at the start of a level
+
+EVENT_NAMES = {
+    SESSION_START: "session_start", SESSION_END: "session_end",
+    LEVEL_START: "level_start", LEVEL_END: "level_end",
+    QUESTION: "question", KEY: "key", OUTCOME: "outcome",
+    PROGRESS: "progress", WORDS: "words",
+}
+
+
+def new_state():
+    return {
+        "level": None,          # level in progress ('1', '2', '3') or None
+        "questions": 0,
+        "hits": 0,
+        "misses": 0,
+        "timeouts": 0,
+        "target": None,
+        "words": [],            # word list of the current level
+        "done": [],             # words already answered
+        "dropped": [],          # words that timed out
+        "progress": {},         # level specific counters
+        "finished": False,
+    }
+
+
+def apply(state, etype, fields):
+    """Replays one event on `state` (the same code runs live and on resume)."""
+    if etype == SESSION_END:
+        state["finished"] = True
+    elif etype == LEVEL_START:
+        state.update(level=fields[0], target=None, words=[], done=[], dropped=[], progress={})
+    elif etype == LEVEL_END:
+        state.update(level=None, target=None, words=[], done=[], dropped=[], progress={})
+    elif etype == QUESTION:
+        state["questions"] += 1
+        state["target"] = fields[0]
+    elif etype == KEY:
+        if fields[0] != state["target"] and fields[0] != '4':
+            state["misses"] += 1
+    elif etype == OUTCOME:
+        state["hits" if fields[0] == "hit" else "timeouts"] += 1
+        state["target"] = None
+        if len(fields) > 2 and fields[2]:
+            state["done" if fields[0] == "hit" else "dropped"].append(fields[2])
+    elif etype == PROGRESS:
+        for pair in fields:
+            name, _, value = pair.partition("=")
+            state["progress"][name] = int(value)
+    elif etype == WORDS:
+        state["words"] = list(fields)
+
+
+def encode(etype, timestamp, fields):
+    body = FIELD_SEP.join(str(f) for f in fields).encode("utf-8")
+    crc = zlib.crc32(body, zlib.crc32(struct.pack("<Bd", etype, timestamp)))
+    return HEADER.pack(crc, len(body), etype, timestamp) + body
+
+
+def read_records(f):
+    """Yields (offset_after, etype, timestamp, fields) until the end or a torn record."""
+    while True:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        crc, length, etype, timestamp = HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length:
+            return
+        if zlib.crc32(body, zlib.crc32(struct.pack("<Bd", etype, timestamp))) != crc:
+            return
+        fields = body.decode("utf-8").split(FIELD_SEP) if body else []
+        yield f.tell(), etype, timestamp, fields
+
+
+class SessionLog:
+    """Append-only journal of one play session."""
+
+    def __init__(self, path, state=None, offset=0):
+        self.path = path
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap"
+        self.state = state if state is not None else new_state()
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._offset = offset       # bytes of the log already written
+        self._pending = bytearray()
+        self._pending_count = 0
+        self._pending_since = None
+        self._since_snapshot = 0
+
+    @classmethod
+    def start(cls, directory=SESSION_DIR):
+        """Opens a brand new session log."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + ".log")
+        log = cls(path)
+        log.log(SESSION_START, sync=True)
+        return log
+
+    @classmethod
+    def resume(cls, directory=SESSION_DIR):
+        """Reopens the latest session if it was not closed properly.
+
+        Loads the snapshot, replays only the records written after it and
+        cuts off a half-written record left by a power loss.
+        Returns the SessionLog, or None if there is nothing to resume.
+        """
+        try:
+            logs = sorted(name for name in os.listdir(directory) if name.endswith(".log"))
+        except FileNotFoundError:
+            return None
+        if not logs:
+            return None
+        path = os.path.join(directory, logs[-1])
+
+        state, offset = new_state(), 0
+        try:
+            with open(os.path.splitext(path)[0] + ".snap") as f:
+                snap = json.load(f)
+            state, offset = snap["state"], snap["offset"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for offset, etype, _, fields in read_records(f):
+                apply(state, etype, fields)
+        if state["finished"]:
+            return None
+
+        os.truncate(path, offset)   # drop the torn tail, if any
+        return cls(path, state, offset)
+
+    def log(self, etype, *fields, sync=False):
+        """Records one event. Cheap: the disk is only touched in batches."""
+        apply(self.state, etype, fields)
+        now = time.time()
+        self._pending += encode(etype, now, fields)
+        self._pending_count += 1
+        if self._pending_since is None:
+            self._pending_since = now
+        self._since_snapshot += 1
+        if (sync or self._pending_count >= SYNC_EVERY
+                or now - self._pending_since >= SYNC_INTERVAL):
+            self.flush()
+        if self._since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot()
+
+    def flush(self):
+        """Writes the buffered records and fsyncs them."""
+        if not self._pending or self._fd is None:
+            return
+        os.write(self._fd, self._pending)
+        os.fsync(self._fd)
+        self._offset += len(self._pending)
+        self._pending.clear()
+        self._pending_count = 0
+        self._pending_since = None
+
+    def snapshot(self):
+        """Atomically saves the current state and the log offset it covers."""
+        self.flush()
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"offset": self._offset, "state": self.state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        self._since_snapshot = 0
+
+    def close(self):
+        """Ends the session: it will not be offered for resume any more."""
+        if self._fd is None:
+            return
+        self.log(SESSION_END, sync=True)
+        os.close(self._fd)
+        self._fd = None
+
+
+def dump(path):
+    """Prints a session log in readable form."""
+    with open(path, "rb") as f:
+        for _, etype, timestamp, fields in read_records(f):
+            stamp = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            print(stamp, EVENT_NAMES.get(etype, etype), *fields)
+
+
+if __name__ == "__main__":
+    import sys
+    for name in sys.argv[1:]:
+        dump(name)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Simulated RPi.GPIO: the functions the game uses, on any machine.
+
+Keys are pressed by code with press(row_pin, col_pin). A contact can
+bounce: for the first `bounce` seconds it opens and closes every
+BOUNCE_STEP. A column reads HIGH when one of its closed contacts sits on a
+row driven HIGH, exactly like the diode matrix, and add_event_detect()
+callbacks get every rising edge of a press, bounces included (from a
+thread of their own, as RPi.GPIO calls them from its own thread), and the
+edge of a row driven HIGH under a key already closed.
+
+install() makes `import RPi.GPIO` return this module, so keyboard_game runs
+unchanged on a laptop or a CI box (bench.py does that).
+"""
+
+import math
+import sys
+import threading
+import time
+
+BOARD, BCM = 10, 11
+OUT, IN = 0, 1
+LOW, HIGH = 0, 1
+PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+RISING, FALLING, BOTH = 31, 32, 33
+
+BOUNCE_STEP = 0.0003        # s between two bounces of a contact
+
+_mode = None
+_outputs = {}               # pin -> level
+_contacts = []              # [row_pin, col_pin, down, up, bounce] (perf_counter s)
+_callbacks = {}             # column pin -> callback(channel)
+_lock = threading.Lock()
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def getmode():
+    return _mode
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(pin, direction, pull_up_down=PUD_OFF, initial=LOW):
+    if direction == OUT:
+        output(pin, initial)
+    else:
+        _outputs.pop(pin, None) # an input drives nothing
+
+
+def output(pin, value):
+    # Raising a row under a key already closed is a rising edge on its column too
+    before = {c: input(c) for c in _callbacks}
+    _outputs[pin] = value
+    for c, level in before.items():
+        if not level and input(c):
+            _callbacks[c](c)
+
+
+def _closed(contact, now):
+    row_pin, col_pin, down, up, bounce = contact
+    if not down <= now < up:
+        return False
+    since = now - down
+    return since >= bounce or int(since / BOUNCE_STEP) % 2 == 0
+
+
+def input(pin):
+    now = time.perf_counter()
+    with _lock:
+        return int(any(c[1] == pin and _outputs.get(c[0]) and _closed(c, now) for c in _contacts))
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    _callbacks[pin] = callback
+
+
+def remove_event_detect(pin):
+    _callbacks.pop(pin, None)
+
+
+def cleanup(pins=None):
+    _outputs.clear()
+    _callbacks.clear()
+    with _lock:
+        _contacts.clear()
+
+
+def press(row_pin, col_pin, hold=0.08, bounce=0.0, delay=0.0):
+    """Presses the key at (row_pin, col_pin) in `delay` s for `hold` s.
+    Returns the perf_counter time the contact first closes."""
+    down = time.perf_counter() + delay
+    with _lock:
+        now = time.perf_counter()
+        _contacts[:] = [c for c in _contacts if c[3] > now]    # forget released keys
+        _contacts.append([row_pin, col_pin, down, down + hold, bounce])
+
+    # a bouncing contact closes again every 2 * BOUNCE_STEP: one more rising edge each time,
+    # and a last one at `bounce` if it was open just before
+    closures = [i * 2 * BOUNCE_STEP for i in range(math.ceil(bounce / (2 * BOUNCE_STEP)))] or [0.0]
+    if bounce > 0 and int(bounce / BOUNCE_STEP - 1e-9) % 2 == 1:
+        closures.append(bounce)
+
+    def edges():
+        for at in closures:
+            time.sleep(max(0.0, down + at - time.perf_counter()))
+            callback = _callbacks.get(col_pin)
+            if callback is not None and _outputs.get(row_pin):
+                callback(col_pin)
+    if delay > 0 or bounce > 0:
+        threading.Thread(target=edges, daemon=True).start()
+    else:
+        edges()
+    return down
+
+
+def install():
+    """Makes `import RPi.GPIO` return this module."""
+    import types
+    package = types.ModuleType("RPi")
+    package.GPIO = sys.modules[__name__]
+    sys.modules["RPi"] = package
+    sys.modules["RPi.GPIO"] = sys.modules[__name__]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Main-loop stall detector.
+
+The game thread calls beat() whenever it makes progress and idle() right
+before blocking on purpose (waiting for a key, for the speaker). A
+background thread checks every CHECK_INTERVAL seconds: if the game has
+been busy without a beat for more than STALL_THRESHOLD seconds it is
+stalled. The detector then:
+- writes the stacks of every thread (faulthandler) to logs/stall-<date>.txt,
+- logs where the game thread is stuck and the tracing span it is in,
+- dumps the flight recorder,
+and once the game beats again, logs and records how long the stall lasted.
+
+With CLAVIER_HW_WATCHDOG=/dev/watchdog the thread also feeds the hardware
+watchdog while the game is healthy, so a stall that never ends reboots the
+box instead of leaving it frozen.
+"""
+
+import faulthandler
+import os
+import sys
+import threading
+import time
+
+import event_log
+import flight_recorder
+import metrics
+import tracing
+
+STALL_THRESHOLD = float(os.environ.get("CLAVIER_STALL_THRESHOLD", "1.0"))
+CHECK_INTERVAL = 0.25
+HW_WATCHDOG = os.environ.get("CLAVIER_HW_WATCHDOG")    # e.g. /dev/watchdog, unset = no hardware watchdog
+STACK_DIR = "logs/"
+
+_stalls = metrics.counter("clavier_stalls_total", "Main loop stalls")
+_stall_seconds = metrics.histogram("clavier_stall_seconds", "Duration of main loop stalls",
+                                   buckets=(1.0, 2.0, 5.0, 10.0, 30.0, 60.0))
+
+
+class StallDetector:
+
+    def __init__(self, threshold=STALL_THRESHOLD, hw_watchdog=HW_WATCHDOG):
+        self.threshold = threshold
+        self.hw_watchdog = hw_watchdog
+        self._last_beat = time.monotonic()
+        self._idle = True               # nothing to watch until the game starts
+        self._stalled_since = None      # beat time before the current stall
+        self._main_ident = threading.main_thread().ident
+        self._hw_fd = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stall-detector", daemon=True)
+
+    # --- Game thread (a couple of attribute writes, no lock) ---
+
+    def beat(self):
+        self._last_beat = time.monotonic()
+        self._idle = False
+
+    def idle(self):
+        """The game is about to block on purpose: not a stall, however long."""
+        self._last_beat = time.monotonic()
+        self._idle = True
+
+    # --- Detector thread ---
+
+    def start(self):
+        faulthandler.enable()           # segfaults and fatal errors print every stack to stderr
+        if self.hw_watchdog:
+            try:
+                self._hw_fd = os.open(self.hw_watchdog, os.O_WRONLY)
+            except OSError as e:
+                event_log.warning("hw_watchdog_unavailable", device=self.hw_watchdog, error=e)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._hw_fd is not None:
+            try:
+                os.write(self._hw_fd, b"V")     # magic close: disarm on a clean exit
+            except OSError:
+                pass
+            os.close(self._hw_fd)
+            self._hw_fd = None
+
+    def _run(self):
+        while not self._stop.wait(CHECK_INTERVAL):
+            last_beat = self._last_beat
+            busy_for = time.monotonic() - last_beat
+            stalled = not self._idle and busy_for > self.threshold
+
+            if stalled and self._stalled_since is None:
+                self._stalled_since = last_beat
+                self._on_stall(busy_for)
+            elif not stalled and self._stalled_since is not None:
+                self._on_recover(last_beat - self._stalled_since)
+                self._stalled_since = None
+
+            if self._hw_fd is not None and not stalled:
+                try:
+                    os.write(self._hw_fd, b"\0")
+                except OSError:
+                    pass
+
+    def _on_stall(self, busy_for):
+        span = tracing.tracer.active or "-"
+        frame = sys._current_frames().get(self._main_ident)
+        where = f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}" if frame else "?"
+        path = None
+        try:
+            os.makedirs(STACK_DIR, exist_ok=True)
+            path = os.path.join(STACK_DIR, time.strftime("stall-%Y%m%d-%H%M%S.txt"))
+            with open(path, "w") as f:
+                f.write(f"Stall: no heartbeat for {busy_for:.2f} s, span {span}\n\n")
+                f.flush()
+                faulthandler.dump_traceback(file=f, all_threads=True)
+        except OSError as e:
+            event_log.error("stall_stacks_failed", error=e)
+            path = None
+        event_log.error("stall", seconds=busy_for, span=span, at=where, stacks=path)
+        flight_recorder.record(flight_recorder.STALL, span, int(busy_for * 1000))
+        try:
+            flight_recorder.recorder.dump("stall")
+        except OSError as e:
+            event_log.error("flight_dump_failed", error=e)
+
+    def _on_recover(self, duration):
+        _stalls.inc()
+        _stall_seconds.observe(duration)
+        event_log.warning("stall_end", seconds=duration)
+        flight_recorder.record(flight_recorder.STALL, "end", int(duration * 1000))
+
+
+detector = StallDetector()
+beat = detector.beat
+idle = detector.idle
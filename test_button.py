@@ -1,13 +1,12 @@
 import  keyboard_game
-from time import sleep
 
 keyboard_game.setup_gpio()
+keyboard_game.setup_key_events()
 print(keyboard_game.ROW_PINS)
 print(keyboard_game.COL_PINS)
 
 while True:
-	key = keyboard_game.scan_keys()
+	key = keyboard_game.wait_for_key()
 	if key is not None:
 		print(key)
-	sleep(0.02)
 
@@ -1,6 +1,13 @@
 import RPi.GPIO as GPIO
+import argparse
+import sys
 import time
-from keyboard_game import ROW_PINS, COL_PINS
+from keyboard_game import ROW_PINS, COL_PINS, KEY_MAP
+
+# Live monitor thresholds
+BOUNCE_WINDOW = 0.005    # a transition closer than this to the previous one is bounce
+STUCK_THRESHOLD = 2.0    # held longer than this (s) = stuck key or short
+CHATTER_RATIO = 0.2      # more than 1 bounce per 5 presses = worn switch
 
 
 def setup_gpio():
@@ -56,11 +63,156 @@ def test_matrix():
     print("1 = Button press detected (HIGH)")
     print("0 = No button press (LOW)")
 
+# ── Live monitor ─────────────────────────────────────────────────────────────
+class KeyStats:
+    """Edge history of one matrix position."""
+
+    __slots__ = ("state", "last_change", "high_since", "presses", "bounces", "max_high", "ghosts")
+
+    def __init__(self):
+        self.state = 0
+        self.last_change = 0.0
+        self.high_since = None
+        self.presses = 0
+        self.bounces = 0
+        self.max_high = 0.0
+        self.ghosts = 0
+
+    def update(self, value, now):
+        if value == self.state:
+            return
+        if now - self.last_change < BOUNCE_WINDOW:
+            self.bounces += 1
+        elif value:
+            self.presses += 1
+        if value:
+            self.high_since = now
+        elif self.high_since is not None:
+            self.max_high = max(self.max_high, now - self.high_since)
+            self.high_since = None
+        self.state = value
+        self.last_change = now
+
+    def held_for(self, now):
+        return now - self.high_since if self.high_since is not None else 0.0
+
+
+def sweep(settle=0.0):
+    """Reads the whole matrix once, as fast as the GPIO backend goes."""
+    rows = []
+    for r_pin in ROW_PINS:
+        GPIO.output(r_pin, GPIO.HIGH)
+        if settle:
+            time.sleep(settle)
+        rows.append([GPIO.input(c_pin) for c_pin in COL_PINS])
+        GPIO.output(r_pin, GPIO.LOW)
+    return rows
+
+
+def rectangles(high):
+    """(r1, c1, r2, c2) of every rectangle whose four corners read HIGH."""
+    return {(r1, c1, r2, c2) for r1, c1 in high for r2, c2 in high
+            if r2 > r1 and c2 > c1 and (r1, c2) in high and (r2, c1) in high}
+
+
+def count_ghosts(rows, stats, previous):
+    """Counts each rectangle of HIGH keys once, when it appears, on all four corners.
+
+    A key can only read HIGH because three others form a rectangle with it if a
+    diode is bad. One sweep cannot tell which corner is the phantom, so every
+    corner is a suspect. `previous` is the HIGH set of the last sweep; returns
+    this sweep's, to pass back next time.
+    """
+    high = {(r, c) for r, row in enumerate(rows) for c, v in enumerate(row) if v}
+    if high == previous or len(high) < 4:
+        return high
+    for r1, c1, r2, c2 in rectangles(high) - rectangles(previous):
+        for r, c in ((r1, c1), (r1, c2), (r2, c1), (r2, c2)):
+            stats[r][c].ghosts += 1
+    return high
+
+
+def draw(stats, now, rate):
+    """Heatmap of press counts, held keys in reverse video, stuck ones in red."""
+    out = ["\033[H\033[J", f"Matrix monitor - {rate:,.0f} scans/s - Ctrl+C for the summary\n\n"]
+    top = max(1, max(s.presses for row in stats for s in row))
+    for r, row in enumerate(stats):
+        for c, s in enumerate(row):
+            heat = 232 + int(23 * s.presses / top)     # grey ramp of the 256-colour palette
+            style = f"\033[48;5;{heat}m"
+            if s.held_for(now) > STUCK_THRESHOLD:
+                style += "\033[41m"
+            elif s.state:
+                style += "\033[7m"
+            out.append(f"{style} {KEY_MAP[r][c]}{s.presses:4}{'*' if s.bounces else ' '}\033[0m")
+        out.append("\n")
+    out.append("\n* = bounce seen\n")
+    sys.stdout.write("".join(out))
+    sys.stdout.flush()
+
+
+def summary(stats, now):
+    print("\nKey  presses  bounces  max held  ghosts  verdict")
+    bad = 0
+    for r, row in enumerate(stats):
+        for c, s in enumerate(row):
+            held = max(s.max_high, s.held_for(now))
+            problems = []
+            if held > STUCK_THRESHOLD:
+                problems.append("stuck/short")
+            if s.bounces > CHATTER_RATIO * max(s.presses, 1):
+                problems.append("chatter")
+            if s.ghosts:
+                problems.append("diode?")
+            bad += bool(problems)
+            print(f" {KEY_MAP[r][c]:3} {s.presses:8} {s.bounces:8} {held:8.2f}s {s.ghosts:7}  "
+                  f"{', '.join(problems) or 'ok'}")
+    print(f"\n{bad} suspicious position(s)")
+
+
+def monitor(fps=10, duration=None, settle=0.0):
+    """Scans continuously, redraws the heatmap `fps` times a second."""
+    stats = [[KeyStats() for _ in COL_PINS] for _ in ROW_PINS]
+    start = last_frame = time.perf_counter()
+    scans = frame_scans = 0
+    high = set()
+    try:
+        while duration is None or time.perf_counter() - start < duration:
+            rows = sweep(settle)
+            now = time.perf_counter()
+            for r, row in enumerate(rows):
+                for c, value in enumerate(row):
+                    stats[r][c].update(value, now)
+            high = count_ghosts(rows, stats, high)
+            scans += 1
+            frame_scans += 1
+            if now - last_frame >= 1 / fps:
+                draw(stats, now, frame_scans / (now - last_frame))
+                last_frame = now
+                frame_scans = 0
+    except KeyboardInterrupt:
+        pass
+    now = time.perf_counter()
+    print(f"\n{scans} scans in {now - start:.1f} s ({scans / (now - start):,.0f} scans/s)")
+    summary(stats, now)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Keyboard matrix test")
+    parser.add_argument("--live", action="store_true", help="continuous scan with live heatmap and summary")
+    parser.add_argument("--fps", type=float, default=10, help="heatmap refresh rate")
+    parser.add_argument("--duration", type=float, help="stop the live monitor after N seconds")
+    parser.add_argument("--settle", type=float, default=0.0, help="delay after driving a row (s)")
+    args = parser.parse_args()
+
     try:
         setup_gpio()
         print("Matrix Test Program")
         print("Press Ctrl+C to exit")
+
+        if args.live:
+            monitor(args.fps, args.duration, args.settle)
+            return
         
         while True:
             test_matrix()
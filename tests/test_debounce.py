@@ -0,0 +1,70 @@
+from debounce import (AdaptiveDebounce, BUCKET, DEBOUNCE_MAX, DEBOUNCE_MIN, HISTORY, MIN_SAMPLES,
+                      RETUNE_EVERY, SAFETY_MARGIN)
+
+
+def test_no_retune_below_min_samples():
+    debounce = AdaptiveDebounce(["a"])
+    for _ in range(MIN_SAMPLES - 1):
+        debounce.record("a", 0.003)
+    debounce.retune()
+    assert debounce.window("a") == DEBOUNCE_MAX
+
+
+def test_window_is_p99_times_margin():
+    debounce = AdaptiveDebounce(["a"])
+    for i in range(100):
+        debounce.record("a", 0.0035 if i else 0.0095)   # one outlier is below p99
+    debounce.retune()
+    assert abs(debounce.window("a") - 4 * BUCKET * SAFETY_MARGIN) < 1e-9
+
+
+def test_window_is_clamped():
+    debounce = AdaptiveDebounce(["a"])
+    for _ in range(MIN_SAMPLES):
+        debounce.record("a", 0.0)
+    debounce.retune()
+    assert debounce.window("a") == DEBOUNCE_MIN
+
+
+def test_record_reports_retunes():
+    debounce = AdaptiveDebounce(["a", "b"])
+    results = [debounce.record("ab"[i % 2], 0.003) for i in range(RETUNE_EVERY)]
+    assert results[-1] and not any(results[:-1])
+    assert not debounce.record("unknown", 0.003)
+
+
+def test_history_decays():
+    debounce = AdaptiveDebounce(["a"])
+    for _ in range(HISTORY * 3):
+        debounce.record("a", 0.003)
+    assert sum(debounce.hists["a"]) < HISTORY
+
+
+def test_worn_switch_widens_again():
+    debounce = AdaptiveDebounce(["a"])
+    for _ in range(100):
+        debounce.record("a", 0.003)
+    debounce.retune()
+    short = debounce.window("a")
+    # Settle times as long as the window: only a lower bound, the window must not shrink on them
+    for _ in range(5):
+        debounce.record("a", short)
+    assert debounce.capped["a"] == 5
+    debounce.retune()
+    assert debounce.window("a") == DEBOUNCE_MAX
+    for _ in range(MIN_SAMPLES):
+        debounce.record("a", 0.011)
+    debounce.retune()
+    assert debounce.window("a") > short
+
+
+def test_config_round_trip():
+    debounce = AdaptiveDebounce(["a", "b"])
+    for _ in range(50):
+        debounce.record("a", 0.004)
+    debounce.record("b", 0.2)
+    debounce.retune()
+    again = AdaptiveDebounce(["a", "b"], debounce.to_config({}))
+    assert again.windows == debounce.windows
+    assert again.hists == debounce.hists
+    assert again.capped == debounce.capped
@@ -0,0 +1,57 @@
+import math
+import random
+
+from latency import HdrHistogram, MAX_VALUE_US, _highest, _index
+
+
+def test_small_values_are_exact():
+    hist = HdrHistogram()
+    for value in range(1, 101):
+        hist.record(value)
+    assert hist.percentile(50) == 50
+    assert hist.percentile(99) == 99
+    assert hist.percentile(100) == 100
+    assert hist.summary() == {"count": 100, "max": 100, "p50": 50, "p95": 95, "p99": 99}
+
+
+def test_relative_error_under_one_percent():
+    rng = random.Random(4)
+    values = sorted(rng.randint(1, 5_000_000) for _ in range(10000))
+    hist = HdrHistogram()
+    for value in values:
+        hist.record(value)
+    for p in (50, 90, 99, 99.9):
+        exact = values[math.ceil(len(values) * p / 100) - 1]
+        assert abs(hist.percentile(p) - exact) <= exact * 0.01
+
+
+def test_bucket_bounds():
+    for value in (0, 1, 127, 128, 129, 1000, 65535, 1 << 20, MAX_VALUE_US):
+        assert value <= _highest(_index(value))
+        assert _index(_highest(_index(value))) == _index(value)
+
+
+def test_percentile_never_above_max_and_clamps():
+    hist = HdrHistogram()
+    assert hist.percentile(99) == 0
+    hist.record(1001)
+    assert hist.percentile(50) == 1001      # not the top of its bucket
+    hist.record(-5)
+    hist.record(MAX_VALUE_US * 10)
+    assert hist.count == 3
+    assert hist.max == MAX_VALUE_US
+
+
+def test_json_round_trip():
+    hist = HdrHistogram()
+    for value in (10, 2000, 2000, 300_000):
+        hist.record(value)
+    copy = HdrHistogram.from_json(hist.to_json())
+    assert copy.summary() == hist.summary()
+
+
+def test_loads_dumps_of_the_old_layout():
+    old = {"count": 2, "max": 300_000, "buckets": {str(_index(v, 7)): 1 for v in (10, 300_000)}}
+    hist = HdrHistogram.from_json(old)
+    assert hist.percentile(50) == 10
+    assert abs(hist.percentile(100) - 300_000) <= 300_000 * 0.02
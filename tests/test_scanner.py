@@ -0,0 +1,54 @@
+import pytest
+
+from scanner import CAPACITY, KeyRing, _MASK
+
+
+@pytest.fixture
+def ring():
+    ring = KeyRing(4)
+    yield ring
+    shm = ring.shm
+    ring.close()
+    shm.unlink()
+
+
+def test_events_come_out_in_order(ring):
+    assert ring.pop() is None
+    for i in range(3):
+        assert ring.push(i, 1000 + i, 10 * i)
+    assert [ring.pop() for _ in range(4)] == [(0, 1000, 0), (1, 1001, 10), (2, 1002, 20), None]
+
+
+def test_full_ring_drops_and_counts(ring):
+    for i in range(CAPACITY):
+        assert ring.push(i % 4, i, 0)
+    assert not ring.push(0, -1, 0)
+    assert not ring.push(0, -2, 0)
+    assert ring.stats()["dropped"] == 2
+    assert ring.pop() == (0, 0, 0)
+    assert ring.push(1, 99, 0)              # room again
+    events = [ring.pop() for _ in range(CAPACITY)]
+    assert events[-1] == (1, 99, 0)
+    assert ring.pop() is None
+
+
+def test_counters_wrap_around(ring):
+    start = _MASK - 2                       # head and tail overflow 32 bits halfway
+    ring._set(0, start)
+    ring._set(1, start)
+    for i in range(CAPACITY):
+        assert ring.push(i % 4, i, i)
+    assert not ring.push(0, 0, 0)           # still full across the wrap
+    assert ring._get(0) == (start + CAPACITY) & _MASK
+    assert [ring.pop()[1] for _ in range(CAPACITY)] == list(range(CAPACITY))
+    assert ring.pop() is None
+    assert ring.stats()["dropped"] == 1
+
+
+def test_windows_and_scan_stats(ring):
+    ring.set_window(2, 0.004)
+    assert ring.window(2) == pytest.approx(0.004)
+    ring.count_scan(120, late=False)
+    ring.count_scan(3500, late=True)
+    ring.count_scan(800, late=True)
+    assert ring.stats() == {"scans": 3, "late_scans": 2, "late_max_ms": 3.5, "dropped": 0}
@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+
+from scheduler import BOX_WEIGHTS, FenwickTree, LeitnerScheduler, box_for
+from progress_store import ItemStats
+
+
+def test_fenwick_total_and_find():
+    weights = [3, 0, 5, 1, 0, 2]
+    tree = FenwickTree(len(weights))
+    for i, w in enumerate(weights):
+        tree.add(i, w)
+    assert tree.total() == sum(weights)
+    # Every value in [0, total) lands on the index whose weight covers it
+    expected = [i for i, w in enumerate(weights) for _ in range(w)]
+    assert [tree.find(v) for v in range(sum(weights))] == expected
+
+
+def test_pick_follows_box_weights():
+    items = ["a", "b", "c"]
+    deck = LeitnerScheduler(items, {"a": 0, "b": 2, "c": 4}, rng=random.Random(1))
+    counts = Counter(deck.pick() for _ in range(21000))
+    total = BOX_WEIGHTS[0] + BOX_WEIGHTS[2] + BOX_WEIGHTS[4]
+    for item, box in (("a", 0), ("b", 2), ("c", 4)):
+        assert abs(counts[item] / 21000 - BOX_WEIGHTS[box] / total) < 0.02
+
+
+def test_update_moves_between_boxes():
+    deck = LeitnerScheduler(["a", "b"])
+    deck.update("a", hit=True)
+    deck.update("a", hit=True)
+    assert deck.boxes[0] == 2 and deck.weights[0] == BOX_WEIGHTS[2]
+    for _ in range(10):
+        deck.update("a", hit=True)
+    assert deck.boxes[0] == len(BOX_WEIGHTS) - 1
+    deck.update("a", hit=False)
+    assert deck.boxes[0] == 0
+    assert deck.tree.total() == 2 * BOX_WEIGHTS[0]
+
+
+def test_removed_item_is_never_drawn_again():
+    deck = LeitnerScheduler(["a", "b", "c"], rng=random.Random(2))
+    deck.remove("b")
+    deck.remove("b")                        # twice: counted once
+    assert deck.remaining == 2
+    deck.update("b", hit=False)             # a removed item stays removed
+    assert "b" not in {deck.pick() for _ in range(500)}
+    deck.remove("a")
+    deck.remove("c")
+    assert deck.remaining == 0
+    assert deck.pick() is None
+
+
+def test_pick_rarely_repeats_the_previous_item():
+    deck = LeitnerScheduler(["a", "b"], rng=random.Random(3))
+    repeats = sum(deck.pick(avoid="a") == "a" for _ in range(4000))
+    assert repeats < 4000 * 0.2             # 1/8 after the retries, instead of 1/2
+    deck.remove("b")
+    assert deck.pick(avoid="a") == "a"      # the only item left still comes
+
+
+def test_box_for():
+    assert box_for(None) == 0
+    assert box_for(ItemStats()) == 0
+    assert box_for(ItemStats(attempts=4, hits=4)) == len(BOX_WEIGHTS) - 1
+    assert box_for(ItemStats(attempts=4, hits=2)) == 2
@@ -0,0 +1,65 @@
+import os
+
+import session_log
+from session_log import SessionLog
+
+
+def write_session(directory):
+    log = SessionLog.start(str(directory))
+    log.log(session_log.LEVEL_START, "2", sync=True)
+    log.log(session_log.QUESTION, "C", "chat")
+    log.log(session_log.KEY, "B", 800)
+    log.log(session_log.OUTCOME, "hit", "C", "chat", sync=True)
+    log.log(session_log.QUESTION, "L", "lion", sync=True)
+    return log
+
+
+def test_resume_replays_the_journal(tmp_path):
+    write_session(tmp_path)
+    log = SessionLog.resume(str(tmp_path))
+    state = log.state
+    assert state["level"] == "2"
+    assert state["questions"] == 2 and state["hits"] == 1 and state["misses"] == 1
+    assert state["done"] == ["chat"] and state["target"] == "L"
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    log = write_session(tmp_path)
+    good_size = os.path.getsize(log.path)
+    # Power cut in the middle of the next record
+    record = session_log.encode(session_log.OUTCOME, 0.0, ["hit", "L", "lion"])
+    with open(log.path, "ab") as f:
+        f.write(record[:len(record) - 3])
+
+    resumed = SessionLog.resume(str(tmp_path))
+    assert resumed.state["hits"] == 1 and resumed.state["target"] == "L"
+    assert os.path.getsize(log.path) == good_size
+
+    # The journal goes on after the cut, and replays cleanly
+    resumed.log(session_log.OUTCOME, "timeout", "L", "lion", sync=True)
+    again = SessionLog.resume(str(tmp_path))
+    assert again.state["dropped"] == ["lion"] and again.state["timeouts"] == 1
+
+
+def test_corrupt_record_stops_the_replay(tmp_path):
+    log = write_session(tmp_path)
+    with open(log.path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)             # last byte of the last question
+        f.write(b"X")
+    state = SessionLog.resume(str(tmp_path)).state
+    assert state["questions"] == 1 and state["target"] is None
+
+
+def test_resume_from_snapshot(tmp_path):
+    log = write_session(tmp_path)
+    log.snapshot()
+    log.log(session_log.KEY, "L", 500, sync=True)
+    with open(log.path, "ab") as f:
+        f.write(b"\x00\x01")                # torn header
+    state = SessionLog.resume(str(tmp_path)).state
+    assert state["questions"] == 2 and state["target"] == "L"
+
+
+def test_closed_session_is_not_resumed(tmp_path):
+    write_session(tmp_path).close()
+    assert SessionLog.resume(str(tmp_path)) is None
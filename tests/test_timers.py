@@ -0,0 +1,104 @@
+from timers import TimerService
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_service():
+    clock = FakeClock()
+    return TimerService(clock=clock), clock
+
+
+def test_fires_in_deadline_order():
+    timers, clock = make_service()
+    fired = []
+    for delay in (3, 1, 2, 1):
+        timers.schedule(delay, fired.append, delay)
+    clock.now = 1.5
+    assert timers.run_due() == 2
+    assert fired == [1, 1]
+    clock.now = 10
+    timers.run_due()
+    assert fired == [1, 1, 2, 3]
+
+
+def test_time_until_next():
+    timers, clock = make_service()
+    assert timers.time_until_next() is None
+    timers.schedule(5)
+    timers.schedule(2)
+    assert timers.time_until_next() == 2
+    clock.now = 3
+    assert timers.time_until_next() == 0
+
+
+def test_cancelled_timer_never_fires():
+    timers, clock = make_service()
+    fired = []
+    first = timers.schedule(1, fired.append, "first")
+    timers.schedule(2, fired.append, "second")
+    first.cancel()
+    assert timers.time_until_next() == 2    # the stale entry is skipped
+    clock.now = 5
+    timers.run_due()
+    assert fired == ["second"]
+    assert not first.active
+
+
+def test_restart_pushes_the_deadline_back():
+    timers, clock = make_service()
+    fired = []
+    timer = timers.schedule(1, fired.append, "x")
+    clock.now = 0.5
+    timer.restart(1)
+    clock.now = 1.2
+    assert timers.run_due() == 0            # the old heap entry is stale
+    clock.now = 1.6
+    assert timers.run_due() == 1
+    assert fired == ["x"] and timer.fired
+
+
+def test_restart_revives_a_cancelled_timer():
+    timers, clock = make_service()
+    timer = timers.schedule(1)
+    timer.cancel()
+    timer.restart(2)
+    assert timer.active
+    clock.now = 2
+    assert timers.run_due() == 1
+
+
+def test_interval_repeats_until_cancelled():
+    timers, clock = make_service()
+    fired = []
+    timer = timers.schedule(1, fired.append, "tick", interval=1)
+    for now in (1, 2, 3):
+        clock.now = now
+        timers.run_due()
+    timer.cancel()
+    clock.now = 4
+    timers.run_due()
+    assert fired == ["tick"] * 3
+
+
+def test_shift_keeps_order_and_clear_drops_everything():
+    timers, clock = make_service()
+    fired = []
+    timers.schedule(1, fired.append, 1)
+    timers.schedule(2, fired.append, 2)
+    timers.shift(10)
+    clock.now = 10.5
+    assert timers.run_due() == 0
+    clock.now = 11
+    timers.run_due()
+    assert fired == [1]
+    timers.clear()
+    clock.now = 100
+    assert timers.run_due() == 0
+    assert timers.next_deadline() is None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Deadline scheduler for the keyboard game.
+
+All timeouts (question timeout, inactivity, reminder prompts) live in a single
+heap, so the main loop only has to ask "how long until the next deadline?" and
+sleep exactly that long instead of waking up every 20 ms to compare times.
+"""
+
+import heapq
+import itertools
+import time
+
+
+class Timer:
+    """Handle returned by TimerService.schedule()."""
+
+    __slots__ = ("deadline", "interval", "callback", "args", "fired", "cancelled", "_service", "_entry")
+
+    def __init__(self, service, deadline, interval, callback, args):
+        self._service = service
+        self._entry = None            # sequence number of the live heap entry
+        self.deadline = deadline
+        self.interval = interval      # None = one-shot, else repeat period
+        self.callback = callback
+        self.args = args
+        self.fired = False            # True once the deadline has passed
+        self.cancelled = False
+
+    def cancel(self):
+        self._service.cancel(self)
+
+    def restart(self, delay=None):
+        """Pushes the deadline back (e.g. the child just pressed a key)."""
+        self._service.restart(self, delay)
+
+    @property
+    def active(self):
+        return not self.cancelled and (not self.fired or self.interval is not None)
+
+
+class TimerService:
+    """Min-heap of deadlines with lazy cancellation."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()   # tie-breaker, Timer objects are not comparable
+
+    def schedule(self, delay, callback=None, *args, interval=None):
+        """Fires callback(*args) after `delay` seconds (then every `interval` if given)."""
+        timer = Timer(self, self.clock() + delay, interval, callback, args)
+        self._push(timer)
+        return timer
+
+    def _push(self, timer):
+        timer._entry = next(self._seq)
+        heapq.heappush(self._heap, (timer.deadline, timer._entry, timer))
+
+    def cancel(self, timer):
+        # The heap entry stays behind and is dropped when it reaches the top
+        timer.cancelled = True
+
+    def restart(self, timer, delay=None):
+        if delay is None:
+            delay = timer.interval if timer.interval is not None else 0
+        # The old heap entry goes stale because its sequence number no longer matches
+        timer.deadline = self.clock() + delay
+        timer.fired = False
+        timer.cancelled = False
+        self._push(timer)
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap:
+            _, entry, timer = heap[0]
+            if timer.cancelled or timer._entry != entry:
+                heapq.heappop(heap)
+            else:
+                break
+
+    def next_deadline(self):
+        """Absolute time of the earliest live deadline, or None."""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def time_until_next(self):
+        """Seconds until the earliest deadline (0 if overdue), or None if nothing is scheduled."""
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def run_due(self):
+        """Fires every timer whose deadline has passed. Returns how many fired."""
+        now = self.clock()
+        count = 0
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return count
+            _, _, timer = heapq.heappop(self._heap)
+            timer.fired = True
+            count += 1
+            if timer.interval is not None:
+                timer.deadline = now + timer.interval
+                self._push(timer)
+            if timer.callback is not None:
+                timer.callback(*timer.args)
+
+    def shift(self, delta):
+        """Pushes every pending deadline back by `delta` seconds (game paused)."""
+        # Adding the same delta everywhere keeps the heap ordered
+        self._heap = [(deadline + delta, entry, timer) for deadline, entry, timer in self._heap]
+        for deadline, entry, timer in self._heap:
+            if timer._entry == entry:
+                timer.deadline = deadline
+
+    def clear(self):
+        for _, _, timer in self._heap:
+            timer.cancelled = True
+        self._heap.clear()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Low-overhead tracing of the game: where does the time go between a key
+press and the first sound?
+
+Spans (name, start, end in perf_counter nanoseconds, thread, optional
+argument) are written into a ring buffer allocated once at startup, so
+tracing allocates almost nothing while the game runs and only keeps the
+last CAPACITY spans. export_chrome() writes them as Chrome trace JSON, to
+open in chrome://tracing or https://ui.perfetto.dev.
+
+    with tracing.span("decode", filepath):
+        ...
+    tracing.instant("timeout", word)
+
+    @tracing.traced("scan")
+    def scan_keys(): ...
+
+Spans longer than SLOW_SPAN_MS are also handed to `tracer.on_slow` (the
+game copies its slow work spans to the flight recorder).
+
+Set CLAVIER_TRACE=0 to turn it off: span() then returns a shared no-op
+context manager and costs a single attribute test.
+"""
+
+from array import array
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+CAPACITY = 8192
+ENABLED = os.environ.get("CLAVIER_TRACE", "1") != "0"
+TRACE_DIR = "traces/"
+SLOW_SPAN_MS = float(os.environ.get("CLAVIER_SLOW_SPAN_MS", "20"))
+
+_now = time.perf_counter_ns
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "arg", "start", "outer")
+
+    def __init__(self, tracer, name, arg):
+        self.tracer = tracer
+        self.name = name
+        self.arg = arg
+
+    def __enter__(self):
+        self.outer = self.tracer.active
+        self.tracer.active = self.name
+        self.start = _now()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.end(self.name, self.start, self.arg)
+        self.tracer.active = self.outer
+        return False
+
+
+class Tracer:
+
+    def __init__(self, capacity=CAPACITY, enabled=ENABLED):
+        self.capacity = capacity
+        self.enabled = enabled
+        self._starts = array("q", bytes(8 * capacity))
+        self._ends = array("q", bytes(8 * capacity))     # == start for instant events
+        self._tids = array("Q", bytes(8 * capacity))
+        self._names = [None] * capacity
+        self._args = [None] * capacity
+        self._counter = itertools.count()                # next() is atomic under the GIL
+        self._written = 0
+        self.active = None      # innermost open span (for the stall detector), None when off
+        self.slow_ns = int(SLOW_SPAN_MS * 1_000_000)
+        self.on_slow = None     # called with (name, duration ns, arg) for spans over slow_ns
+
+    def span(self, name, arg=None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, arg)
+
+    def traced(self, name):
+        """Decorator: one span per call, with the first argument as span argument.
+        Returns the function untouched when tracing is off."""
+        def decorate(func):
+            if not self.enabled:
+                return func
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                outer, self.active = self.active, name
+                start = _now()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.end(name, start, args[0] if args else None)
+                    self.active = outer
+            return wrapper
+        return decorate
+
+    def instant(self, name, arg=None):
+        if self.enabled:
+            now = _now()
+            self.record(name, now, now, arg)
+
+    def end(self, name, start, arg=None):
+        """Records a span that ends now."""
+        end = _now()
+        self.record(name, start, end, arg)
+        if end - start > self.slow_ns and self.on_slow is not None:
+            self.on_slow(name, end - start, arg)
+
+    def record(self, name, start, end, arg=None):
+        i = next(self._counter)
+        slot = i % self.capacity
+        self._starts[slot] = start
+        self._ends[slot] = end
+        self._tids[slot] = threading.get_ident()
+        self._names[slot] = name
+        self._args[slot] = arg
+        self._written = i + 1
+
+    def events(self):
+        """The spans still in the ring, oldest first, as (name, start, end, tid, arg)."""
+        first = max(0, self._written - self.capacity)
+        out = []
+        for i in range(first, self._written):
+            slot = i % self.capacity
+            out.append((self._names[slot], self._starts[slot], self._ends[slot],
+                        self._tids[slot], self._args[slot]))
+        return out
+
+    def export_chrome(self, path=None):
+        """Writes the ring as Chrome trace JSON and returns the path."""
+        if path is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            path = os.path.join(TRACE_DIR, time.strftime("trace-%Y%m%d-%H%M%S.json"))
+        pid = os.getpid()
+        trace = []
+        for name, start, end, tid, arg in self.events():
+            event = {"name": name, "pid": pid, "tid": tid, "ts": start / 1000}
+            if end == start:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=(end - start) / 1000)
+            if arg is not None:
+                event["args"] = {"arg": str(arg)}
+            trace.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ns"}, f)
+        return path
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+instant = tracer.instant